@@ -0,0 +1,67 @@
+'''
+Decisões por segundo em função do tamanho do lote do Batcher.
+
+Sobe um cluster no próprio processo (bridge, 1 proposer, 3 acceptors, 1 learner, cada nó em
+uma thread), submete N valores pelo Batcher e mede o tempo até o learner aplicar todos.
+
+Uso: python -m benchmarks.bench_batching [n_valores] [linger_em_segundos]
+'''
+from threading import Thread
+import time
+import sys
+import os
+
+from src import Acceptor, Batcher, Bridge, Learner, Proposer
+
+
+def wait_for(condition, timeout:float=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("cluster did not reach the expected state")
+        time.sleep(0.001)
+
+
+def run(max_batch:int, n:int, linger:float) -> tuple[float, int]:
+    bridge    = Bridge()
+    proposer  = Proposer(bridge.port)
+    acceptors = [Acceptor(bridge.port) for _ in range(3)]
+    learner   = Learner(bridge.port)
+    wait_for(lambda: len(bridge._acceptors) == 3 and len(bridge._learners) == 1 and len(bridge._proposers) == 1)
+
+    for node in acceptors + [learner, proposer]:
+        Thread(target=node.run, daemon=True).start()
+    wait_for(lambda: proposer.leader and learner.quorum_size is not None)
+
+    batcher = Batcher(proposer, max_batch=max_batch, linger=linger)
+    start = time.perf_counter()
+    for i in range(n):
+        batcher.submit(f"value{i}")
+    batcher.flush()
+    wait_for(lambda: len(learner.log) >= n, timeout=120)
+    elapsed = time.perf_counter() - start
+
+    bridge.close()
+    return n / elapsed, learner.next_apply
+
+
+def main():
+    n      = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    linger = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+
+    # Os nós imprimem cada mensagem; só os resultados vão para a saída real
+    out, sys.stdout = sys.stdout, open(os.devnull, "w")
+
+    print(f"{n} values, linger {linger * 1000:.1f} ms", file=out)
+    print(f"{'batch':>6} {'decisions/s':>12} {'slots':>6}", file=out)
+    for max_batch in (1, 8, 32, 128):
+        rate, slots = run(max_batch, n, linger)
+        print(f"{max_batch:>6} {rate:>12,.0f} {slots:>6}", file=out)
+
+    # Os nós continuam rodando em threads daemon; encerra sem esperar por elas
+    out.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+'''
+Mensagens roteadas por segundo em função do número de bridges de um BridgeCluster.
+
+Processos geradores fazem o papel de acceptors e enviam "sad" (aceites) com slots diferentes,
+escolhendo o bridge de cada mensagem pelo ShardMap (shard_by="slot"). Um processo receptor se
+registra como learner e conta as mensagens entregues. Como cada bridge roda em um processo, a
+vazão agregada deve crescer com o número de bridges enquanto houver núcleos livres.
+
+Uso: python -m benchmarks.bench_bridges [mensagens_por_gerador] [geradores]
+'''
+from multiprocessing import Process, Value, Pipe
+import socket
+import time
+import sys
+import os
+
+from src import BridgeCluster, ShardMap
+from src.connection import ConnectionPool, serve
+from src.id_proposta import IdProposta
+
+
+def sink(ports:list[int], received, conn):
+    '''
+    Recebe as notificações roteadas pelos bridges e conta quantas chegaram
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("localhost", 0))
+    sock.listen()
+    port = sock.getsockname()[1]
+
+    def count(peer, data):
+        with received.get_lock():
+            received.value += 1
+
+    pool = ConnectionPool(port)
+    pool.send(ShardMap(ports).home(port), "spp", "LEARNER", port)
+    conn.send(port)
+    serve(sock, count)
+
+
+def generator(ports:list[int], sink_port:int, n:int, offset:int):
+    shards = ShardMap(ports, shard_by="slot", slot_range=1)
+    pool   = ConnectionPool(queue_size=65536)
+    ballot = IdProposta(1, sink_port)
+    for slot in range(offset, offset + n):
+        pool.send(shards.select(sink_port, slot), "sad", ballot, slot, "value")
+    time.sleep(60)
+
+
+def run(n_bridges:int, n:int, generators:int) -> float:
+    cluster  = BridgeCluster(n_bridges)
+    received = Value("q", 0)
+    parent, child = Pipe()
+    receiver = Process(target=sink, args=(cluster.ports, received, child), daemon=True)
+    receiver.start()
+    sink_port = parent.recv()
+    time.sleep(0.5)  # registro replicado para todos os bridges
+
+    # Cada aceite é entregue ao learner e ao proposer dono da proposta (aqui, o mesmo receptor)
+    expected = 2 * n * generators
+    start = time.perf_counter()
+    procs = [Process(target=generator, args=(cluster.ports, sink_port, n, g * n), daemon=True) for g in range(generators)]
+    for p in procs:
+        p.start()
+    deadline = time.monotonic() + 120
+    while received.value < expected and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    for p in procs + [receiver]:
+        p.terminate()
+    cluster.close()
+    return received.value / 2 / elapsed
+
+
+def main():
+    n          = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    generators = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    # Os bridges imprimem cada mensagem; só os resultados vão para a saída real
+    out = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    print(f"{generators} generators x {n} messages, {os.cpu_count()} CPUs", file=out)
+    print(f"{'bridges':>7} {'routed msgs/s':>14}", file=out)
+    for n_bridges in (1, 2, 4):
+        rate = run(n_bridges, n, generators)
+        print(f"{n_bridges:>7} {rate:>14,.0f}", file=out, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+'''
+Valores por segundo e latência de um único Client com muitos valores em andamento.
+
+Sobe um Cluster no próprio processo (bridge, proposers, 3 acceptors e 1 learner, cada nó em uma
+thread), submete N valores de uma vez pelo Client e mede o tempo até todos os futures serem
+resolvidos e o learner aplicar todos. Com --resend, todos os valores são enviados três vezes ao
+líder, como em reenvios depois de um timeout, e o learner precisa aplicar cada um uma vez só.
+
+Uso: python -m benchmarks.bench_client [n_valores] [proposers] [--resend]
+'''
+import time
+import sys
+
+from src import Client, Cluster
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n         = int(args[0]) if len(args) > 0 else 10000
+    proposers = int(args[1]) if len(args) > 1 else 1
+    resend    = "--resend" in sys.argv
+
+    cluster = Cluster(acceptors=3, proposers=proposers, learners=1, processes=0).start()
+    learner = next(node for (_, role), node in zip(cluster.specs, cluster.nodes) if role == "learner")
+    client  = Client(cluster.route, timeout=5.0)
+    try:
+        start = time.perf_counter()
+        futures = client.submit_many([f"v{i}" for i in range(n)])
+        if resend:
+            with client._lock:
+                client._send(list(client._requests))
+                client._send(list(client._requests))
+        slots = [future.result(60) for future in futures]
+        chosen = time.perf_counter() - start
+        deadline = time.monotonic() + 10
+        while len(learner.log) < n and time.monotonic() < deadline:
+            time.sleep(0.001)
+        applied = time.perf_counter() - start
+
+        latency = client._latency
+        print(f"{n} values in flight, {proposers} proposer(s){' (resend x3)' if resend else ''}: "
+              f"{n / chosen:,.0f} values/s chosen, {n / applied:,.0f} values/s applied, {len(set(slots))} slots")
+        print(f"submit to chosen p50 {latency.quantile(.5) * 1000:.1f} ms, p99 {latency.quantile(.99) * 1000:.1f} ms, "
+              f"{client._resent.value} resent, {client._redirect.value} redirects")
+        if len(learner.log) != n or sorted(learner.log) != sorted(f"v{i}" for i in range(n)):
+            print(f"learner applied {len(learner.log)} values, expected each of the {n} exactly once")
+            sys.exit(1)
+    finally:
+        client.close()
+        cluster.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+'''
+Micro-benchmark do codec: compara mensagens/s do parser antigo (recv de 1 byte + split em ';')
+com o FrameReader (frames com prefixo de tamanho lidos com recv_into).
+
+Uso: python -m benchmarks.bench_codec [n_mensagens] [tamanho_do_valor]
+'''
+from threading import Thread
+import socket
+import time
+import sys
+
+from src.codec import FrameReader, encode
+from src.id_proposta import IdProposta
+
+
+def legacy_encode(reqtype:str, *args) -> bytes:
+    return (";".join((reqtype,) + tuple(map(str, args))) + "!").encode()
+
+
+def legacy_read(skt:socket.socket, n:int):
+    for _ in range(n):
+        msg = b''
+        for b in iter(lambda: skt.recv(1), b'!'):
+            msg += b
+        data = msg.decode().split(';')
+        IdProposta(*map(int, data[1].split(':')))
+
+
+def codec_read(skt:socket.socket, n:int):
+    reader = FrameReader(skt)
+    for _ in range(n):
+        next(reader)
+
+
+def run(name:str, payload:bytes, n:int, reader) -> float:
+    a, b = socket.socketpair()
+    writer = Thread(target=lambda: (a.sendall(payload * n), a.close()))
+    start = time.perf_counter()
+    writer.start()
+    reader(b, n)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    b.close()
+    rate = n / elapsed
+    print(f"{name:>8}: {n} messages in {elapsed:.3f}s -> {rate:,.0f} msgs/s")
+    return rate
+
+
+def main():
+    n          = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    value_size = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    value      = "v" * value_size
+    ballot     = IdProposta(7, 40000)
+
+    print(f"act message with a {value_size} byte value")
+    old = run("legacy", legacy_encode("act", ballot, value), n, legacy_read)
+    new = run("codec", encode("act", ballot, value), n, codec_read)
+    print(f"speedup: {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+'''
+Roda muitas instâncias completas do protocolo na rede simulada (src.simulator), sem sockets nem
+processos: cada semente monta um cluster com 1 proposer, 3 acceptors e 2 learners e propõe
+`values` valores. Mede quantas instâncias e decisões por segundo o simulador processa e, em
+tempo virtual, quanto tempo e quantas mensagens cada execução levou.
+
+O tempo real é dividido entre montar os nós e rodar o protocolo (registro, eleição e as decisões).
+Em CPython são algumas centenas de instâncias por segundo (~320/s com 1 valor, ~480/s com
+--no-serialize), não os milhares pedidos: cada instância troca ~70 mensagens, e o codec fica com
+cerca de 40% do tempo de execução. O bridge envia a configuração uma vez por rajada de registros
+(ver Bridge.schedule_membership), e não a cada registro. Com mais valores por instância o custo
+fixo se dilui: com 100 valores são ~2.800 decisões por segundo.
+
+Com --fuzz, as mensagens podem se perder e chegar fora de ordem, os acceptors gravam um WAL
+(sync="always") e um deles cai no meio da execução, e há 3 learners com snapshots a cada 5 slots,
+um deles parado desde o início: os acceptors compactam o log, e um learner que perde aceites só
+se recupera pelo catch-up de outro learner. Cada semente verifica que os learners vivos concordam
+em todos os slots que aplicaram e, ao terminar, que cada valor proposto foi aplicado uma vez.
+Uma semente que falha pode ser repetida exatamente com --seed.
+
+Uso: python -m benchmarks.bench_simulator [instances] [values] [--fuzz] [--seed S] [--no-serialize]
+'''
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+from src import Acceptor, Bridge, Learner, Proposer, Simulator
+
+
+def instance(seed:int, values:int, fuzz:bool=False, serialize:bool=True, directory:str|None=None
+             ) -> tuple[Simulator, list[Learner], bool, float]:
+    '''
+    Roda uma instância; retorna os learners vivos e também quantos segundos (reais) levou montar
+    os nós. Com `fuzz`, os WALs e os snapshots ficam em `directory`
+    '''
+    start = time.perf_counter()
+    if fuzz:
+        sim = Simulator(seed, drop=0.02, reorder=True, serialize=serialize)
+        bridge    = Bridge(transport=sim.transport())
+        acceptors = [Acceptor(bridge.port, wal_path=os.path.join(directory, f"{seed}-a{i}.wal"), sync="always",
+                              transport=sim.transport()) for i in range(3)]
+        learners  = [Learner(bridge.port, snapshot_path=os.path.join(directory, f"{seed}-l{i}.snapshot"),
+                             snapshot_every=5, catchup_timeout=0.5, transport=sim.transport()) for i in range(3)]
+    else:
+        sim = Simulator(seed, serialize=serialize)
+        bridge    = Bridge(transport=sim.transport())
+        acceptors = [Acceptor(bridge.port, transport=sim.transport()) for _ in range(3)]
+        learners  = [Learner(bridge.port, transport=sim.transport()) for _ in range(2)]
+    proposer  = Proposer(bridge.port, transport=sim.transport())
+    for i in range(values):
+        proposer.propose(f"v{i}")
+    setup = time.perf_counter() - start
+    sim.start(*acceptors, *learners, proposer)
+    if fuzz:
+        victim = sim.random.choice(acceptors)._addr[1]
+        sim.schedule(sim.random.uniform(0, 0.01), sim.crash, victim)
+        sim.schedule(sim.random.uniform(0.01, 0.05), sim.recover, victim)
+        sim.crash(learners[0]._addr[1])
+        learners = learners[1:]
+    done = sim.run_until(lambda: all(l.applied >= values for l in learners), timeout=10.0)
+    return sim, learners, done, setup
+
+
+def contents(learner:Learner) -> list:
+    '''
+    Todos os valores aplicados pelo learner, os do snapshot e os aplicados depois dele
+    '''
+    return (list(learner.snapshot) if learner.snapshot is not None else []) + learner.log
+
+
+def agree(learners:list[Learner]) -> bool:
+    '''
+    Os logs dos learners precisam ser prefixos uns dos outros
+    '''
+    logs = [contents(l) for l in learners]
+    size = min(map(len, logs))
+    return all(log[:size] == logs[0][:size] for log in logs)
+
+
+def exactly_once(learners:list[Learner], values:int) -> bool:
+    '''
+    Cada valor proposto foi aplicado uma única vez, por todos os learners
+    '''
+    expected = sorted(f"v{i}" for i in range(values))
+    return all(sorted(contents(l)) == expected for l in learners)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    instances = int(args[0]) if len(args) > 0 else 1000
+    values    = int(args[1]) if len(args) > 1 else 1
+    fuzz      = "--fuzz" in sys.argv
+    serialize = "--no-serialize" not in sys.argv
+    seeds     = range(instances)
+    if "--seed" in sys.argv:
+        seeds = [int(sys.argv[sys.argv.index("--seed") + 1])]
+
+    failed, stuck = [], 0
+    virtual = sent = setup = 0
+    directory = tempfile.mkdtemp() if fuzz else None
+    start = time.perf_counter()
+    try:
+        for seed in seeds:
+            sim, learners, done, built = instance(seed, values, fuzz, serialize, directory)
+            if not agree(learners) or (done and not exactly_once(learners, values)):
+                failed.append(seed)
+            stuck   += not done
+            virtual += sim.time
+            sent    += sim.sent
+            setup   += built
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+    elapsed = time.perf_counter() - start
+
+    n = len(seeds)
+    print(f"{n} instances x {values} values{' (fuzz)' if fuzz else ''} in {elapsed:.2f}s: "
+          f"{n / elapsed:,.0f} instances/s, {n * values / elapsed:,.0f} decisions/s")
+    print(f"real time {elapsed / n * 1000:.2f} ms/instance: {setup / n * 1000:.2f} ms building the nodes, "
+          f"{(elapsed - setup) / n * 1000:.2f} ms running the protocol")
+    print(f"virtual time {virtual / n * 1000:.2f} ms/instance, {sent / n:.0f} msgs/instance, "
+          f"{stuck} did not finish in 10 virtual seconds")
+    if failed:
+        print(f"learners disagreed or lost values with seeds {failed[:20]}")
+    if failed or (fuzz and stuck):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
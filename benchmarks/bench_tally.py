@@ -0,0 +1,127 @@
+'''
+Micro-benchmark da contagem de votos do learner: compara a contagem antiga (um dict de
+[accept_count, retain_count, valor] e um dict por acceptor em cada slot) com o QuorumTally,
+com `window` slots em andamento e os aceites de todos os acceptors intercalados entre eles.
+Nos dois casos cada aceite passa por uma chamada de método, como no learner; com o QuorumTally
+as decisões são recolhidas a cada aceite ou, como no flush() do learner, a cada 256.
+
+Recolhendo a cada 256 aceites, o QuorumTally é mais rápido que os dicts e usa pouco mais da
+metade da memória; recolher a cada aceite custa uma passada de collect() e advance() por
+mensagem, que o learner não faz.
+
+Uso: python -m benchmarks.bench_tally [slots] [acceptors] [window]
+'''
+import tracemalloc
+import random
+import time
+import sys
+
+from src.id_proposta import IdProposta
+from src.tally import QuorumTally
+
+
+def votes(slots:int, acceptors:int, window:int) -> list[tuple]:
+    ballot = IdProposta(1, 40000)
+    result = []
+    for start in range(0, slots, window):
+        chunk = [(slot, 1000 + a, ballot, f"v{slot}") for slot in range(start, min(start + window, slots)) for a in range(acceptors)]
+        random.shuffle(chunk)
+        result += chunk
+    return result
+
+
+class Legacy:
+    '''
+    A contagem que o learner fazia antes do QuorumTally, um método chamado a cada aceite
+    '''
+    def __init__(self, quorum:int):
+        self.quorum     = quorum
+        self.instances  = {}
+        self.decisions  = {}
+        self.next_apply = 0
+
+    def add(self, slot, port, ballot, value):
+        if slot < self.next_apply or slot in self.decisions:
+            return
+        instance = self.instances.get(slot)
+        if instance is None:
+            instance = self.instances[slot] = (dict(), dict())
+        proposals, acceptors = instance
+        last_pn = acceptors.get(port)
+        if last_pn is not None and not ballot > last_pn:
+            return
+        acceptors[port] = ballot
+        if last_pn is not None:
+            oldp = proposals[last_pn]
+            oldp[1] -= 1
+            if oldp[1] == 0:
+                del proposals[last_pn]
+        if ballot not in proposals:
+            proposals[ballot] = [0, 0, value]
+        t = proposals[ballot]
+        t[0] += 1
+        t[1] += 1
+        if t[0] == self.quorum:
+            self.decisions[slot] = value
+            del self.instances[slot]
+            while self.next_apply in self.decisions:
+                del self.decisions[self.next_apply]
+                self.next_apply += 1
+
+
+def legacy(messages:list[tuple], quorum:int) -> int:
+    engine = Legacy(quorum)
+    for slot, port, ballot, value in messages:
+        engine.add(slot, port, ballot, value)
+    return engine.next_apply + len(engine.decisions)
+
+
+def tally(messages:list[tuple], quorum:int, batch:int) -> int:
+    engine, decisions, next_apply = QuorumTally(quorum), {}, 0
+    add = engine.add
+    for start in range(0, len(messages), batch):
+        for slot, port, ballot, value in messages[start:start + batch]:
+            if slot < next_apply or slot in decisions:
+                continue
+            add(slot, port, ballot, value)
+        # Como no flush() do learner: recolhe as decisões e a janela avança até o primeiro slot
+        # ainda não decidido
+        decisions.update(engine.collect())
+        while next_apply in decisions:
+            del decisions[next_apply]
+            next_apply += 1
+        engine.advance(next_apply)
+    return next_apply + len(decisions)
+
+
+def run(name:str, fn, *args, repeat:int=5):
+    # O melhor de `repeat` execuções, para reduzir o ruído de outros processos
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decided = fn(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    # A memória é medida em uma segunda execução, porque o tracemalloc deixa as alocações lentas
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>12}: {decided} slots in {elapsed:.3f}s, peak {peak / 1024:,.0f} KiB")
+
+
+def main():
+    slots     = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    acceptors = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    window    = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    quorum    = acceptors // 2 + 1
+    random.seed(0)
+    messages  = votes(slots, acceptors, window)
+
+    print(f"{slots} slots, {acceptors} acceptors, window {window}")
+    run("legacy", legacy, messages, quorum)
+    run("tally", tally, messages, quorum, 1)
+    run("tally x256", tally, messages, quorum, 256)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+'''
+Valores escolhidos por segundo em função do tamanho do valor, com TCP em localhost, sockets
+AF_UNIX e AF_UNIX com os valores em memória compartilhada (só o handle passa pelo bridge).
+
+Cada combinação sobe um Cluster com 3 acceptors e 1 learner em um processo separado, e um Client
+neste processo submete N valores de uma vez, medindo o tempo até todos serem escolhidos.
+
+Uso: python -m benchmarks.bench_transport [n_valores] [tamanhos em KiB, separados por vírgula]
+'''
+import time
+import sys
+import os
+
+from src import Client, Cluster, TcpTransport, UnixTransport
+
+MODES = {
+    "tcp":        ("tcp", TcpTransport, None),
+    "unix":       ("unix", UnixTransport, None),
+    "unix+shm":   ("unix", UnixTransport, 0),
+}
+
+
+def run(mode:str, n:int, size:int) -> float:
+    transport, client_transport, threshold = MODES[mode]
+    cluster = Cluster(acceptors=3, proposers=1, learners=1, processes=1, transport=transport).start()
+    client  = Client(cluster.route, timeout=10.0, share_threshold=threshold,
+                     transport=client_transport(queue_size=65536))
+    try:
+        values = [os.urandom(size) for _ in range(n)]
+        start = time.perf_counter()
+        futures = client.submit_many(values)
+        for future in futures:
+            future.result(60)
+        return n / (time.perf_counter() - start)
+    finally:
+        # O cluster para antes: o cliente remove os segmentos que criou, e um learner ainda
+        # aplicando os últimos valores não os encontraria
+        cluster.close()
+        client.close()
+
+
+def main():
+    n     = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sizes = [int(s) for s in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 16, 64, 256]
+    print(f"{'KiB':>6}" + "".join(f"{mode:>12}" for mode in MODES) + "   (values/s)")
+    for size in sizes:
+        rates = [run(mode, n, size * 1024) for mode in MODES]
+        print(f"{size:>6}" + "".join(f"{rate:>12,.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
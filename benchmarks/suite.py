@@ -0,0 +1,335 @@
+'''
+Suíte de benchmarks reprodutível do cluster completo.
+
+Cada cenário tem uma forma de cluster fixa (acceptors, learners, proposers), um tamanho de valor,
+uma carga oferecida e um número de valores. Cada papel roda no seu próprio processo, como no
+run.py, e o resultado de cada cenário traz:
+
+  - decisions_per_sec: valores aplicados por segundo no learner mais lento
+  - latency_ms:        p50/p99/p999 do tempo entre propose() e a aplicação no learner
+  - msgs_per_decision: mensagens entregues aos nós (proposers, acceptors e learners) por valor
+  - roles:             CPU (s) e pico de RSS (KiB) somados por papel, incluindo o bridge
+
+Os resultados são gravados em JSON e podem ser comparados com os de outro commit:
+
+    python -m benchmarks.suite --out base.json
+    python -m benchmarks.suite --out new.json --compare base.json
+
+Em uma máquina com poucos núcleos a variação entre execuções é grande; --repeat roda cada
+cenário várias vezes e guarda a execução mediana. Um cenário em que o learner mais lento não
+aplicou todos os valores enviados é marcado como incompleto ("complete": false), e a suíte
+termina com erro.
+
+Uso: python -m benchmarks.suite [--scenario nome ...] [--out arquivo] [--compare arquivo]
+                                [--repeat n] [--threshold 0.1] [--list]
+'''
+from multiprocessing import Process, Pipe, Value
+from threading import Thread
+from array import array
+import subprocess
+import platform
+import argparse
+import resource
+import json
+import time
+import sys
+import os
+
+from src import Acceptor, Batcher, Bridge, Learner, Proposer
+
+# Formas de cluster e cargas fixas; rate = 0 envia tudo o mais rápido possível
+SCENARIOS = {
+    "baseline":     dict(acceptors=3, learners=1, proposers=1, value_size=32,   rate=0,    values=2000, batch=1),
+    "batched":      dict(acceptors=3, learners=1, proposers=1, value_size=32,   rate=0,    values=20000, batch=32),
+    "large-values": dict(acceptors=3, learners=1, proposers=1, value_size=4096, rate=0,    values=2000, batch=1),
+    "offered-load": dict(acceptors=3, learners=1, proposers=1, value_size=32,   rate=500,  values=2000, batch=1),
+    "wide":         dict(acceptors=5, learners=3, proposers=1, value_size=32,   rate=0,    values=2000, batch=1),
+    "direct":       dict(acceptors=3, learners=1, proposers=1, value_size=32,   rate=0,    values=2000, batch=1, direct=True),
+    "two-proposers":dict(acceptors=3, learners=1, proposers=2, value_size=32,   rate=0,    values=1000, batch=1),
+}
+
+TIMEOUT  = 60.0  # limite de cada cenário
+STALL    = 5.0   # segundos sem nenhum valor aplicado até desistir do cenário
+REGISTER = 10.0  # limite para cada nó ter o registro confirmado pelo bridge
+
+# Métricas em que um valor maior é pior, para a comparação entre execuções
+LOWER_IS_BETTER = ("p50", "p99", "p999", "msgs_per_decision", "cpu_s", "rss_kib")
+
+
+def _usage() -> dict:
+    t = os.times()
+    return {"cpu_s": t.user + t.system, "rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _count_messages(node) -> list[int]:
+    '''
+    Conta as mensagens entregues ao nó. Deve ser chamado antes de node.run(), que é quando a
+    thread de escuta passa a usar node.handle_message
+    '''
+    received = [0]
+    handle = node.handle_message
+
+    def counting(port, data):
+        received[0] += 1
+        handle(port, data)
+
+    node.handle_message = counting
+    return received
+
+
+def _value(index:int, size:int) -> str:
+    return f"{index:012d}".ljust(size, "x")
+
+
+def _bridge_main(conn):
+    bridge = Bridge()
+    conn.send(bridge.port)
+    Thread(target=bridge.run, daemon=True).start()
+    conn.recv()
+    conn.send({"role": "bridge", "messages": 0, **_usage()})
+
+
+def _acceptor_main(acceptor, conn):
+    received = _count_messages(acceptor)
+    Thread(target=acceptor.run, daemon=True).start()
+    conn.send(acceptor.wait_registered(REGISTER))
+    conn.recv()
+    conn.send({"role": "acceptor", "messages": received[0], **_usage()})
+
+
+def _learner_main(learner, conn, total:int, applied):
+    received = _count_messages(learner)
+    stamps = array("d", bytes(8 * total))
+
+    def apply(slot, value):
+        stamps[int(value[:12])] = time.monotonic()
+        learner.log.append(value)
+        with applied.get_lock():
+            applied.value += 1
+
+    learner.apply = apply
+    Thread(target=learner.run, daemon=True).start()
+    conn.send(learner.wait_registered(REGISTER))
+    conn.recv()
+    conn.send({"role": "learner", "messages": received[0], "stamps": stamps.tobytes(), **_usage()})
+
+
+def _proposer_main(proposer, conn, first:int, scenario:dict):
+    received = _count_messages(proposer)
+    Thread(target=proposer.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not proposer.leader and time.monotonic() < deadline:
+        time.sleep(0.001)
+    conn.send(proposer.leader)
+
+    conn.recv()  # todos os proposers começam juntos
+    n, size, rate = scenario["values"], scenario["value_size"], scenario["rate"]
+    submit = proposer.propose
+    if scenario["batch"] > 1:
+        batcher = Batcher(proposer, max_batch=scenario["batch"])
+        submit  = batcher.submit
+    stamps = array("d", bytes(8 * n))
+    start  = time.monotonic()
+    for i in range(n):
+        if rate:
+            delay = start + i / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        stamps[i] = time.monotonic()
+        submit(_value(first + i, size))
+    if scenario["batch"] > 1:
+        batcher.flush()
+
+    conn.recv()
+    # Os aceites dos últimos slots ainda contam nas mensagens por decisão
+    deadline = time.monotonic() + STALL
+    while proposer.in_flight and time.monotonic() < deadline:
+        time.sleep(0.001)
+    conn.send({"role": "proposer", "messages": received[0], "stamps": stamps.tobytes(), **_usage()})
+
+
+def percentile(ordered:list[float], q:float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_scenario(name:str, scenario:dict) -> dict:
+    direct   = scenario.get("direct", False)
+    per_prop = scenario["values"]
+    total    = per_prop * scenario["proposers"]
+
+    parent, child = Pipe()
+    bridge = Process(target=_bridge_main, args=(child,), daemon=True)
+    bridge.start()
+    port = parent.recv()
+    links = [parent]
+    procs = [bridge]
+
+    def spawn(target, *args):
+        a, b = Pipe()
+        p = Process(target=target, args=(*args[:1], b, *args[1:]), daemon=True)
+        p.start()
+        links.append(a)
+        procs.append(p)
+        return a
+
+    # Os nós são criados aqui e rodam nos processos filhos, como no run.py. Os proposers só
+    # começam depois que o bridge confirmou o registro de todos os acceptors e learners
+    counters = []
+    for _ in range(scenario["acceptors"]):
+        spawn(_acceptor_main, Acceptor(port, direct=direct))
+    for _ in range(scenario["learners"]):
+        counters.append(Value("q", 0))
+        spawn(_learner_main, Learner(port, direct=direct), total, counters[-1])
+    if not all(conn.recv() for conn in links[1:]):
+        raise RuntimeError(f"{name}: the bridge did not confirm every registration")
+    proposers = [spawn(_proposer_main, Proposer(port, direct=direct), i * per_prop, scenario)
+                 for i in range(scenario["proposers"])]
+
+    leaders = [conn.recv() for conn in proposers]
+    start = time.monotonic()
+    for conn in proposers:
+        conn.send("go")
+    deadline = start + TIMEOUT
+    progress, last = 0, start
+    while progress < total and time.monotonic() < deadline and time.monotonic() - last < STALL:
+        time.sleep(0.002)
+        if min(c.value for c in counters) > progress:
+            progress, last = min(c.value for c in counters), time.monotonic()
+    elapsed = last - start
+
+    stats = []
+    for conn in links:
+        conn.send("stop")
+        stats.append(conn.recv())
+    for p in procs:
+        p.terminate()
+
+    submitted = array("d")
+    for s in stats:
+        if s["role"] == "proposer":
+            submitted.frombytes(s.pop("stamps"))
+    latencies = []
+    applied = min(c.value for c in counters)
+    for s in stats:
+        if s["role"] == "learner":
+            stamps = array("d")
+            stamps.frombytes(s.pop("stamps"))
+            latencies += [(done - submitted[i]) * 1000 for i, done in enumerate(stamps) if done]
+    latencies.sort()
+
+    roles:dict[str, dict] = {}
+    for s in stats:
+        role = roles.setdefault(s["role"], {"count": 0, "cpu_s": 0.0, "rss_kib": 0})
+        role["count"]   += 1
+        role["cpu_s"]   += round(s["cpu_s"], 3)
+        role["rss_kib"] += s["rss_kib"]
+    messages = sum(s["messages"] for s in stats)
+
+    return {
+        "scenario":          scenario,
+        "leaders":           sum(leaders),
+        "submitted":         total,
+        "applied":           applied,
+        "complete":          applied == total,
+        "elapsed_s":         round(elapsed, 3),
+        "decisions_per_sec": round(applied / elapsed, 1) if elapsed else 0.0,
+        "latency_ms":        {q: round(percentile(latencies, v), 3) for q, v in (("p50", .5), ("p99", .99), ("p999", .999))},
+        "msgs_per_decision": round(messages / applied, 2) if applied else None,
+        "roles":             roles,
+    }
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit":    commit,
+        "python":    platform.python_version(),
+        "platform":  platform.platform(),
+        "cpus":      os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _flatten(result:dict) -> dict:
+    flat = {"decisions_per_sec": result["decisions_per_sec"], "msgs_per_decision": result["msgs_per_decision"]}
+    flat.update(result["latency_ms"])
+    for role, usage in result["roles"].items():
+        flat[f"{role}.cpu_s"]   = usage["cpu_s"]
+        flat[f"{role}.rss_kib"] = usage["rss_kib"]
+    return flat
+
+
+def compare(base:dict, new:dict, threshold:float) -> list[str]:
+    '''
+    Compara duas execuções e retorna as métricas que pioraram mais que `threshold`
+    '''
+    regressions = []
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            continue
+        old, cur = _flatten(base["results"][name]), _flatten(result)
+        for metric, value in cur.items():
+            before = old.get(metric)
+            if not before or value is None:
+                continue
+            change = (value - before) / before
+            worse  = change > threshold if metric.endswith(LOWER_IS_BETTER) else change < -threshold
+            mark   = "  REGRESSION" if worse else ""
+            print(f"{name:>14} {metric:<22} {before:>12,.3f} -> {value:>12,.3f} ({change:+.1%}){mark}")
+            if worse:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible Paxos benchmark suite")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--out", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario; the median run is reported")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:>14}: {scenario}")
+        return
+
+    report = {"meta": metadata(), "results": {}}
+    incomplete = []
+    for name in args.scenario or SCENARIOS:
+        runs = sorted((run_scenario(name, SCENARIOS[name]) for _ in range(args.repeat)), key=lambda r: r["decisions_per_sec"])
+        result = report["results"][name] = runs[len(runs) // 2]
+        result["runs"] = [r["decisions_per_sec"] for r in runs]
+        latency = result["latency_ms"]
+        print(f"{name:>14}: {result['decisions_per_sec']:>9,.0f} decisions/s  "
+              f"p50 {latency['p50']:.2f}ms  p99 {latency['p99']:.2f}ms  p999 {latency['p999']:.2f}ms  "
+              f"{result['msgs_per_decision']} msgs/decision  ({result['applied']}/{result['submitted']} applied)"
+              f"{'' if result['complete'] else '  INCOMPLETE'}", flush=True)
+        if not all(r["complete"] for r in runs):
+            incomplete.append(name)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}")
+            sys.exit(1)
+    if incomplete:
+        print(f"Not every submitted value was applied in: {', '.join(incomplete)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
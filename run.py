@@ -1,34 +1,78 @@
+import logging
 import time
-from multiprocessing import Process
+import sys
+import os
 from random import randint
 from src import *
+from src import metrics
 
-bridge = Bridge()
-nodes = []
-procs = []
+def option(name:str, default=None):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
 
-time.sleep(1)  # Small delay to allow the bridge to set up
+# --log-level LEVEL: DEBUG mostra cada mensagem enviada e recebida; o padrão mostra só os eventos
+logging.basicConfig(level=option("--log-level", "INFO").upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
-for _ in range(randint(1, 1)):
-    nodes.append(Proposer(bridge.port, "value1"))
+# --metrics-port P: o bridge serve as métricas em http://localhost:P/metrics e o i-ésimo nó em P+1+i
+# --metrics-dump DIR: cada processo grava as suas métricas em DIR/<papel>-<porta>.json
+metrics_port = option("--metrics-port")
+metrics_dump = option("--metrics-dump")
 
-for _ in range(randint(1, 5)):
-    nodes.append(Acceptor(bridge.port))
+def expose(registry:metrics.Registry, offset:int):
+    if metrics_port is not None:
+        metrics.serve([registry], int(metrics_port) + offset)
+    if metrics_dump is not None:
+        os.makedirs(metrics_dump, exist_ok=True)
+        metrics.dump([registry], os.path.join(metrics_dump, f"{registry.labels['role']}-{registry.labels['port']}.json"))
 
-for _ in range(randint(1, 10)):
-    nodes.append(Learner(bridge.port))
-    
-# Add another small delay before the proposer starts
-time.sleep(1)
+def setup_node(node, index:int):
+    # Chamado no processo de cada nó: as métricas de um nó existem só no processo dele
+    expose(node.metrics, 1 + index)
 
-for n in nodes:
-    p = Process(target=n.run, daemon=True)
-    p.start()
-    procs.append(p)
+# --async usa o bridge baseado em asyncio; o bridge com threads continua sendo o padrão
+# --bridges N: N bridges em processos separados, com as mensagens distribuídas por hash consistente
+# --direct: o bridge só serve a lista de participantes e os nós trocam mensagens diretamente
+# --processes N: processos para os nós (o padrão é um por nó; 0 roda tudo neste processo)
+# --pin: fixa cada processo de nós em uma CPU
+# --acceptors N: número de acceptors (o padrão é sorteado entre 1 e 5)
+# --prepare-quorum Q1 / --accept-quorum Q2: quóruns das fases 1 e 2 (Flexible Paxos, Q1 + Q2 > N)
+# --thrifty: cada accept vai só para um quórum de acceptors, e para os outros se demorar
+# --distinguished-learner: só um learner recebe os aceites e envia as decisões aos outros
+# --unix: sockets AF_UNIX em vez de TCP em localhost (todos os nós rodam neste host)
+# --share-threshold BYTES: valores a partir desse tamanho vão para a memória compartilhada
+# --snapshot-dir DIR / --snapshot-every N: os learners gravam um snapshot em DIR a cada N slots
+# aplicados (com --share-threshold e sem --snapshot-dir, em um diretório temporário)
+acceptors, learners = int(option("--acceptors", randint(1, 5))), randint(1, 10)
+cluster = Cluster(acceptors=acceptors, learners=learners, proposers=1,
+                  values=["value1", "value2", "value3"],  # cada valor ocupa um slot do log
+                  processes=int(option("--processes", acceptors + learners + 1)),
+                  pin="--pin" in sys.argv,
+                  direct="--direct" in sys.argv,
+                  async_bridge="--async" in sys.argv,
+                  bridges=int(option("--bridges", 1)),
+                  prepare_quorum=option("--prepare-quorum") and int(option("--prepare-quorum")),
+                  accept_quorum=option("--accept-quorum") and int(option("--accept-quorum")),
+                  thrifty="--thrifty" in sys.argv,
+                  distinguished_learner="--distinguished-learner" in sys.argv,
+                  transport="unix" if "--unix" in sys.argv else "tcp",
+                  share_threshold=option("--share-threshold") and int(option("--share-threshold")),
+                  snapshot_dir=option("--snapshot-dir"),
+                  snapshot_every=int(option("--snapshot-every", 1000)),
+                  setup=setup_node)
+if cluster.bridge is not None:
+    expose(cluster.bridge.metrics, 0)
+
+# Sem sleeps: o cluster só inicia os proposers depois que todos os nós confirmaram o registro
+cluster.start()
 
 try:
-    for p in procs:
-        p.join()
+    if cluster.processes:
+        cluster.join()
+    else:
+        while True:
+            time.sleep(1)
 except KeyboardInterrupt:
     print("\rStopping...")
-    print(bridge._proposers, bridge._acceptors, bridge._learners, sep="\n")
\ No newline at end of file
+    if cluster.bridge is not None:
+        bridge = cluster.bridge
+        print(bridge._proposers, bridge._acceptors, bridge._learners, sep="\n")
+    cluster.close()
@@ -1,4 +1,13 @@
 from .acceptor import Acceptor
 from .proposer import Proposer
 from .learner import Learner
-from .bridge import Bridge
\ No newline at end of file
+from .bridge import Bridge
+from .async_bridge import AsyncBridge
+from .batcher import Batcher
+from .bridge_cluster import BridgeCluster
+from .sharding import ShardMap
+from .transport import TcpTransport, UnixTransport
+from .simulator import Simulator
+from .launcher import Cluster
+from .client import Client
+from .shm import SharedValue, share
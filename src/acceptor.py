@@ -1,118 +1,246 @@
-from threading import Thread
+from threading import Lock
 from .id_proposta import IdProposta
-import socket
+from .sharding import ShardMap
+from .node import Node
+from .wal import WriteAheadLog
+from .codec import MESSAGE_TYPES
+import logging
 
+log = logging.getLogger(__name__)
 
-class Acceptor:
-    def __init__(self, bridge_port:int):
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind(("localhost", 0))  # Bind the acceptor socket
-        self._addr:tuple[str, int] = self._sock.getsockname()
-        
-        # Immediately start listening for incoming connections
-        self._sock.listen()  
-        print(f"Acceptor listening for messages on {self._addr}")
 
-        self.bridge_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.bridge_socket.connect(("localhost", bridge_port))  # Establish a connection to the bridge
-        
-        self._listner = Thread(target=self.listner_requests, daemon=True)
-        self.bridge = bridge_port
-        
-        self._listner.start()
+class Acceptor(Node):
+    ROLE = "ACCEPTOR"
+
+    def __init__(self, bridge_port:int|ShardMap, wal_path:str|None=None, sync:str="group", direct:bool=False, lease:float=2.0,
+                 transport=None):
+        super().__init__(bridge_port, direct, transport)
+        log.info("Acceptor listening for messages on %s", self._addr)
+
+        self._distinguished:int|None = None  # learner que recebe os aceites, se houver um
+        # No modo direto as mensagens chegam por várias conexões ao mesmo tempo
+        self._lock = Lock()
  
-        self.promised_id    = None
-        self.accepted_id    = None
-        self.accepted_value = None
+        # Multi-Paxos: uma única promessa vale para todos os slots; os valores aceitos são por slot
+        self.promised_id = None
+        self.accepted:dict[int, tuple[IdProposta, str|None]] = {}  # slot => (accepted_id, accepted_value)
+        self.compacted = 0  # slots abaixo deste já estão no snapshot de um learner e foram descartados
+
+        # Lease de liderança: junto com a promessa o acceptor se compromete a não prometer para
+        # nenhum outro proposer por `lease` segundos, e o líder pode servir leituras sem uma rodada
+        self.lease = lease  # 0 desativa os leases
+        self._lease_owner:IdProposta|None = None
+        self._lease_expiry = 0.0
+
+        # Sem WAL o estado só existe em memória e um acceptor reiniciado pode violar a segurança
+        self._wal = None
+        if wal_path is not None:
+            self._wal = WriteAheadLog(wal_path, sync)
+            self.recover()
+            # Um lease concedido antes de reiniciar pode ainda estar valendo no líder
+            self._lease_owner  = self.promised_id
+            self._lease_expiry = self._transport.now() + self.lease
 
         self._paths = {
             "prp": self.recv_prepare,
-            "act": self.recv_accept_request
+            "act": self.recv_accept_request,
+            "cpt": self.recv_compact,
+            "cta": self.recv_catch_up,
+            "mbr": self.set_membership,
+            "rga": self.set_registered
         }
 
-        self.send_message_to_bridge("spp", "ACCEPTOR", str(self._addr[1]))
+        self._received = self.metrics.counters("messages_received", "type", MESSAGE_TYPES)
+        self._refused  = self.metrics.counter("prepares_refused")
+        self.metrics.gauge("accepted_slots", lambda: len(self.accepted))
+        if self._wal is not None:
+            self.metrics.gauge("wal_pending", lambda: len(self._wal._pending))
+
+        self.register()
     
-    def send_message_to_bridge(self, reqtype:str, *args:str):
+    def send_reply(self, reqtype:str, *args):
         '''
-        Envia mensagens para o bridge
+        Envia uma promessa ("spm") ou um aceite ("sad"): pelo bridge ou, no modo direto, ao
+        proposer e aos learners
         '''
-        msg = (";".join((reqtype,)+args)+"!").encode()
-        print(f"Acceptor sending message to bridge: {msg}")
+        if not self.direct:
+            if reqtype == "spm":
+                bridge = self.shards.select(args[0])
+            else:
+                bridge = self.shards.select(args[0].porta, args[1])
+            self.send_message_to_bridge(reqtype, *args, bridge=bridge)
+        elif reqtype == "spm":
+            prop_port, *promise = args
+            self._transport.send(prop_port, "prm", self._addr[1], *promise)
+        elif reqtype == "sad":
+            proposal_id = args[0]
+            learners = self._learners if self._distinguished is None else [self._distinguished]
+            for port in learners + [proposal_id.porta]:
+                self._transport.send(port, "acd", self._addr[1], *args)
 
-        def send():
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect(("localhost", self.bridge))
-                    s.sendall(msg)
-                    print(f"Acceptor message sent to bridge: {msg}")
-            except (BrokenPipeError, OSError) as e:
-                print(f"Failed to send message to bridge at port {self.bridge}: {e}")
-        
-        Thread(target=send, daemon=True).start()
+    def _reconfigure(self, departed:set[int], prepare_quorum:int, accept_quorum:int, distinguished:int|None):
+        self._distinguished = distinguished
 
-    def listner_requests(self):
+    def leave(self):
         '''
-        Escuta todas as requisições que chegam
+        Sai da configuração: o bridge deixa de rotear mensagens para este acceptor e envia a nova
+        configuração para os outros nós
         '''
-        self._sock.listen()
-        while True:
-            skt, addr = self._sock.accept()
-            msg = b''
-            for b in iter(lambda: skt.recv(1), b'!'):
-                msg += b
-            data = msg.decode().split(';')
-            print(f"Acceptor received: {data} from {addr}")
+        self.send_message_to_bridge("drg", self._addr[1])
+
+    def handle_message(self, port:int, data:list[str]):
+        log.debug("Acceptor received: %s from port %s", data, port)
+        self._received[data[0]].inc()
+        with self._lock:
             self._paths[data[0]](*data[1:])
             
-    def recv_prepare(self, from_port: int, proposal_id: str):
+    def recover(self):
+        '''
+        Reconstrói promised_id e os valores aceitos a partir do WAL
+        '''
+        for record in self._wal.replay():
+            if record[0] == "cpt":
+                self.discard_below(record[1])
+                continue
+            proposal_id = record[1]
+            if self.promised_id is None or proposal_id > self.promised_id:
+                self.promised_id = proposal_id
+            if record[0] == "act" and record[2] >= self.compacted:
+                self.accepted[record[2]] = (proposal_id, record[3])
+        log.info("Acceptor recovered promise %s and %s accepted slots from %s", self.promised_id, len(self.accepted), self._wal.path)
+
+    def persist_and_send(self, record:tuple|None, reqtype:str, *args):
+        '''
+        Grava o registro no WAL e só envia a resposta depois que ele for durável. Respostas sem
+        registro também passam pelo WAL, para não ultrapassarem registros ainda não sincronizados
+        '''
+        if self._wal is None:
+            self.send_reply(reqtype, *args)
+        else:
+            self._wal.append(record, lambda: self.send_reply(reqtype, *args))
+
+    def recv_prepare(self, from_port: int, proposal_id: IdProposta, first_slot: int, epoch:int, round:int):
         '''
         Called when a Prepare message is received from a Proposer
-        Chamado quando um Prepare é enviado de um proposer
+        Chamado quando um Prepare é enviado de um proposer. O prepare vale para todos os slots
+        a partir de first_slot, e a promessa leva tudo o que já foi aceito nesses slots, além do
+        ponto de compactação (slots abaixo dele não podem mais ser propostos). `round` numera as
+        rodadas do proposer e volta na promessa
         '''
-        
-        proposal_id = IdProposta(*map(int, proposal_id.split(':')))
-        
-        print(f"Acceptor received prepare request: {proposal_id} from Proposer at port {from_port}")
-        
+        log.debug("Acceptor received prepare request: %s from Proposer at port %s", proposal_id, from_port)
+        self.check_epoch(epoch)
+
+        now = self._transport.now()
+        if self._lease_owner is not None and proposal_id != self._lease_owner and now < self._lease_expiry:
+            log.info("Acceptor refusing prepare %s: lease held by %s", proposal_id, self._lease_owner)
+            self._refused.inc()
+            self.send_nack(from_port, proposal_id)
+            return
+        if self.promised_id is not None and proposal_id < self.promised_id:
+            log.debug("Acceptor refusing prepare %s: already promised %s", proposal_id, self.promised_id)
+            self._refused.inc()
+            self.send_nack(from_port, proposal_id)
+            return
+
+        record = None
         if self.promised_id is None or proposal_id > self.promised_id:
             self.promised_id = proposal_id
+            record = ("prp", proposal_id)
         
-        print(f"Acceptor promising to proposal: {proposal_id}")
-        
-        self.send_message_to_bridge("spm", from_port, str(proposal_id), str(self.accepted_id or ""), self.accepted_value or "")
+        log.debug("Acceptor promising to proposal: %s", proposal_id)
+
+        # O lease só é concedido (ou renovado) para o maior id prometido, e só quando ele já tinha sido
+        # prometido antes: é a rodada de confirmação de um proposer que já chegou ao quórum. Um
+        # proposer que perdeu a disputa não repete o prepare, e assim não bloqueia os outros
+        lease_ms = 0
+        if self.lease > 0 and record is None and proposal_id == self.promised_id:
+            self._lease_owner  = proposal_id
+            self._lease_expiry = now + self.lease
+            lease_ms = int(self.lease * 1000)
+
+        accepted = [(slot, accepted_id, value) for slot, (accepted_id, value) in self.accepted.items() if slot >= first_slot]
+        self.persist_and_send(record, "spm", from_port, proposal_id, accepted, self.compacted, lease_ms, self.epoch, round)
                     
-    def recv_accept_request(self, proposal_id: str, value:str):
+    def recv_accept_request(self, proposal_id: IdProposta, slot: int, value:str|None, epoch:int):
         '''
         Chamado quando um accept é recebido de um proposer
         '''
-        proposal_id = IdProposta(*map(int, proposal_id.split(':')))
+        log.debug("Acceptor received accept request for proposal %s slot %s with value %s", proposal_id, slot, value)
+        self.check_epoch(epoch)
 
-        print(f"Acceptor received accept request for proposal {proposal_id} with value {value}")
-        
-        if proposal_id >= self.promised_id:
-            self.promised_id     = proposal_id
-            self.accepted_id     = proposal_id
-            self.accepted_value  = value
-            print(f"Acceptor accepted proposal {proposal_id} with value {value}")
-            self.send_message_to_bridge("sad", str(proposal_id), value)
+        if slot < self.compacted:
+            # Slot já decidido e compactado: o proposer retira da janela os slots abaixo de `compacted`
+            self._transport.send(proposal_id.porta, "cpd", self._addr[1], self.compacted)
+            return
+
+        if self.promised_id is None or proposal_id >= self.promised_id:
+            self.promised_id    = proposal_id
+            self.accepted[slot] = (proposal_id, value)
+            log.debug("Acceptor accepted proposal %s slot %s with value %s", proposal_id, slot, value)
+            self.persist_and_send(("act", proposal_id, slot, value), "sad", proposal_id, slot, value)
+        else:
+            self.send_nack(proposal_id.porta, proposal_id)
+
+    def send_nack(self, port:int, proposal_id:IdProposta):
+        '''
+        Avisa o proposer que a sua mensagem foi recusada e qual é o maior id já prometido, para que
+        ele tente de novo com um id maior. Vai direto para o proposer, mesmo sem o modo direto, como
+        as mensagens de catch-up
+        '''
+        self._transport.send(port, "nck", self._addr[1], proposal_id, self.promised_id)
     
+    def recv_compact(self, slot:int):
+        '''
+        Chamado quando um learner gravou um snapshot com todos os slots abaixo de `slot`.
+        O estado desses slots é descartado, inclusive do WAL
+        '''
+        if slot <= self.compacted:
+            return
+        self.discard_below(slot)
+        log.info("Acceptor compacted state below slot %s, %s slots kept", slot, len(self.accepted))
+        if self._wal is not None:
+            records = [("cpt", self.compacted)]
+            if self.promised_id is not None:
+                records.append(("prp", self.promised_id))
+            records.extend(("act", accepted_id, s, value) for s, (accepted_id, value) in self.accepted.items())
+            self._wal.rewrite(records)
+
+    def recv_catch_up(self, learner_port:int, first_slot:int, max_entries:int):
+        '''
+        Um learner atrasado pede os aceites a partir de `first_slot`. São reenviados diretamente
+        para ele, como notificações de aceite comuns, e o learner conta o quórum normalmente.
+        Com o WAL, só depois que os aceites já gravados se tornarem duráveis: um aceite em memória
+        ainda pode se perder em uma queda, e o learner contaria um voto que o acceptor esqueceu
+        '''
+        slots = sorted(s for s in self.accepted if s >= first_slot)[:max_entries]
+        log.info("Acceptor resending %s accepted slots from %s to Learner at port %s", len(slots), first_slot, learner_port)
+        entries = [(slot,) + self.accepted[slot] for slot in slots]
+        if self._wal is None:
+            self.resend_accepted(learner_port, entries)
+        else:
+            self._wal.append(None, lambda: self.resend_accepted(learner_port, entries))
+
+    def resend_accepted(self, learner_port:int, entries:list[tuple]):
+        for slot, accepted_id, value in entries:
+            self._transport.send(learner_port, "acd", self._addr[1], accepted_id, slot, value)
+
+    def discard_below(self, slot:int):
+        self.compacted = max(self.compacted, slot)
+        for s in [s for s in self.accepted if s < self.compacted]:
+            del self.accepted[s]
+
+    def start(self):
+        '''
+        O mesmo que run(), sem bloquear
+        '''
+        log.info("Acceptor listening for messages on %s", self._addr)
+        self.listen()
+        if self.direct:
+            self.request_membership()
+
     def run(self):
         '''
         Runs the acceptor to listen for messages from the bridge
         '''
-        self._sock.listen()
-        print(f"Acceptor listening for messages on {self._addr}")
-
-        while True:
-            skt, addr = self._sock.accept()  # Keep accepting new messages
-            msg = b''
-            for b in iter(lambda: skt.recv(1), b'!'):
-                msg += b
-            data = msg.decode().split(';')
-            print(f"Acceptor received: {data} from {addr}")
-
-            # Handle Prepare message
-            if data[0] == 'prp':
-                self.recv_prepare(data[1], data[2])  # Process Prepare message
-            skt.close()
-        
+        self.start()
+        self._listner.join()
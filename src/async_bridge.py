@@ -0,0 +1,160 @@
+from .bridge import Bridge
+from .codec import HEADER_SIZE, decode, encode, frame_size
+from .connection import HELLO
+from threading import Thread
+import asyncio
+import socket
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class AsyncBridge(Bridge):
+    '''
+    Bridge implementado sobre asyncio. Todas as conexões e todo o roteamento rodam em um único
+    event loop, em vez de uma thread por conexão e por destino. O Bridge com threads continua
+    disponível como alternativa, e é ele que roda sobre outros transportes (como o simulador);
+    este aceita o TcpTransport e o UnixTransport.
+    '''
+    def __init__(self, queue_size:int=1024, retries:int=3, prepare_quorum:int|None=None, accept_quorum:int|None=None,
+                 distinguished_learner:bool=False, transport=None):
+        self._queue_size = queue_size
+        self._retries    = retries
+        super().__init__(transport=transport, prepare_quorum=prepare_quorum, accept_quorum=accept_quorum,
+                         distinguished_learner=distinguished_learner)
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._outboxes:dict[int, asyncio.Queue] = {}
+        self._overflow:list[tuple[asyncio.Queue, bytes]] = []
+        self._hello = encode(HELLO, self._addr[1])
+        self._listner = Thread(target=self.listner_requests, daemon=True)
+        self._listner.start()
+
+    def close(self):
+        '''
+        Close the socket when done
+        '''
+        if self._transport:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._listner.join(1.0)  # espera as tarefas pendentes serem canceladas
+            self._transport.close()
+            log.info("Closed socket at %s", self._addr)
+
+    def listner_requests(self):
+        '''
+        Roda o event loop que atende todas as conexões
+        '''
+        log.info("Bridge is now listening for incoming connections...")
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except RuntimeError:
+            pass  # loop parado por close()
+        finally:
+            # Cancela as conexões e os envios pendentes antes de fechar o loop, para que nenhuma
+            # tarefa seja destruída ainda pendente
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _serve(self):
+        if self._transport.sock.family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self._handle_connection, sock=self._transport.sock)
+        else:
+            server = await asyncio.start_server(self._handle_connection, sock=self._transport.sock)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        '''
+        Lê os frames de uma conexão persistente e os roteia. Se alguma fila de saída estiver
+        cheia, a leitura da conexão só continua depois que houver espaço, o que limita a memória
+        usada por mensagens em trânsito
+        '''
+        peer = writer.get_extra_info("peername")
+        peer = peer[1] if isinstance(peer, tuple) else None  # AF_UNIX: só o "hlo" identifica quem envia
+        try:
+            while True:
+                size = frame_size(await reader.readexactly(HEADER_SIZE))
+                data = decode(await reader.readexactly(size))
+                if data[0] == HELLO:
+                    peer = data[1]
+                    continue
+                overflow = self._overflow = []
+                try:
+                    self.handle_message(peer, data)
+                except Exception as e:
+                    log.exception("Error while handling message %s from port %s: %s", data, peer, e)
+                for queue, frame in overflow:
+                    await queue.put(frame)
+        except asyncio.IncompleteReadError:
+            pass  # conexão fechada pelo nó
+        except asyncio.CancelledError:
+            # close(): a tarefa termina normalmente, senão o callback do asyncio.streams registra
+            # o cancelamento como erro
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Connection from port %s failed: %s", peer, e)
+        finally:
+            writer.close()
+
+    def call_later(self, delay:float, fn):
+        # Os envios só podem ser feitos de dentro do event loop
+        return self._loop.call_later(delay, fn)
+
+    def send_message(self, port: int, reqtype: str, *args: str):
+        '''
+        Enfileira a mensagem para o nó. Deve ser chamado de dentro do event loop
+        '''
+        log.debug("Bridge sending message: %s %s to port %s", reqtype, args, port)
+        queue = self._outboxes.get(port)
+        if queue is None:
+            queue = self._outboxes[port] = asyncio.Queue(self._queue_size)
+            self.metrics.gauge("send_queue_depth", queue.qsize, peer=port)
+            self._loop.create_task(self._sender(port, queue))
+        frame = encode(reqtype, *args)
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._overflow.append((queue, frame))
+
+    async def _sender(self, port:int, queue:asyncio.Queue):
+        '''
+        Mantém a conexão persistente com um nó e escreve nela tudo o que chega na fila
+        '''
+        writer  = None
+        retried = self.metrics.counter("send_retries", peer=port)
+        dropped = self.metrics.counter("send_dropped", peer=port)
+        while True:
+            frames = [await queue.get()]
+            while not queue.empty():
+                frames.append(queue.get_nowait())
+            data = b''.join(frames)
+
+            retries = self._retries
+            while retries > 0:
+                try:
+                    if writer is None:
+                        address = self._transport.address(port)
+                        if isinstance(address, str):
+                            _, writer = await asyncio.open_unix_connection(address)
+                        else:
+                            _, writer = await asyncio.open_connection(*address)
+                        writer.write(self._hello)
+                    writer.write(data)
+                    await writer.drain()
+                    break
+                except OSError as e:
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                    retries -= 1
+                    log.warning("Failed to send message to node at port %s: %s. Retries left: %s", port, e, retries)
+                    if retries <= 0:
+                        dropped.inc()
+                        break
+                    retried.inc()
+                    await asyncio.sleep(0.05 * (self._retries - retries))
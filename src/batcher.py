@@ -0,0 +1,62 @@
+from threading import Thread, Condition
+import time
+
+
+class Batcher:
+    '''
+    Estágio de batching na frente do Proposer. Junta os valores submetidos pelos clientes até
+    max_batch valores, ou até `linger` segundos depois do primeiro valor do lote, e propõe o lote
+    inteiro como um único valor. O Learner desfaz o lote em decisões individuais, na mesma ordem.
+    '''
+    def __init__(self, proposer, max_batch:int=64, linger:float=0.002):
+        self.proposer  = proposer
+        self.max_batch = max_batch
+        self.linger    = linger
+
+        self._batch:list[str] = []
+        self._deadline = 0.0
+        self._cond     = Condition()
+        self._thread   = None
+
+    def submit(self, value:str):
+        '''
+        Adiciona um valor ao lote atual
+        '''
+        with self._cond:
+            if self._thread is None:
+                # Iniciada sob demanda, no processo em que o proposer está rodando
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._batch.append(value)
+            if len(self._batch) >= self.max_batch:
+                self._flush()
+            elif len(self._batch) == 1:
+                self._deadline = time.monotonic() + self.linger
+                self._cond.notify()
+
+    def flush(self):
+        '''
+        Propõe imediatamente o lote atual, se houver
+        '''
+        with self._cond:
+            if self._batch:
+                self._flush()
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        self.proposer.propose(batch)
+
+    def _run(self):
+        '''
+        Propõe o lote quando o tempo de espera do primeiro valor termina
+        '''
+        with self._cond:
+            while True:
+                if not self._batch:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    self._flush()
@@ -1,21 +1,72 @@
-from threading import Thread
-import socket
+from .transport import TcpTransport
+from .id_proposta import IdProposta
+from .metrics import Registry
+from .codec import MESSAGE_TYPES
+from threading import Lock
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def check_quorums(acceptors:int, prepare_quorum:int|None=None, accept_quorum:int|None=None):
+    '''
+    Valida os tamanhos dos quóruns de um cluster com `acceptors` acceptors (Flexible Paxos): todo
+    quórum da fase 1 precisa intersectar todo quórum da fase 2, ou seja, Q1 + Q2 > N
+    '''
+    for name, size in (("prepare_quorum", prepare_quorum), ("accept_quorum", accept_quorum)):
+        if size is not None and not 1 <= size <= acceptors:
+            raise ValueError(f"{name} must be between 1 and {acceptors}, got {size}")
+    if prepare_quorum is not None and accept_quorum is not None and prepare_quorum + accept_quorum <= acceptors:
+        raise ValueError(f"prepare_quorum + accept_quorum must be greater than {acceptors} acceptors, "
+                         f"got {prepare_quorum} + {accept_quorum}")
+
 
 class Bridge:
-    def __init__(self):
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind(("localhost", 0))
-        self._addr:tuple[str, int] = self._sock.getsockname()
-        self._sock.listen()  # Make sure the socket is listening for connections
-        print(f"Bridge is listening on {self._addr}")
-        self._listner = Thread(target=self.listner_requests, daemon=True)
-        print(f"Bridge is listening on {self._addr}")
-        self._listner.start()
+    '''
+    Registro dos participantes e roteamento das mensagens entre eles.
+
+    Por padrão as duas fases usam maiorias. Com Flexible Paxos, `accept_quorum` (Q2) e
+    `prepare_quorum` (Q1) podem ser configurados separadamente, desde que Q1 + Q2 > N: um Q2 menor
+    reduz os aceites esperados em cada decisão, ao custo de um prepare (raro) com mais acceptors.
+    Se só um deles é dado, o outro é o menor que mantém a interseção.
+
+    Com distinguished_learner=True os aceites vão só para um learner, o de menor porta (assim todos
+    os bridges de um cluster escolhem o mesmo), que conta os votos e envia as decisões aos outros
+    ("chs"): em vez de acceptors × learners aceites por decisão, acceptors + learners mensagens.
+    Se os outros learners deixam de receber as decisões dele ("dls"), o próximo learner assume.
+    '''
+    MEMBERSHIP_DELAY = 0.005  # s entre um registro e o envio da nova configuração
+
+    def __init__(self, transport=None, prepare_quorum:int|None=None, accept_quorum:int|None=None,
+                 distinguished_learner:bool=False):
+        for size in (prepare_quorum, accept_quorum):
+            if size is not None and size < 1:
+                raise ValueError(f"Quorum sizes must be at least 1, got {size}")
+        self.prepare_quorum = prepare_quorum
+        self.accept_quorum  = accept_quorum
+        self.distinguished_learner = distinguished_learner
+
+        # Transporte das mensagens: TCP com conexões persistentes ou a rede em memória do simulador
+        self._transport = transport if transport is not None else TcpTransport()
+        self._addr:tuple[str, int] = self._transport.addr
 
         # Lista dos participantes do paxos. Cada lista recebe as portas dos acceptors, proposers e learners, respectivamente
         self._acceptors:list[int] = []
         self._proposers:list[int] = []
         self._learners:list[int] = []
+        self._suspected:set[int] = set()  # learners que deixaram de enviar as decisões como learner distinto
+        # Versão da configuração: muda a cada entrada ou saída de um nó, e a nova configuração é
+        # enviada a todos os nós registrados, que não precisam mais perguntar o tamanho do quórum
+        self.epoch = 0
+
+        # Outros bridges do mesmo cluster, que compartilham o registro de participantes
+        self._peers:list[int] = []
+
+        # Registros chegam em rajadas (um cluster inteiro subindo): em vez de enviar a configuração
+        # a todos os nós a cada registro, o que custa O(n²) mensagens, o envio é adiado por
+        # MEMBERSHIP_DELAY e cobre todos os registros que chegarem até lá
+        self._push_pending = False
+        self._push_lock    = Lock()
 
         self._paths = {
             "reg": self.register,
@@ -23,110 +74,110 @@ class Bridge:
             "spm": self.send_promise,
             "act": self.send_accept,
             "sad": self.send_accepted,
-            "qrm": self.quorum_size
+            "qrm": self.quorum_size,
+            "cpt": self.send_compact,
+            "mbq": self.send_membership,
+            "drg": self.deregister,
+            "dls": self.suspect
         }
+
+        # Mensagens recebidas por tipo e, no pool, filas e retries de cada destino
+        self.metrics   = Registry(role="bridge", port=self._addr[1])
+        self._received = self.metrics.counters("messages_received", "type", MESSAGE_TYPES)
+        self._unknown  = self.metrics.counter("messages_unknown")
+        for node_type, nodes in (("acceptor", self._acceptors), ("proposer", self._proposers), ("learner", self._learners)):
+            self.metrics.gauge("registered_nodes", nodes.__len__, node_type=node_type)
+
+        log.info("Bridge is listening on %s", self._addr)
+        self._start()
+
+    def _start(self):
+        '''
+        Inicia o envio e a escuta de mensagens
+        '''
+        self._transport.instrument(self.metrics)
+        self._listner = self.listner_requests()
     
     def close(self):
         '''
         Close the socket when done
         '''
-        if self._sock:
-            self._sock.close()
-            print(f"Closed socket at {self._addr}")
+        if self._transport:
+            self._transport.close()
+            log.info("Closed socket at %s", self._addr)
         
-    def handle_client(self, client_socket):
-        '''
-        Handle communication with a single client
-        '''
-        msg = b''  # Initialize msg as an empty byte string
-        try:
-            # Read message byte by byte until '!' is found (end of message)
-            for b in iter(lambda: client_socket.recv(1), b''):
-                if not b:  # If recv() returns empty, connection was closed
-                    print(f"Connection closed by {client_socket.getpeername()}")
-                    break
-                msg += b
-                if b == b'!':  # End of message reached
-                    break
-
-            if not msg:
-                print("Received empty message, closing connection.")
-                return
+    def handle_message(self, port:int, data:list[str]):
+        '''
+        Trata uma mensagem recebida de um nó. `port` é a porta de escuta do nó que enviou
+        '''
+        log.debug("Bridge received: %s from port %s", data, port)
+        self._received[data[0]].inc()
 
-            # Decode and split the message
-            data = msg.decode().strip('!').split(';')
-            print(f"Bridge received: {data} from {client_socket.getpeername()}")
-
-            # Handle 'spp' (node registration) message
-            if data[0] == 'spp':  # If it's a registration message
-                node_type = data[1]
-                try:
-                    port = int(data[2])
-                except IndexError:
-                    port = client_socket.getpeername()[1]
-                if node_type == "PROPOSER":
-                    self._proposers.append(port)
-                    print(f"Registered Proposer at port {port}")
-                elif node_type == "ACCEPTOR":
-                    self._acceptors.append(port)
-                    print(f"Registered Acceptor at port {port}")
-                elif node_type == "LEARNER":
-                    self._learners.append(port)
-                    print(f"Registered Learner at port {port}")
-                else:
-                    print(f"Unknown node type: {node_type}")
-
-            # Handle Paxos protocol messages (prp, prm, act, sad)
-            elif data[0] == 'prp':  # If it's a prepare request
-                self.send_prepare(client_socket.getpeername()[1], data[1])
-            elif data[0] == 'spm':  # Promise message
-                self.send_promise(client_socket.getpeername()[1], *data[1:])
-            elif data[0] == 'act':  # Accept request
-                self.send_accept(client_socket.getpeername()[1], *data[1:])
-            elif data[0] == 'sad':  # Accepted message
-                self.send_accepted(client_socket.getpeername()[1], *data[1:])
+        # Handle 'spp' (node registration) message
+        if data[0] == 'spp':  # If it's a registration message
+            node_type = data[1]
+            if len(data) > 2:
+                port = data[2]
+            if node_type in ("PROPOSER", "ACCEPTOR", "LEARNER"):
+                self.register(port, node_type)
+                log.info("Registered %s at port %s", node_type.capitalize(), port)
+                self.send_message(port, "rga")
+                for peer in self._peers:
+                    self.send_message(peer, "rgs", node_type, port)
             else:
-                print(f"Unknown message type: {data[0]}")
-        except Exception as e:
-            print(f"Error while handling client message: {e}")
-        finally:
-            client_socket.close()
+                log.warning("Unknown node type: %s", node_type)
+        elif data[0] == 'rgs':  # Registro replicado por outro bridge do cluster
+            self.register(data[2], data[1])
+        elif data[0] == 'drg':  # Saída de um nó, enviada por ele ou replicada por outro bridge
+            if port not in self._peers:
+                for peer in self._peers:
+                    self.send_message(peer, "drg", data[1])
+            self.deregister(data[1])
+        elif data[0] == 'dls':  # Learner distinto suspeito, enviado por um learner ou por outro bridge
+            if port not in self._peers:
+                for peer in self._peers:
+                    self.send_message(peer, "dls", data[1])
+            self.suspect(data[1])
+
+        # Handle Paxos protocol messages (prp, prm, act, sad)
+        elif data[0] == 'prp':  # If it's a prepare request
+            self.send_prepare(port, *data[1:])
+        elif data[0] == 'spm':  # Promise message
+            self.send_promise(port, *data[1:])
+        elif data[0] == 'act':  # Accept request
+            self.send_accept(port, *data[1:])
+        elif data[0] == 'sad':  # Accepted message
+            self.send_accepted(port, *data[1:])
+        elif data[0] == 'qrm':
+            self.quorum_size(port)
+        elif data[0] == 'cpt':  # Learner snapshot
+            self.send_compact(port, *data[1:])
+        elif data[0] == 'mbq':  # Membership query (modo direto)
+            self.send_membership(port)
+        else:
+            self._unknown.inc()
+            log.warning("Unknown message type: %s", data[0])
     
     def listner_requests(self):
         '''
-        Escuta todas as requisições que chegam
+        Escuta todas as requisições que chegam. Cada nó mantém uma conexão persistente com o bridge
         '''
-        print("Bridge is now listening for incoming connections...")
-        while True:
-            try:
-                skt, addr = self._sock.accept()  # Accept incoming connections
-                print(f"Accepted connection from {addr}")
-                Thread(target=self.handle_client, args=(skt,), daemon=True).start()
-            except Exception as e:
-                print(f"Error accepting connection: {e}")
+        log.info("Bridge is now listening for incoming connections...")
+        return self._transport.listen(self.handle_message)
 
     def send_message(self, port: int, reqtype: str, *args: str):
         '''
-        Sends messages to other nodes with retries in case of failure
+        Enfileira a mensagem na conexão persistente com o nó; reconexões e retries ficam a cargo do pool
         '''
-        msg = (";".join((reqtype,) + args) + "!").encode()
-        print(f"Bridge sending message: {msg} to port {port}")
-
-        def send():
-            retries = 3
-            while retries > 0:
-                try:
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.connect(("localhost", port))
-                        s.sendall(msg)
-                        print(f"Message sent to node at port {port}: {reqtype}")
-                    break  # Break out of loop if successful
-                except (BrokenPipeError, OSError) as e:
-                    retries -= 1
-                    print(f"Failed to send message to node at port {port}: {e}. Retries left: {retries}")
+        log.debug("Bridge sending message: %s %s to port %s", reqtype, args, port)
+        self._transport.send(port, reqtype, *args)
 
-        Thread(target=send, daemon=True).start()
 
+    def set_peers(self, ports:list[int]):
+        '''
+        Define os outros bridges do cluster, para os quais os registros recebidos são replicados
+        '''
+        self._peers = [port for port in ports if port != self.port]
 
     def register(self, port:int, node_type:str):
         '''
@@ -139,42 +190,160 @@ class Bridge:
             "LEARNER": self._learners
         }
         
+        if port in types[node_type]:
+            if port in self._suspected:  # o learner voltou e se registrou de novo
+                self._suspected.discard(port)
+                self.epoch += 1
+                self.schedule_membership()
+            return
         types[node_type].append(port)
+        self.epoch += 1
+        self.schedule_membership()
 
-    def send_prepare(self, port:int, id_proposal: str):
+    def deregister(self, port:int):
         '''
-        Envia para todos os acceptors uma mensagem de preparação
+        Tira um nó da configuração. Acceptors devem entrar e sair um de cada vez: com maiorias,
+        quóruns de duas configurações seguidas sempre se intersectam
         '''
-        print(f"Bridge routing prepare request from Proposer at port {port} with proposal ID {id_proposal}")
-        for acc_port in self._acceptors:
-            self.send_message(acc_port, "prp", str(port), str(id_proposal))
+        removed = False
+        self._suspected.discard(port)
+        for nodes in (self._acceptors, self._proposers, self._learners):
+            if port in nodes:
+                nodes.remove(port)
+                removed = True
+        if removed:
+            log.info("Removed node at port %s", port)
+            self.epoch += 1
+            self.push_membership()
 
-    def send_promise(self, port:int, prop_port: int, id_proposal:str, previous_id:str, accepted_value:str):
+    def suspect(self, port:int):
         '''
-        Envia uma promessa para um propositor específico
+        Um learner parou de receber as decisões do learner distinto: outro learner passa a ser o
+        distinto. Avisos sobre um learner que já não é o distinto são ignorados
         '''
-        print(f"Bridge routing promise from Acceptor at port {port} to Proposer at port {prop_port}")
-        self.send_message(int(prop_port), "prm", str(port), id_proposal, previous_id, accepted_value)
+        if port != self.distinguished or port in self._suspected:
+            return
+        log.warning("Distinguished Learner at port %s stopped sending decisions", port)
+        self._suspected.add(port)
+        self.epoch += 1
+        self.push_membership()
 
-    def send_accept(self, port:int, id_proposal, proposal_value):
+    def schedule_membership(self):
         '''
-        Envia uma mensagem de aceitação para todos os acceptors
+        Envia a configuração atual a todos os nós depois de MEMBERSHIP_DELAY, se o envio ainda não
+        estiver agendado. Quem pergunta antes ("mbq") já recebe a configuração atual
+        '''
+        with self._push_lock:
+            if self._push_pending:
+                return
+            self._push_pending = True
+        self.call_later(self.MEMBERSHIP_DELAY, self._push_scheduled)
+
+    def _push_scheduled(self):
+        with self._push_lock:
+            self._push_pending = False
+        self.push_membership()
+
+    def call_later(self, delay:float, fn):
+        return self._transport.call_later(delay, fn)
+
+    def push_membership(self):
         '''
-        print(f"Bridge routing accept request for proposal {id_proposal} with value {proposal_value}")
+        Envia a configuração atual a todos os nós registrados
+        '''
+        for port in self._acceptors + self._proposers + self._learners:
+            self.send_membership(port)
+
+    def send_prepare(self, port:int, id_proposal: IdProposta, first_slot: int, epoch:int, round:int):
+        '''
+        Envia para todos os acceptors uma mensagem de preparação para os slots a partir de first_slot
+        '''
+        log.debug("Bridge routing prepare request from Proposer at port %s with proposal ID %s", port, id_proposal)
         for acc_port in self._acceptors:
-            self.send_message(acc_port, "act", id_proposal, proposal_value)
+            self.send_message(acc_port, "prp", port, id_proposal, first_slot, epoch, round)
+
+    def send_promise(self, port:int, prop_port: int, id_proposal:IdProposta, accepted:list, compacted:int, lease_ms:int,
+                     epoch:int, round:int):
+        '''
+        Envia uma promessa (com o lease concedido, em ms, e a versão da configuração do acceptor)
+        para um propositor específico
+        '''
+        log.debug("Bridge routing promise from Acceptor at port %s to Proposer at port %s", port, prop_port)
+        self.send_message(prop_port, "prm", port, id_proposal, accepted, compacted, lease_ms, epoch, round)
 
-    def send_accepted(self, port:int, id_proposal:str, accepted_value: str):
+    def send_accept(self, port:int, id_proposal:IdProposta, slot:int, proposal_value:str|None, epoch:int,
+                    targets:list[int]|None=None):
         '''
-        Envia uma mensagem de aceitação para todos os Learners
+        Envia uma mensagem de aceitação para todos os acceptors, ou só para `targets` quando o
+        proposer escolhe os acceptors (modo thrifty)
         '''
-        print(f"Bridge routing accepted notification for proposal {id_proposal} with value {accepted_value}")
-        for lrn_port in self._learners:
-            self.send_message(lrn_port, "acd", port, id_proposal, accepted_value)
+        log.debug("Bridge routing accept request for proposal %s slot %s with value %s", id_proposal, slot, proposal_value)
+        for acc_port in (self._acceptors if targets is None else targets):
+            self.send_message(acc_port, "act", id_proposal, slot, proposal_value, epoch)
+
+    def send_accepted(self, port:int, id_proposal:IdProposta, slot:int, accepted_value: str|None):
+        '''
+        Envia uma mensagem de aceitação para todos os Learners (ou só para o learner distinto) e
+        para o proposer dono da proposta, que precisa saber quando cada slot foi escolhido
+        '''
+        log.debug("Bridge routing accepted notification for proposal %s slot %s with value %s", id_proposal, slot, accepted_value)
+        distinguished = self.distinguished
+        for lrn_port in (self._learners if distinguished is None else (distinguished,)):
+            self.send_message(lrn_port, "acd", port, id_proposal, slot, accepted_value)
+        self.send_message(id_proposal.porta, "acd", port, id_proposal, slot, accepted_value)
     
+    def send_compact(self, port:int, slot:int):
+        '''
+        Avisa os acceptors que um learner gravou um snapshot de todos os slots abaixo de `slot`
+        '''
+        log.info("Bridge routing compaction below slot %s from Learner at port %s", slot, port)
+        for acc_port in self._acceptors:
+            self.send_message(acc_port, "cpt", slot)
+
+    def send_membership(self, port:int):
+        '''
+        Envia a configuração (versão, listas de participantes, tamanhos dos quóruns das fases 1 e 2 e
+        o learner distinto) para um nó. No modo direto o bridge serve apenas como registro e os nós trocam as mensagens
+        do protocolo entre si
+        '''
+        self.send_message(port, "mbr", self.epoch, list(self._acceptors), list(self._proposers), list(self._learners),
+                          *self.quorums, self.distinguished)
+
+    @property
+    def distinguished(self) -> int|None:
+        '''
+        Learner que recebe os aceites, se distinguished_learner estiver ativo: o de menor porta
+        entre os que não são suspeitos (ou entre todos, se todos forem)
+        '''
+        if not self.distinguished_learner or not self._learners:
+            return None
+        return min((port for port in self._learners if port not in self._suspected), default=min(self._learners))
+
+    @property
+    def majority(self) -> int:
+        return len(self._acceptors) // 2 + 1
+
+    @property
+    def quorums(self) -> tuple[int, int]:
+        '''
+        Tamanhos (Q1, Q2) para os acceptors registrados agora. Enquanto os acceptors se registram
+        os tamanhos configurados são limitados a N; se acceptors forem adicionados além do previsto,
+        Q1 cresce para manter Q1 + Q2 > N
+        '''
+        n = len(self._acceptors)
+        if not n or (self.prepare_quorum is None and self.accept_quorum is None):
+            return self.majority, self.majority
+        q2 = min(self.accept_quorum, n) if self.accept_quorum is not None else None
+        q1 = min(self.prepare_quorum, n) if self.prepare_quorum is not None else n - q2 + 1
+        if q2 is None:
+            q2 = n - q1 + 1
+        if q1 + q2 <= n:
+            log.warning("Quorums %s + %s do not intersect with %s acceptors, using Q1 = %s", q1, q2, n, n - q2 + 1)
+            q1 = n - q2 + 1
+        return max(q1, 1), max(q2, 1)
+
     def quorum_size(self, port:int):
-        q = len(self._acceptors) // 2
-        self.send_message(port, "qrm", str(q))
+        self.send_message(port, "qrm", self.majority)
 
     # def on_resolution(self, port:int, proposal_id, value):
     #     '''
@@ -186,4 +355,5 @@ class Bridge:
         return self._addr[1]
     
     def run(self):
-        print("Running bridge...")
\ No newline at end of file
+        log.info("Running bridge...")
+        self._listner.join()
\ No newline at end of file
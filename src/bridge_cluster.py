@@ -0,0 +1,55 @@
+from .async_bridge import AsyncBridge
+from .bridge import Bridge
+from .sharding import ShardMap
+from .transport import TRANSPORTS
+from multiprocessing import Process, Pipe
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def _serve_bridge(conn, async_bridge:bool, options:dict, transport:str):
+    '''
+    Roda um bridge no processo filho: informa a porta, recebe a lista do cluster e atende até o fim
+    '''
+    options = {**options, "transport": TRANSPORTS[transport]()}
+    bridge = AsyncBridge(**options) if async_bridge else Bridge(**options)
+    conn.send(bridge.port)
+    bridge.set_peers(conn.recv())
+    conn.send(True)
+    bridge.run()
+
+
+class BridgeCluster:
+    '''
+    Vários bridges, cada um em seu próprio processo, que compartilham o registro de participantes
+    e dividem o roteamento. Os nós recebem um ShardMap (ver shards()) e escolhem o bridge de cada
+    mensagem por hash consistente. `transport` é o nome do transporte dos bridges (ver
+    transport.TRANSPORTS), que precisa ser o mesmo dos nós.
+    '''
+    def __init__(self, n:int, async_bridge:bool=False, prepare_quorum:int|None=None, accept_quorum:int|None=None,
+                 distinguished_learner:bool=False, transport:str="tcp"):
+        options = {"prepare_quorum": prepare_quorum, "accept_quorum": accept_quorum,
+                   "distinguished_learner": distinguished_learner}
+        self._procs:list[Process] = []
+        self.ports:list[int] = []
+        conns = []
+        for _ in range(n):
+            parent, child = Pipe()
+            p = Process(target=_serve_bridge, args=(child, async_bridge, options, transport), daemon=True)
+            p.start()
+            self._procs.append(p)
+            self.ports.append(parent.recv())
+            conns.append(parent)
+        for conn in conns:
+            conn.send(self.ports)
+        for conn in conns:
+            conn.recv()
+        log.info("Bridge cluster listening on ports %s", self.ports)
+
+    def shards(self, shard_by:str="proposer", slot_range:int=64) -> ShardMap:
+        return ShardMap(self.ports, shard_by, slot_range)
+
+    def close(self):
+        for p in self._procs:
+            p.terminate()
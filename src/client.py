@@ -0,0 +1,222 @@
+from concurrent.futures import Future
+from threading import Lock
+from .transport import TcpTransport
+from .sharding import ShardMap
+from .metrics import Registry
+from .shm import Segments, share_large, unlink
+from .codec import value_size
+import logging
+import random
+
+log = logging.getLogger(__name__)
+
+
+class Client:
+    '''
+    Cliente que submete valores ao líder e recebe, para cada um, um Future resolvido com o slot em
+    que o valor foi escolhido.
+
+    Cada valor leva o id do cliente e um número de sequência. Os valores sem resposta depois de
+    `timeout` segundos são reenviados, e o mesmo número de sequência garante que um reenvio não é
+    decidido duas vezes: o líder responde de novo em vez de propor outra vez, e os learners
+    aplicam uma vez só um comando que chegou a ser proposto duas vezes (por exemplo por dois
+    líderes). Cada mensagem informa também a menor sequência ainda sem resposta, para que o
+    líder e os learners esqueçam as anteriores.
+
+    O envio não espera a resposta, então um único cliente pode ter milhares de valores em andamento:
+
+        client = Client(bridge_port)
+        futures = client.submit_many(values)
+        slots = [f.result() for f in futures]
+
+    A lista de proposers vem do bridge ("mbq"). Um proposer que não é o líder responde com o líder
+    que conhece ("rdr"); sem resposta por `timeout` segundos, o cliente tenta outro proposer.
+    Com `share_threshold`, os valores grandes vão para a memória compartilhada (ver shm).
+    '''
+    BATCH          = 256   # valores por mensagem enviada ao líder
+    BATCH_BYTES    = 1024 * 1024  # e bytes, aproximados, por mensagem
+    REDIRECT_DELAY = 0.05  # segundos; espera antes de tentar outro proposer quando nenhum indica o líder
+
+    def __init__(self, bridge_port:int|ShardMap, client_id:int|None=None, timeout:float=1.0,
+                 share_threshold:int|None=None, transport=None):
+        # Com milhares de valores em andamento a fila de envio precisa comportar os reenvios
+        self._transport = transport if transport is not None else TcpTransport(queue_size=65536)
+        self._addr:tuple[str, int] = self._transport.addr
+
+        self.shards    = bridge_port if isinstance(bridge_port, ShardMap) else ShardMap([bridge_port])
+        self.bridge    = self.shards.home(self._addr[1])
+        self.client_id = client_id if client_id is not None else random.getrandbits(62)
+        self.timeout   = timeout
+        self.share_threshold = share_threshold
+        self._shared = Segments()  # segmentos de memória compartilhada criados por este cliente
+
+        self._lock = Lock()
+        self._proposers:list[int] = []
+        self._leader:int|None = None
+        self._requests:dict[int, list] = {}  # sequência => [valor, future, enviado em, submetido em]
+        self._next_seq   = 0
+        self._last_reply = self._transport.now()  # última resposta do líder
+        self._closed     = False
+        self._rotating   = False  # um _rotate() já está agendado
+
+        self.metrics = Registry(role="client", port=self._addr[1])
+        self._transport.instrument(self.metrics)
+        self._latency  = self.metrics.histogram("submit_to_chosen_seconds")
+        self._resent   = self.metrics.counter("values_resent")
+        self._redirect = self.metrics.counter("redirects")
+        self.metrics.gauge("values_in_flight", lambda: len(self._requests))
+
+        self._paths = {
+            "mbr": self.recv_membership,
+            "sbr": self.recv_chosen,
+            "rdr": self.recv_redirect
+        }
+        self._transport.listen(self.handle_message)
+        self._transport.send(self.bridge, "mbq")
+        self._transport.call_later(self.timeout / 2, self._tick)
+
+    @property
+    def acked(self) -> int:
+        '''
+        Menor sequência ainda sem resposta; todas as anteriores já foram escolhidas
+        '''
+        return next(iter(self._requests), self._next_seq)
+
+    def submit(self, value) -> Future:
+        '''
+        Envia um valor ao líder e retorna um Future com o slot em que ele for escolhido
+        '''
+        return self.submit_many([value])[0]
+
+    def submit_many(self, values:list) -> list[Future]:
+        '''
+        Envia vários valores de uma vez, em poucas mensagens
+        '''
+        futures = []
+        with self._lock:
+            now = self._transport.now()
+            first = self._next_seq
+            for value in values:
+                future = Future()
+                self._requests[self._next_seq] = [share_large(value, self.share_threshold, self._shared), future, now, now]
+                self._next_seq += 1
+                futures.append(future)
+            self._send(range(first, self._next_seq))
+        return futures
+
+    def _send(self, seqs):
+        '''
+        Envia ao líder os valores das sequências, em lotes de até BATCH valores e BATCH_BYTES.
+        Sem líder conhecido, espera a lista de proposers ou o próximo _tick()
+        '''
+        if self._leader is None:
+            return
+        batch, size = [], 0
+        for seq in seqs:
+            request = self._requests.get(seq)
+            if request is None:
+                continue
+            if batch and (len(batch) == self.BATCH or size + value_size(request[0]) > self.BATCH_BYTES):
+                self._transport.send(self._leader, "sbm", self._addr[1], self.client_id, self.acked, batch)
+                batch, size = [], 0
+            batch.append([seq, request[0]])
+            size += value_size(request[0])
+        if batch:
+            self._transport.send(self._leader, "sbm", self._addr[1], self.client_id, self.acked, batch)
+
+    def handle_message(self, port:int, data:list):
+        log.debug("Client received: %s from port %s", data, port)
+        self._paths[data[0]](*data[1:])
+
+    def recv_membership(self, epoch:int, acceptors:list[int], proposers:list[int], learners:list[int], *_):
+        with self._lock:
+            self._proposers = proposers
+            if self._leader is None and proposers:
+                self._leader = self._transport.random.choice(proposers)
+                self._last_reply = self._transport.now()
+                self._send(list(self._requests))
+
+    def recv_chosen(self, seqs:list[int], slot:int):
+        '''
+        Os valores das sequências foram escolhidos no slot
+        '''
+        done = []
+        with self._lock:
+            now = self._transport.now()
+            self._last_reply = now
+            for seq in seqs:
+                request = self._requests.pop(seq, None)
+                if request is not None:
+                    self._latency.observe(now - request[3])
+                    done.append(request[1])
+        # Fora do lock: os callbacks dos futures podem submeter novos valores
+        for future in done:
+            if not future.done():
+                future.set_result(slot)
+
+    def recv_redirect(self, from_port:int, leader:int|None):
+        '''
+        O proposer não é o líder. Com a indicação de um líder os valores são reenviados a ele; sem
+        ela (por exemplo durante uma eleição), outro proposer é tentado depois de REDIRECT_DELAY
+        '''
+        with self._lock:
+            self._redirect.inc()
+            if from_port != self._leader or leader == self._leader:
+                return  # resposta a um envio antigo
+            if leader is None:
+                if not self._rotating:
+                    self._rotating = True
+                    self._transport.call_later(self.REDIRECT_DELAY, self._rotate)
+                return
+            log.info("Client redirected to leader at port %s", leader)
+            self._leader = leader
+            self._last_reply = self._transport.now()
+            self._send(list(self._requests))
+
+    def _rotate(self):
+        with self._lock:
+            self._rotating = False
+            if self._closed or not self._requests:
+                return
+            self._try_another()
+            self._send(list(self._requests))
+
+    def _try_another(self):
+        others = [port for port in self._proposers if port != self._leader] or self._proposers
+        self._leader = self._transport.random.choice(others)
+        self._last_reply = self._transport.now()
+        log.info("Client trying proposer at port %s", self._leader)
+
+    def _tick(self):
+        '''
+        Reenvia os valores sem resposta há mais de `timeout` segundos; se o líder não respondeu
+        nada nesse tempo, passa a tentar outro proposer
+        '''
+        with self._lock:
+            if self._closed:
+                return
+            now = self._transport.now()
+            if not self._proposers:
+                self._transport.send(self.bridge, "mbq")
+            elif self._requests and now - self._last_reply > self.timeout:
+                self._try_another()
+                self._transport.send(self.bridge, "mbq")  # a lista pode ter mudado
+            late = [seq for seq, request in self._requests.items() if now - request[2] > self.timeout]
+            for seq in late:
+                self._requests[seq][2] = now
+            self._resent.inc(len(late))
+            self._send(late)
+        self._transport.call_later(self.timeout / 2, self._tick)
+
+    def close(self):
+        '''
+        Para os reenvios, cancela os valores ainda sem resposta e remove os segmentos de memória
+        compartilhada que os learners ainda não removeram
+        '''
+        with self._lock:
+            self._closed = True
+            pending, self._requests = self._requests, {}
+        for request in pending.values():
+            request[1].cancel()
+        self._transport.close()
+        unlink(self._shared)
@@ -0,0 +1,231 @@
+'''
+Formato das mensagens trocadas entre os nós e o bridge.
+
+Cada mensagem é um frame: 4 bytes com o tamanho do payload (big endian) seguidos do payload.
+O payload começa com 1 byte identificando o tipo da mensagem, seguido dos campos. Cada campo
+começa com 1 byte de tag indicando o seu tipo, de modo que valores contendo ';' ou '!' não
+precisam de nenhum escape. Um valor em memória compartilhada (shm.SharedValue) é enviado só
+como o handle do segmento, com tamanho fixo qualquer que seja o tamanho do valor.
+'''
+
+from .id_proposta import IdProposta
+from .shm import SharedValue
+import struct
+
+# Tipos de mensagem conhecidos. A posição na tupla é o código enviado no fio
+MESSAGE_TYPES = (
+    "hlo",  # identificação da conexão (porta de escuta de quem envia)
+    "spp",  # registro de um nó no bridge
+    "reg",
+    "prp",  # prepare
+    "spm",  # promise (acceptor -> bridge)
+    "prm",  # promise (bridge -> proposer)
+    "act",  # accept
+    "sad",  # accepted (acceptor -> bridge)
+    "acd",  # accepted (bridge -> learners)
+    "qrm",  # tamanho do quórum
+    "cpt",  # compactação: estado abaixo do slot já está em um snapshot
+    "mbq",  # pedido das listas de participantes (modo direto)
+    "mbr",  # listas de participantes e tamanho do quórum
+    "rgs",  # registro replicado entre bridges de um cluster
+    "ctq",  # pedido de catch-up para outro learner
+    "cts",  # catch-up: pedaço do arquivo de snapshot
+    "ctl",  # catch-up: valores aplicados depois do snapshot
+    "cta",  # catch-up: pedido aos acceptors para reenviar os aceites a partir de um slot
+    "rdq",  # pedido de leitura linearizável (learner -> proposers)
+    "rdi",  # índice de leitura: slot até o qual o learner precisa aplicar antes de responder
+    "rga",  # confirmação do registro (bridge -> nó)
+    "drg",  # saída de um nó da configuração
+    "chs",  # slots escolhidos, do learner distinto para os outros learners
+    "nck",  # recusa de um prepare ou accept, com o maior id prometido pelo acceptor
+    "hbt",  # heartbeat do líder para os outros proposers e os learners
+    "sbm",  # valores submetidos por um cliente (cliente -> proposer)
+    "sbr",  # valores de um cliente escolhidos em um slot (proposer -> cliente)
+    "rdr",  # o proposer não é o líder: indica ao cliente quem é, se souber
+    "cpd",  # accept recusado porque o slot já foi compactado, com o primeiro slot não compactado
+    "dls",  # um learner suspeita que o learner distinto caiu
+)
+_TYPE_CODES = {t: i for i, t in enumerate(MESSAGE_TYPES)}
+
+MAX_FRAME   = 64 * 1024 * 1024
+HEADER_SIZE = 4
+
+_LEN    = struct.Struct(">I")
+_HEADER = struct.Struct(">IB")      # tamanho do frame + tipo da mensagem
+_INT    = struct.Struct(">Bq")
+_BALLOT = struct.Struct(">BQ")      # IdProposta empacotado em 8 bytes
+_SIZED  = struct.Struct(">BI")      # tag + tamanho, para str, bytes e listas
+_SHARED = struct.Struct(">BQ?B")    # tag + tamanho do valor + se é str + tamanho do nome do segmento
+
+_NONE, _INT_TAG, _STR, _BYTES, _BALLOT_TAG, _LIST, _SHARED_TAG = range(7)
+
+
+def _encode_fields(parts:list, args):
+    for arg in args:
+        if arg is None:
+            parts.append(b'\x00')
+        elif isinstance(arg, str):
+            raw = arg.encode()
+            parts.append(_SIZED.pack(_STR, len(raw)))
+            parts.append(raw)
+        elif isinstance(arg, IdProposta):  # antes de int, do qual IdProposta é subclasse
+            parts.append(_BALLOT.pack(_BALLOT_TAG, arg))
+        elif isinstance(arg, int):
+            parts.append(_INT.pack(_INT_TAG, arg))
+        elif isinstance(arg, (bytes, bytearray, memoryview)):
+            parts.append(_SIZED.pack(_BYTES, len(arg)))
+            parts.append(arg)
+        elif isinstance(arg, (list, tuple)):
+            parts.append(_SIZED.pack(_LIST, len(arg)))
+            _encode_fields(parts, arg)
+        elif isinstance(arg, SharedValue):
+            name = arg.name.encode()
+            parts.append(_SHARED.pack(_SHARED_TAG, arg.size, arg.is_str, len(name)))
+            parts.append(name)
+        else:
+            raise TypeError(f"Cannot encode field of type {type(arg).__name__}")
+
+
+def value_size(value) -> int:
+    '''
+    Tamanho aproximado de um valor codificado, para limitar o tamanho dos lotes
+    '''
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return _SIZED.size + len(value)
+    if isinstance(value, (list, tuple)):
+        return _SIZED.size + sum(map(value_size, value))
+    return _SHARED.size + 16
+
+
+def encode(reqtype:str, *args) -> bytes:
+    '''
+    Codifica uma mensagem como um frame pronto para ser enviado
+    '''
+    parts = [b'']
+    _encode_fields(parts, args)
+    size = 1 + sum(map(len, parts))
+    if size > MAX_FRAME:
+        raise ValueError(f"Message of {size} bytes exceeds the maximum frame size")
+    parts[0] = _HEADER.pack(size, _TYPE_CODES[reqtype])
+    return b''.join(parts)
+
+
+def frame_size(header:bytes) -> int:
+    '''
+    Tamanho do payload indicado pelo prefixo de um frame
+    '''
+    (size,) = _LEN.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes exceeds the maximum frame size")
+    return size
+
+
+def _decode_fields(payload, pos:int, end:int, count:int, data:list) -> int:
+    '''
+    Decodifica até `count` campos (ou até o fim do payload, se count for negativo) em `data`
+    e retorna a posição seguinte ao último campo lido
+    '''
+    while count != 0 and pos < end:
+        count -= 1
+        tag = payload[pos]
+        if tag == _NONE:
+            data.append(None)
+            pos += 1
+        elif tag == _STR:
+            _, size = _SIZED.unpack_from(payload, pos)
+            pos += _SIZED.size
+            data.append(str(payload[pos:pos + size], "utf-8"))
+            pos += size
+        elif tag == _INT_TAG:
+            data.append(_INT.unpack_from(payload, pos)[1])
+            pos += _INT.size
+        elif tag == _BALLOT_TAG:
+            data.append(IdProposta.from_packed(_BALLOT.unpack_from(payload, pos)[1]))
+            pos += _BALLOT.size
+        elif tag == _BYTES:
+            _, size = _SIZED.unpack_from(payload, pos)
+            pos += _SIZED.size
+            data.append(bytes(payload[pos:pos + size]))
+            pos += size
+        elif tag == _LIST:
+            _, size = _SIZED.unpack_from(payload, pos)
+            items = []
+            pos = _decode_fields(payload, pos + _SIZED.size, end, size, items)
+            data.append(items)
+        elif tag == _SHARED_TAG:
+            _, size, is_str, length = _SHARED.unpack_from(payload, pos)
+            pos += _SHARED.size
+            data.append(SharedValue(str(payload[pos:pos + length], "ascii"), size, is_str))
+            pos += length
+        else:
+            raise ValueError(f"Unknown field tag {tag}")
+    if count > 0:
+        raise ValueError("Truncated list field")
+    return pos
+
+
+def decode(payload) -> list:
+    '''
+    Decodifica o payload de um frame (sem o prefixo de tamanho) em [tipo, *campos]
+    '''
+    data = [MESSAGE_TYPES[payload[0]]]
+    _decode_fields(payload, 1, len(payload), -1, data)
+    return data
+
+
+class FrameReader:
+    '''
+    Lê frames de um socket usando um único buffer reaproveitado (recv_into), em vez de um recv por byte
+    '''
+    def __init__(self, skt, buffer_size:int=64 * 1024, on_idle=None):
+        self._skt     = skt
+        self._on_idle = on_idle  # chamado quando todas as mensagens já recebidas foram lidas
+        self._buf     = bytearray(buffer_size)
+        self._view    = memoryview(self._buf)
+        self._start   = 0
+        self._end     = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> list:
+        while True:
+            available = self._end - self._start
+            if available >= _LEN.size:
+                (size,) = _LEN.unpack_from(self._buf, self._start)
+                if size > MAX_FRAME:
+                    raise ValueError(f"Frame of {size} bytes exceeds the maximum frame size")
+                total = _LEN.size + size
+                if available >= total:
+                    begin = self._start + _LEN.size
+                    self._start += total
+                    return decode(self._view[begin:begin + size])
+                self._reserve(total)
+            elif self._start == self._end:
+                self._start = self._end = 0
+            if self._on_idle is not None:
+                self._on_idle()
+            self._fill()
+
+    def _reserve(self, total:int):
+        '''
+        Garante espaço contíguo no buffer para um frame de `total` bytes
+        '''
+        if self._start + total <= len(self._buf):
+            return
+        pending = self._end - self._start
+        if total > len(self._buf):
+            buf = bytearray(max(total, 2 * len(self._buf)))
+            buf[:pending] = self._view[self._start:self._end]
+            self._buf, self._view = buf, memoryview(buf)
+        else:
+            self._buf[:pending] = self._buf[self._start:self._end]
+        self._start, self._end = 0, pending
+
+    def _fill(self):
+        if self._end == len(self._buf):
+            self._reserve(len(self._buf) - self._start + 1)
+        n = self._skt.recv_into(self._view[self._end:])
+        if n == 0:
+            raise StopIteration
+        self._end += n
@@ -0,0 +1,202 @@
+from .codec import FrameReader, encode
+from queue import Queue, Full, Empty
+from threading import Thread, Lock
+import logging
+import socket
+import time
+import os
+
+log = logging.getLogger(__name__)
+
+# Primeira mensagem enviada em cada conexão persistente: identifica a porta de escuta de quem envia
+HELLO = "hlo"
+
+
+def tcp_address(port:int) -> tuple[str, int]:
+    return ("localhost", port)
+
+
+def connect(address:tuple[str, int]|str) -> socket.socket:
+    '''
+    Abre uma conexão para um endereço TCP (host, porta) ou para o caminho de um socket AF_UNIX
+    '''
+    if isinstance(address, str):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(address)
+        except OSError:
+            s.close()
+            raise
+        return s
+    s = socket.create_connection(address)
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return s
+
+
+def handle_connection(skt:socket.socket, addr:tuple[str, int], handler, on_idle=None):
+    '''
+    Atende uma conexão persistente, chamando handler(peer_port, data) para cada mensagem e
+    on_idle() sempre que as mensagens já recebidas acabam, antes de esperar por mais dados
+    '''
+    peer = addr[1] if isinstance(addr, tuple) else None  # AF_UNIX: só o "hlo" identifica quem envia
+    try:
+        for data in FrameReader(skt, on_idle=on_idle):
+            if data[0] == HELLO:
+                peer = data[1]
+                continue
+            try:
+                handler(peer, data)
+            except Exception as e:
+                log.exception("Error while handling message %s from port %s: %s", data, peer, e)
+    except (OSError, ValueError) as e:
+        log.warning("Connection from port %s failed: %s", peer, e)
+    finally:
+        skt.close()
+
+
+def serve(sock:socket.socket, handler, on_idle=None):
+    '''
+    Aceita conexões e atende cada uma em uma thread própria enquanto ela estiver aberta
+    '''
+    while True:
+        try:
+            skt, addr = sock.accept()
+        except OSError as e:
+            if sock.fileno() == -1:
+                return  # socket fechado
+            log.error("Error accepting connection: %s", e)
+            continue
+        Thread(target=handle_connection, args=(skt, addr, handler, on_idle), daemon=True).start()
+
+
+class _Channel:
+    '''
+    Conexão persistente para um único destino, alimentada por uma fila limitada
+    '''
+    def __init__(self, port:int, address, local_port:int|None, queue_size:int, retries:int, metrics=None):
+        self.port = port
+        self._address = address
+        self._hello = encode(HELLO, local_port) if local_port is not None else b''
+        self._queue:Queue = Queue(queue_size)
+        self._retries = retries
+        self._sock:socket.socket|None = None
+        self._closed = False
+        self._retried = self._dropped = None
+        if metrics is not None:
+            self._retried = metrics.counter("send_retries", peer=port)
+            self._dropped = metrics.counter("send_dropped", peer=port)
+            # Depois de um fork o gauge já existe e passa a ler a fila do novo canal
+            metrics.gauge("send_queue_depth", self._queue.qsize, peer=port).read = self._queue.qsize
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, msg:bytes, timeout:float) -> bool:
+        try:
+            self._queue.put(msg, timeout=timeout)
+            return True
+        except Full:
+            log.warning("Outbound queue to port %s is full, dropping message", self.port)
+            if self._dropped is not None:
+                self._dropped.inc()
+            return False
+
+    def close(self):
+        self._closed = True
+        try:
+            self._queue.put_nowait(b'')
+        except Full:
+            pass
+
+    def _connect(self) -> socket.socket:
+        s = connect(self._address)
+        if self._hello:
+            s.sendall(self._hello)
+        return s
+
+    def _write(self, data:bytes):
+        '''
+        Envia os dados pela conexão atual, reconectando em caso de falha
+        '''
+        retries = self._retries
+        while True:
+            try:
+                if self._sock is None:
+                    self._sock = self._connect()
+                self._sock.sendall(data)
+                return
+            except OSError as e:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                retries -= 1
+                log.warning("Failed to send message to node at port %s: %s. Retries left: %s", self.port, e, retries)
+                if retries <= 0:
+                    if self._dropped is not None:
+                        self._dropped.inc()
+                    return
+                if self._retried is not None:
+                    self._retried.inc()
+                time.sleep(0.05 * (self._retries - retries))
+
+    def _run(self):
+        while not self._closed:
+            batch = [self._queue.get()]
+            # Junta o que já estiver na fila em uma única escrita
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            data = b''.join(batch)
+            if data:
+                self._write(data)
+        if self._sock is not None:
+            self._sock.close()
+
+
+class ConnectionPool:
+    '''
+    Mantém uma conexão persistente por porta de destino. Cada destino tem uma fila de
+    saída limitada e uma única thread de envio, em vez de uma conexão e uma thread por mensagem.
+    Com um Registry em `metrics`, cada destino ganha contadores de retries e descartes e um
+    gauge com o tamanho da fila. `address(porta)` dá o endereço de cada destino: TCP em
+    localhost por padrão, ou o caminho de um socket AF_UNIX (ver transport.UnixTransport).
+    '''
+    def __init__(self, local_port:int|None=None, queue_size:int=1024, retries:int=3, put_timeout:float=1.0, metrics=None,
+                 address=tcp_address):
+        self._address     = address
+        self._local_port  = local_port
+        self._queue_size  = queue_size
+        self._retries     = retries
+        self._put_timeout = put_timeout
+        self.metrics      = metrics
+        self._channels:dict[int, _Channel] = {}
+        self._lock = Lock()
+        self._pid  = os.getpid()
+
+    def send(self, port:int, reqtype:str, *args) -> bool:
+        '''
+        Enfileira uma mensagem para o destino. Retorna False se a fila estiver cheia
+        '''
+        return self._channel(port).put(encode(reqtype, *args), self._put_timeout)
+
+    def _channel(self, port:int) -> _Channel:
+        if self._pid != os.getpid():
+            # Depois de um fork as threads de envio não existem no processo filho
+            self._channels = {}
+            self._lock = Lock()
+            self._pid  = os.getpid()
+        channel = self._channels.get(port)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.get(port)
+                if channel is None:
+                    channel = _Channel(port, self._address(port), self._local_port, self._queue_size, self._retries, self.metrics)
+                    self._channels[port] = channel
+        return channel
+
+    def close(self):
+        with self._lock:
+            for channel in self._channels.values():
+                channel.close()
+            self._channels = {}
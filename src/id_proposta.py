@@ -1,28 +1,73 @@
-class IdProposta:
-    def __init__(self, id:int, porta:int):
-        self._id = id
-        self._porta = porta
-    
+'''
+Número de proposta (ballot) de Paxos.
+
+O par (id, porta) é empacotado em um único inteiro, (id << 16) | porta, e IdProposta é uma
+subclasse de int: comparações, hash e uso como chave de dicionário são operações de inteiro.
+A ordem é total: primeiro pela rodada (id) e, em caso de empate, pela porta do proposer.
+'''
+
+PORT_BITS = 16
+PORT_MAX  = (1 << PORT_BITS) - 1
+ROUND_MAX = (1 << (64 - PORT_BITS)) - 1
+
+_INTERN_LIMIT = 4096
+
+
+class IdProposta(int):
+    __slots__ = ()
+
+    _interned:dict = {}  # inteiro empacotado ou texto "id:porta" => IdProposta
+    _text:dict     = {}  # IdProposta => texto "id:porta"
+
+    def __new__(cls, id:int, porta:int):
+        if not 0 <= id <= ROUND_MAX or not 0 <= porta <= PORT_MAX:
+            raise ValueError(f"Invalid proposal id {id}:{porta}")
+        return int.__new__(cls, (id << PORT_BITS) | porta)
+
+    @classmethod
+    def _intern(cls, key, ballot:"IdProposta") -> "IdProposta":
+        if len(cls._interned) >= _INTERN_LIMIT:
+            cls._interned.clear()
+            cls._text.clear()
+        cls._interned[key] = ballot
+        return ballot
+
+    @classmethod
+    def from_packed(cls, packed:int) -> "IdProposta":
+        '''
+        IdProposta a partir do inteiro empacotado, reaproveitando instâncias já criadas
+        '''
+        ballot = cls._interned.get(packed)
+        if ballot is None:
+            ballot = cls._intern(packed, cls(packed >> PORT_BITS, packed & PORT_MAX))
+        return ballot
+
+    @classmethod
+    def parse(cls, text:str) -> "IdProposta":
+        '''
+        IdProposta a partir do formato textual "id:porta"
+        '''
+        ballot = cls._interned.get(text)
+        if ballot is None:
+            id, porta = text.split(':')
+            ballot = cls._intern(text, cls.from_packed((int(id) << PORT_BITS) | int(porta)))
+        return ballot
+
     def __str__(self):
-        return f"{self._id}:{self._porta}"
-    
-    def __lt__(self, value) -> bool:
-        return self._id*self._porta < value._id*value._porta
-    
-    def __gt__(self, value) -> bool:
-        return self._id*self._porta > value._id*value._porta
-    
-    def __eq__(self, value) -> bool:
-        return self._id*self._porta == value._id*value._porta
-    
-    def __ne__(self, value) -> bool:
-        return not self.__eq__(value)
-    
+        text = self._text.get(self)
+        if text is None:
+            text = self._text[self] = f"{self >> PORT_BITS}:{self & PORT_MAX}"
+        return text
+
+    __repr__ = __str__
+
+    def __reduce__(self):
+        return (IdProposta, (self.id, self.porta))
+
     @property
-    def id(self):
-        return self._id
-    
+    def id(self) -> int:
+        return self >> PORT_BITS
+
     @property
-    def porta(self):
-        return self._porta
-    
\ No newline at end of file
+    def porta(self) -> int:
+        return self & PORT_MAX
@@ -0,0 +1,228 @@
+from .acceptor import Acceptor
+from .proposer import Proposer
+from .learner import Learner
+from .bridge import Bridge, check_quorums
+from .async_bridge import AsyncBridge
+from .bridge_cluster import BridgeCluster
+from .transport import TRANSPORTS
+from .shm import unlink
+from multiprocessing import Process, Pipe
+import tempfile
+import logging
+import shutil
+import time
+import os
+
+log = logging.getLogger(__name__)
+
+ROLES = {"acceptor": Acceptor, "proposer": Proposer, "learner": Learner}
+
+
+def _create(specs:list[tuple[int, str]], route, direct:bool, options:dict, values:list, timeout:float,
+            transport:str) -> list:
+    '''
+    Cria os nós, com as opções de cada papel em `options` e um transporte do tipo `transport`
+    cada, começa a escutar e espera o bridge confirmar o registro de todos. Com "snapshot_dir"
+    nas opções dos learners, cada learner grava o seu snapshot em um arquivo desse diretório
+    '''
+    nodes = []
+    for index, role in specs:
+        kwargs = dict(options.get(role, {}))
+        snapshot_dir = kwargs.pop("snapshot_dir", None)
+        if snapshot_dir is not None:
+            kwargs["snapshot_path"] = os.path.join(snapshot_dir, f"learner-{index}.snapshot")
+        node = ROLES[role](route, direct=direct, transport=TRANSPORTS[transport](), **kwargs)
+        if role == "proposer":
+            for value in values:
+                node.propose(value)
+        node.listen()
+        nodes.append(node)
+    deadline = time.monotonic() + timeout
+    for node in nodes:
+        if not node.wait_registered(max(deadline - time.monotonic(), 0)):
+            raise TimeoutError(f"Bridge did not confirm the registration of the node at port {node._addr[1]}")
+    return nodes
+
+
+def _start(specs:list[tuple[int, str]], nodes:list, roles:tuple[str, ...], setup):
+    for (index, role), node in zip(specs, nodes):
+        if role in roles:
+            if setup is not None:
+                setup(node, index)
+            node.start()
+
+
+def _close(nodes:list):
+    '''
+    Remove os segmentos de memória compartilhada que os proposers criaram e que os learners ainda
+    não removeram, e fecha os learners (e os arquivos temporários de snapshot deles)
+    '''
+    for node in nodes:
+        if isinstance(node, Proposer):
+            unlink(node.shared)
+        elif isinstance(node, Learner):
+            node.close()
+
+
+def _worker(conn, specs:list[tuple[int, str]], route, direct:bool, options:dict, values:list, timeout:float,
+            transport:str, cpu:int|None, setup):
+    '''
+    Processo com vários nós: cria todos, avisa o processo principal quando estiverem registrados
+    e inicia cada papel quando for pedido
+    '''
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    try:
+        nodes = _create(specs, route, direct, options, values, timeout, transport)
+    except Exception as e:
+        conn.send(("error", repr(e)))
+        return
+    conn.send(("ready", [(role, node._addr[1]) for (_, role), node in zip(specs, nodes)]))
+    try:
+        while True:
+            try:
+                command, *args = conn.recv()
+            except (EOFError, KeyboardInterrupt):
+                return  # o processo principal terminou ou o Ctrl-C chegou a todo o grupo de processos
+            if command == "stop":
+                return
+            _start(specs, nodes, args[0], setup)
+            conn.send(("started",))
+    finally:
+        _close(nodes)  # o atexit não roda no fim de um processo do multiprocessing
+
+
+class Cluster:
+    '''
+    Sobe um cluster completo sem sleeps fixos: o bridge (ou um BridgeCluster), e os acceptors,
+    learners e proposers distribuídos em `processes` processos, vários nós por processo.
+
+    A partida segue confirmações explícitas: cada nó espera o bridge confirmar o seu registro
+    ("rga"); depois que todos os nós estão registrados, os acceptors e learners são iniciados e só
+    então os proposers, que assim já encontram o quórum completo ao fazer o prepare.
+
+    Com processes=0 os nós rodam no próprio processo (em threads) e ficam acessíveis em `nodes`.
+    Com pin=True cada processo é fixado em uma CPU, em rodízio entre as CPUs disponíveis.
+    `setup(node, index)` é chamado no processo de cada nó antes de ele ser iniciado, por exemplo
+    para expor as métricas. `prepare_quorum` e `accept_quorum` configuram os quóruns das fases 1 e
+    2 (Flexible Paxos, ver Bridge) e são validados aqui, antes de qualquer processo ser criado.
+    Com thrifty=True os proposers enviam cada accept só a um quórum (ver Proposer), e com
+    distinguished_learner=True só um learner recebe os aceites e repassa as decisões (ver Bridge).
+    Com transport="unix" o bridge e os nós usam sockets AF_UNIX (ver transport.UnixTransport), e
+    com `share_threshold` os proposers colocam os valores grandes em memória compartilhada e só os
+    handles passam pelo bridge (ver shm).
+
+    Com `snapshot_dir` cada learner grava um snapshot em `snapshot_dir` a cada `snapshot_every`
+    slots aplicados (ver Learner); ao reiniciar o cluster com o mesmo diretório, os learners
+    carregam os snapshots. Os learners só removem os segmentos de memória compartilhada depois dos
+    snapshots, então com `share_threshold` e sem `snapshot_dir` os snapshots vão para um
+    diretório temporário, removido por close().
+    '''
+    def __init__(self, acceptors:int=3, proposers:int=1, learners:int=1, values:list|None=None, processes:int=1,
+                 pin:bool=False, direct:bool=False, async_bridge:bool=False, bridges:int=1, timeout:float=10.0, setup=None,
+                 prepare_quorum:int|None=None, accept_quorum:int|None=None, thrifty:bool=False,
+                 distinguished_learner:bool=False, transport:str="tcp", share_threshold:int|None=None,
+                 snapshot_dir:str|None=None, snapshot_every:int=1000):
+        check_quorums(acceptors, prepare_quorum, accept_quorum)
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport!r}, expected one of {sorted(TRANSPORTS)}")
+        self.specs     = list(enumerate(["acceptor"] * acceptors + ["learner"] * learners + ["proposer"] * proposers))
+        self.values    = values or []
+        self.processes = processes
+        self.pin       = pin
+        self.direct    = direct
+        self._temp_dir = None
+        if snapshot_dir is None and share_threshold is not None:
+            snapshot_dir = self._temp_dir = tempfile.mkdtemp(prefix="pyxos-cluster-")
+        self.options   = {"proposer": {"thrifty": thrifty, "share_threshold": share_threshold}}
+        if snapshot_dir is not None:
+            self.options["learner"] = {"snapshot_dir": snapshot_dir, "snapshot_every": snapshot_every}
+        self.transport = transport
+        self.timeout   = timeout
+        self.setup     = setup
+
+        self.bridge:Bridge|None = None
+        self.bridge_cluster:BridgeCluster|None = None
+        if bridges > 1:
+            self.bridge_cluster = BridgeCluster(bridges, async_bridge, prepare_quorum, accept_quorum, distinguished_learner,
+                                                transport)
+            self.route = self.bridge_cluster.shards()
+        else:
+            quorums = {"prepare_quorum": prepare_quorum, "accept_quorum": accept_quorum,
+                       "distinguished_learner": distinguished_learner, "transport": TRANSPORTS[transport]()}
+            self.bridge = AsyncBridge(**quorums) if async_bridge else Bridge(**quorums)
+            self.route  = self.bridge.port
+
+        self.nodes:list = []  # só com processes=0
+        self.ports:dict[str, list[int]] = {role: [] for role in ROLES}
+        self._procs:list[Process] = []
+        self._conns = []
+
+    def start(self) -> "Cluster":
+        started = time.monotonic()
+        if self.processes == 0:
+            self.nodes = _create(self.specs, self.route, self.direct, self.options, self.values, self.timeout,
+                                 self.transport)
+            for (_, role), node in zip(self.specs, self.nodes):
+                self.ports[role].append(node._addr[1])
+            _start(self.specs, self.nodes, ("acceptor", "learner"), self.setup)
+            _start(self.specs, self.nodes, ("proposer",), self.setup)
+        else:
+            cpus = sorted(os.sched_getaffinity(0)) if self.pin else []
+            for i in range(self.processes):
+                specs = self.specs[i::self.processes]
+                if not specs:
+                    continue
+                parent, child = Pipe()
+                cpu = cpus[i % len(cpus)] if cpus else None
+                p = Process(target=_worker, daemon=True,
+                            args=(child, specs, self.route, self.direct, self.options, self.values, self.timeout,
+                                  self.transport, cpu, self.setup))
+                p.start()
+                self._procs.append(p)
+                self._conns.append(parent)
+            for conn in self._conns:
+                for role, port in self._reply(conn, "ready"):
+                    self.ports[role].append(port)
+            self._command(("start", ("acceptor", "learner")))
+            self._command(("start", ("proposer",)))
+        log.info("Cluster with %s acceptors, %s learners and %s proposers started in %.1f ms",
+                 len(self.ports["acceptor"]), len(self.ports["learner"]), len(self.ports["proposer"]),
+                 (time.monotonic() - started) * 1000)
+        return self
+
+    def _command(self, command:tuple):
+        for conn in self._conns:
+            conn.send(command)
+        for conn in self._conns:
+            self._reply(conn, "started")
+
+    def _reply(self, conn, expected:str):
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"Node process did not answer {expected!r} in {self.timeout}s")
+        kind, *args = conn.recv()
+        if kind == "error":
+            raise RuntimeError(f"Node process failed to start: {args[0]}")
+        return args[0] if args else None
+
+    def join(self):
+        for p in self._procs:
+            p.join()
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send(("stop",))
+            except OSError:
+                pass
+        for p in self._procs:
+            p.join(1.0)
+            if p.is_alive():
+                p.terminate()
+        _close(self.nodes)
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+        if self.bridge is not None:
+            self.bridge.close()
+        if self.bridge_cluster is not None:
+            self.bridge_cluster.close()
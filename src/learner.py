@@ -1,120 +1,572 @@
-from threading import Thread
+from threading import Lock, Event, Condition
 from .id_proposta import IdProposta
-import socket
+from .sharding import ShardMap
+from .node import Node
+from .snapshot import Snapshot, install
+from .tally import QuorumTally
+from .codec import MESSAGE_TYPES
+from .shm import SharedValue
+import tempfile
+import logging
+import os
 
+log = logging.getLogger(__name__)
 
-class Learner:
-    def __init__(self, bridge_port: int):
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind(("localhost", 0))  # Bind the acceptor socket
-        self._addr:tuple[str, int] = self._sock.getsockname()
 
-        self.bridge_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.bridge_socket.connect(("localhost", bridge_port))  # Establish a connection to the bridge
-        
-        self._listner = Thread(target=self.listner_requests, daemon=True)
-        self.bridge = bridge_port
+class Learner(Node):
+    ROLE            = "LEARNER"
+    CATCHUP_CHUNK   = 1024 * 1024  # bytes do snapshot por mensagem de catch-up
+    CATCHUP_ENTRIES = 4096         # valores do log (ou aceites, dos acceptors) por mensagem de catch-up
+    SESSION_PRUNE   = 1024         # sequências guardadas por cliente antes de descartar as já confirmadas
+
+    def __init__(self, bridge_port: int|ShardMap, snapshot_path:str|None=None, snapshot_every:int=1000, direct:bool=False,
+                 catchup_lag:int=256, catchup_timeout:float=5.0, transport=None):
+        super().__init__(bridge_port, direct, transport)
+
+        # Learner distinto: só ele recebe os aceites e conta os votos, e envia as decisões aos outros
+        self._distinguished:int|None = None
+        self._last_chosen = self._transport.now()  # últimas decisões ("chs") recebidas do learner distinto
+        # No modo direto cada acceptor envia os aceites pela sua própria conexão
+        self._lock = Lock()
+        self._applied = Condition(self._lock)  # avisado quando next_apply avança
+
+        self.quorum_size = None
+        self.decisions:dict[int, str|list|None]     = {}  # slot => valor escolhido e ainda não aplicado
+        self.next_apply                             = 0   # próximo slot a ser aplicado
+        self.log:list[str]                          = []  # valores aplicados depois do último snapshot, em ordem
+        # Sessões dos clientes (ver client.Client): id => [menor sequência que o cliente ainda espera,
+        # sequências já aplicadas a partir dela, limite para a próxima limpeza]. Um comando
+        # reproposto depois de um reenvio do cliente é escolhido de novo, mas aplicado uma vez só
+        self.sessions:dict[int, list] = {}
+        # Valores em memória compartilhada (ver shm) aplicados desde o último snapshot e entre os
+        # dois últimos; os segmentos destes são removidos no próximo snapshot
+        self._shared:list[SharedValue]     = []
+        self._releasable:list[SharedValue] = []
+
+        # Snapshot dos valores aplicados; o estado abaixo dele é descartado aqui e nos acceptors
+        self.snapshot_path  = snapshot_path
+        self.snapshot_every = snapshot_every  # slots aplicados entre dois snapshots
+        self.snapshot:Snapshot|None = None
+        self._temp_snapshot:str|None = None  # sem snapshot_path: arquivo do snapshot recebido no catch-up
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.snapshot   = Snapshot(snapshot_path)
+            self.next_apply = self.snapshot.next_slot
+            self._load_sessions(self.snapshot.sessions())
+            log.info("Learner loaded snapshot with %s values up to slot %s", len(self.snapshot), self.next_apply)
+
+        # Votos dos slots ainda não decididos, a partir de next_apply
+        self.tally = QuorumTally(base=self.next_apply)
 
-        quorum_size       = None
-        proposals         = None # maps proposal_id => [accept_count, retain_count, value]
-        acceptors         = None # maps from_uid => last_accepted_proposal_id
-        final_value       = None
-        final_proposal_id = None
+        # Catch-up: um learner que começou depois dos outros ou perdeu aceites copia o estado de
+        # outro learner, primeiro o arquivo de snapshot e depois os valores aplicados após ele
+        self.catchup_lag     = catchup_lag      # slots decididos à frente de next_apply que disparam o catch-up
+        self.catchup_timeout = catchup_timeout  # segundos sem resposta até tentar outro learner
+        self._catchup:dict|None = None          # transferência em andamento
+        self._heartbeat_apply = -1              # next_apply no último heartbeat do líder
+        # Learners que não responderam; voltam a ser usados quando enviam algo ou quando não resta outro
+        self._unresponsive:set[int] = set()
+
+        # Leituras linearizáveis: id => [evento, índice de leitura recebido do líder]
+        self._reads:dict[int, list] = {}
+        self._next_read = 0
 
         self._paths = {
             "acd": self.recv_accepted,
-            "qrm": self.set_quorum
+            "qrm": self.set_quorum,
+            "mbr": self.set_membership,
+            "chs": self.recv_chosen,
+            "hbt": self.recv_heartbeat,
+            "ctq": self.recv_catch_up_request,
+            "cts": self.recv_snapshot_chunk,
+            "ctl": self.recv_log_chunk,
+            "rdi": self.recv_read_index,
+            "rga": self.set_registered
         }
 
-        self.send_message_to_bridge("spp", "LEARNER", str(self._addr[1]))
+        self._received     = self.metrics.counters("messages_received", "type", MESSAGE_TYPES)
+        self._applied_vals = self.metrics.counter("values_applied")
+        self._catch_ups    = self.metrics.counter("catch_ups")
+        self._duplicates   = self.metrics.counter("client_duplicates")
+        self.metrics.gauge("next_apply", lambda: self.next_apply)
+        self.metrics.gauge("decisions_waiting", lambda: len(self.decisions))
+
+        self.register()
+
+    def set_membership(self, epoch:int, acceptors:list[int], proposers:list[int], learners:list[int],
+                       prepare_quorum:int, accept_quorum:int, distinguished:int|None=None):
+        super().set_membership(epoch, acceptors, proposers, learners, prepare_quorum, accept_quorum, distinguished)
+        if self._catchup is not None and self._catchup["peer"] is None:
+            self._start_catch_up()
 
-    def send_message_to_bridge(self, reqtype:str, *args:str):
+    def _reconfigure(self, departed:set[int], prepare_quorum:int, accept_quorum:int, distinguished:int|None):
         '''
-        Envia mensagens para o bridge
+        Os votos dos acceptors que saíram são descartados; o learner só conta aceites, então usa
+        apenas o quórum da fase 2
         '''
-        msg = (";".join((reqtype,)+args)+"!").encode()
-        print(f"Learner sending message to bridge: {msg}")
+        for port in departed:
+            self.tally.remove(port)
+        if distinguished != self._distinguished:
+            self._last_chosen = self._transport.now()
+        self._distinguished = distinguished
+        self.set_quorum(accept_quorum)
 
-        def send():
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect(("localhost", self.bridge))
-                    s.sendall(msg)
-                    print(f"Learner message sent to bridge: {msg}")
-            except (BrokenPipeError, OSError) as e:
-                print(f"Failed to send message to bridge at port {self.bridge}: {e}")
+    def handle_message(self, port:int, data:list[str]):
+        log.debug("Learner received: %s from port %s", data, port)
+        self._received[data[0]].inc()
+        with self._lock:
+            if port in self._unresponsive:
+                self._unresponsive.discard(port)
+            self._paths[data[0]](*data[1:])
+
+    def recv_accepted(self, from_port, proposal_id, slot, accepted_value):
+        '''
+        Called when an Accepted message is received from an acceptor
+        '''
+        log.debug("Learner received accepted value %s for proposal %s slot %s from Acceptor at port %s",
+                  accepted_value, proposal_id, slot, from_port)
         
-        Thread(target=send, daemon=True).start()
+        if slot < self.next_apply or slot in self.decisions:
+            return # already done
+        if self._members and from_port not in self._members:
+            return # acceptor fora da configuração atual
+
+        # Registra o voto (mensagens antigas são ignoradas); os slots decididos são aplicados em
+        # flush(), uma vez para todos os aceites já recebidos
+        self.tally.add(slot, from_port, proposal_id, accepted_value)
 
-    def listner_requests(self):
+    def recv_chosen(self, chosen:list[tuple[int, object]]):
         '''
-        Escuta todas as requisições que chegam
+        Decisões enviadas pelo learner distinto; são aplicadas em flush(), como as do tally
         '''
-        self._sock.listen()
-        while True:
-            skt, addr = self._sock.accept()
-            msg = b''
-            for b in iter(lambda: skt.recv(1), b'!'):
-                msg += b
-            data = msg.decode().split(';')
-            print(f"Learner received: {data} from {addr}")
-            self._paths[data[0]](*data[1:])
+        self._last_chosen = self._transport.now()
+        for slot, value in chosen:
+            if slot >= self.next_apply:
+                self.decisions[slot] = value
+
+    def recv_heartbeat(self, proposal_id:IdProposta, commit_index:int, epoch:int):
+        '''
+        Heartbeat do líder, com o slot seguinte ao maior slot escolhido. Se este learner está atrás
+        e não avançou desde o heartbeat anterior, os aceites dos últimos slots se perderam e não há
+        decisões depois deles para revelar o buraco: começa o catch-up
+        '''
+        self.check_epoch(epoch)
+        stalled = self.next_apply == self._heartbeat_apply
+        self._heartbeat_apply = self.next_apply
+        if stalled and commit_index > self.next_apply and self._distinguished not in (None, self._addr[1]) \
+                and self._transport.now() - self._last_chosen > self.catchup_timeout:
+            # O líder continua escolhendo slots e o learner distinto não envia decisões há muito
+            # tempo: o bridge escolhe outro, e o catch-up abaixo recupera os slots perdidos
+            log.warning("Learner suspects distinguished Learner at port %s", self._distinguished)
+            self.send_message_to_bridge("dls", self._distinguished)
+            self._unresponsive.add(self._distinguished)
+            self._last_chosen = self._transport.now()
+        if stalled and commit_index > self.next_apply:
+            if self._catchup is None or self._transport.now() - self._catchup["updated"] > self.catchup_timeout:
+                log.info("Learner stalled at slot %s, leader has chosen up to %s", self.next_apply, commit_index - 1)
+                self.catch_up()
+
+    def flush(self):
+        '''
+        Chamado quando não há mais mensagens recebidas esperando em uma conexão
+        '''
+        with self._lock:
+            if self.quorum_size is not None:
+                self.decide()
+
+    def decide(self):
+        '''
+        Recolhe todos os slots que atingiram o quórum desde a última chamada e aplica as decisões
+        em ordem
+        '''
+        chosen = self.tally.collect()
+        for slot, value in chosen:
+            self.decisions[slot] = value
+            log.debug("Learner reached consensus on value %s for slot %s", value, slot)
+        if chosen and self._distinguished == self._addr[1]:
+            # Uma única mensagem por learner com todas as decisões desta passada
+            for port in self._learners:
+                if port != self._addr[1]:
+                    self._transport.send(port, "chs", chosen)
+        self.apply_decided()
+
+        if self.decisions and max(self.decisions) - self.next_apply >= self.catchup_lag:
+            # Há slots decididos bem à frente de um buraco: os aceites do buraco foram perdidos
+            if self._catchup is None or self._transport.now() - self._catchup["updated"] > self.catchup_timeout:
+                self.catch_up()
+
+    def apply_decided(self):
+        '''
+        Aplica as decisões contíguas a partir de next_apply
+        '''
+        if self.next_apply not in self.decisions:
+            return
+
+        # Decisões podem chegar fora de ordem; só são aplicadas quando não há buracos antes delas
+        while self.next_apply in self.decisions:
+            slot = self.next_apply
+            try:
+                value = self._load(self.decisions[slot])
+            except FileNotFoundError:
+                # Outro learner já removeu o segmento, depois de um snapshot que cobre o slot
+                log.warning("Learner missed the shared value of slot %s, catching up", slot)
+                if self._catchup is None:
+                    self.catch_up()
+                break
+            del self.decisions[slot]
+            self.next_apply += 1
+            if isinstance(value, list):
+                # Lote montado pelo Batcher: cada valor é uma decisão, na ordem do lote. Um item que
+                # também é uma lista é um comando de cliente, [id, sequência, confirmados, valor]
+                for item in value:
+                    if not isinstance(item, list):
+                        self.apply(slot, item)
+                    elif self.first_time(*item[:3]):
+                        self.apply(slot, item[3])
+            elif value is not None:  # None é um no-op
+                self.apply(slot, value)
+        self.tally.advance(self.next_apply)
+        self._applied.notify_all()
+
+        if self.snapshot_path is not None and self.next_apply - self.snapshot_slot >= self.snapshot_every:
+            self.take_snapshot()
+
+    def _load(self, value):
+        '''
+        A decisão com o conteúdo dos valores em memória compartilhada que serão aplicados. A
+        decisão recebida não é alterada
+        '''
+        if isinstance(value, SharedValue):
+            loaded = value.load()
+            self._shared.append(value)
+            return loaded
+        if not isinstance(value, list):
+            return value
+        loaded = value
+        for i, item in enumerate(value):
+            if not isinstance(item, list):
+                item = self._load(item)
+            elif isinstance(item[3], SharedValue) and not self._duplicate(*item[:3]):
+                item = [*item[:3], self._load(item[3])]
+            if item is not value[i]:
+                if loaded is value:
+                    loaded = list(value)
+                loaded[i] = item
+        return loaded
+
+    def _duplicate(self, client_id:int, seq:int, acked:int) -> bool:
+        session = self.sessions.get(client_id)
+        if session is None:
+            return seq < acked
+        return seq < max(session[0], acked) or seq in session[1]
+
+    def first_time(self, client_id:int, seq:int, acked:int) -> bool:
+        '''
+        Verifica se o comando `seq` do cliente ainda não foi aplicado e o marca como aplicado.
+        `acked` é a menor sequência que o cliente esperava ao enviar o comando: as anteriores já
+        foram escolhidas e podem ser esquecidas
+        '''
+        if self._duplicate(client_id, seq, acked):
+            self._duplicates.inc()
+            return False
+        session = self.sessions.get(client_id)
+        if session is None:
+            session = self.sessions[client_id] = [0, set(), self.SESSION_PRUNE]
+        session[0] = max(session[0], acked)
+        session[1].add(seq)
+        if len(session[1]) > session[2]:
+            # Limpeza amortizada: o limite dobra enquanto o cliente mantém muitos comandos pendentes
+            session[1] = {s for s in session[1] if s >= session[0]}
+            session[2] = max(self.SESSION_PRUNE, 2 * len(session[1]))
+        return True
+
+    def _dump_sessions(self) -> list[list]:
+        '''
+        As sessões como [id, menor sequência esperada, sequências aplicadas a partir dela], para
+        snapshots e para o catch-up de outro learner
+        '''
+        return [[client_id, session[0], sorted(seq for seq in session[1] if seq >= session[0])]
+                for client_id, session in self.sessions.items()]
+
+    def _load_sessions(self, sessions:list[list]):
+        '''
+        Substitui as sessões pelas de um snapshot ou de outro learner (ver _dump_sessions)
+        '''
+        self.sessions = {client_id: [low, set(seqs), max(self.SESSION_PRUNE, 2 * len(seqs))]
+                         for client_id, low, seqs in sessions}
 
     @property
-    def complete(self):
-        return self.final_proposal_id is not None
+    def snapshot_slot(self) -> int:
+        return self.snapshot.next_slot if self.snapshot is not None else 0
 
+    @property
+    def applied(self) -> int:
+        '''
+        Total de valores aplicados, incluindo os que estão no snapshot
+        '''
+        return (len(self.snapshot) if self.snapshot is not None else 0) + len(self.log)
 
-    def recv_accepted(self, from_port, proposal_id, accepted_value):
+    def take_snapshot(self):
         '''
-        Called when an Accepted message is received from an acceptor
+        Grava um snapshot com tudo o que foi aplicado, libera o log em memória e avisa os acceptors
+        que podem descartar os slots abaixo de next_apply
         '''
-        
-        print(f"Learner received accepted value {accepted_value} for proposal {proposal_id} from Acceptor at port {from_port}")
-        
-        if self.final_value is not None:
-            return # already done
+        previous = self.snapshot
+        self.snapshot = Snapshot.write(self.snapshot_path, self.next_apply, self.log, previous, self._dump_sessions())
+        if previous is not None:
+            previous.close()
+        self.log = []
+        log.info("Learner wrote snapshot with %s values up to slot %s", len(self.snapshot), self.next_apply)
+        if self.direct:
+            for port in self._acceptors:
+                self._transport.send(port, "cpt", self.next_apply)
+        else:
+            self.send_message_to_bridge("cpt", self.next_apply)
+        # Os learners atrasados tiveram um intervalo entre snapshots para ler estes segmentos
+        for value in self._releasable:
+            value.release()
+        self._releasable, self._shared = self._shared, []
 
-        if self.proposals is None:
-            self.proposals = dict()
-            self.acceptors = dict()
-        
-        last_pn = self.acceptors.get(from_port)
+    def catch_up(self):
+        '''
+        Começa a copiar o estado de outro learner. A lista de learners é pedida de novo ao bridge;
+        com uma configuração já conhecida a transferência começa agora, senão quando ela chegar
+        (set_membership). Uma transferência que fica `catchup_timeout` segundos sem resposta
+        recomeça com outro learner, e os learners que já falharam só são tentados de novo quando
+        não resta nenhum outro
+        '''
+        tried = self._catchup["tried"] if self._catchup is not None else set()
+        if self._catchup is not None and self._catchup["file"] is not None:
+            self._catchup["file"].close()
+        c = self._catchup = {"peer": None, "tried": tried, "snapshot": None, "file": None, "updated": self._transport.now()}
+        self._catch_ups.inc()
+        self.send_message_to_bridge("mbq")
+        if self._learners:
+            self._start_catch_up()
+        self._watch_catch_up(c)
 
-        if not proposal_id > last_pn:
-            return # Old message
+    def _watch_catch_up(self, c:dict):
+        updated = c["updated"]
+        self._transport.call_later(self.catchup_timeout, lambda: self._check_catch_up(c, updated))
 
-        self.acceptors[ from_port ] = proposal_id
-        
-        if last_pn is not None:
-            oldp = self.proposals[ last_pn ]
-            oldp[1] -= 1
-            if oldp[1] == 0:
-                del self.proposals[ last_pn ]
+    def _check_catch_up(self, c:dict, updated:float):
+        '''
+        Recomeça a transferência se ela não avançou desde a última verificação
+        '''
+        with self._lock:
+            if self._catchup is not c:
+                return  # terminou ou já recomeçou
+            if c["updated"] != updated:
+                self._watch_catch_up(c)
+                return
+            log.info("Learner got no catch-up reply from Learner at port %s, trying another", c["peer"])
+            if c["peer"] is not None:
+                self._unresponsive.add(c["peer"])
+            self.catch_up()
 
-        if not proposal_id in self.proposals:
-            self.proposals[ proposal_id ] = [0, 0, accepted_value]
+    def _start_catch_up(self):
+        peers = [port for port in self._learners
+                 if port != self._addr[1] and port not in self._catchup["tried"] and port not in self._unresponsive]
+        if not peers:
+            # Sem outro learner, os acceptors reenviam o que aceitaram a partir do buraco. Eles
+            # podem já ter descartado esses slots (depois do snapshot de outro learner), então os
+            # learners que falharam voltam a ser tentados na próxima rodada: a falha pode ter sido
+            # só um pedido ou uma resposta perdidos, e learners que não são o distinto nunca
+            # enviam nada uns aos outros para saírem de _unresponsive
+            log.info("Learner asking acceptors to resend accepted values from slot %s", self.next_apply)
+            for port in self._acceptors:
+                self._transport.send(port, "cta", self._addr[1], self.next_apply, self.CATCHUP_ENTRIES)
+            self._unresponsive.clear()
+            self._catchup = None
+            return
+        self._catchup["peer"] = self._transport.random.choice(peers)
+        self._catchup["tried"].add(self._catchup["peer"])
+        log.info("Learner catching up from Learner at port %s, %s values applied", self._catchup["peer"], self.applied)
+        self._request_catch_up(0)
 
-        t = self.proposals[ proposal_id ]
+    def _request_catch_up(self, offset:int):
+        c = self._catchup
+        c["updated"] = self._transport.now()
+        self._transport.send(c["peer"], "ctq", self._addr[1], self.applied, offset, c["snapshot"])
 
-        assert accepted_value == t[2], 'Value mismatch for single proposal!'
-        
-        t[0] += 1
-        t[1] += 1
-
-        if t[0] == self.quorum_size:
-            self.final_value       = accepted_value
-            self.final_proposal_id = proposal_id
-            self.proposals         = None
-            self.acceptors         = None
-            
-            print(f"Learner reached consensus on value {accepted_value} for proposal {proposal_id}")
-
-            # self.messenger.on_resolution( proposal_id, accepted_value )
-    
-    def set_quorum(self, value:str):
-        self.quorum_size = int(value)
+    def recv_catch_up_request(self, from_port:int, applied:int, offset:int, snapshot_id:int|None):
+        '''
+        Outro learner pede o estado a partir do valor de índice `applied`. Se ele está antes do fim
+        do snapshot, recebe o arquivo de snapshot em pedaços; senão, os valores do log. Cada resposta
+        leva só um pedaço, e o próximo só é enviado quando for pedido (controle de fluxo)
+        '''
+        snapshot_count = len(self.snapshot) if self.snapshot is not None else 0
+        if applied < snapshot_count:
+            if snapshot_id != self.snapshot.next_slot:
+                offset = 0  # o snapshot mudou desde o último pedaço: recomeça o arquivo
+            chunk = self.snapshot.read(offset, self.CATCHUP_CHUNK)
+            self._transport.send(from_port, "cts", self.snapshot.next_slot, offset, chunk, self.snapshot.size)
+        else:
+            start  = applied - snapshot_count
+            values = self.log[start:start + self.CATCHUP_ENTRIES]
+            # O último pedaço leva as sessões, que correspondem a tudo o que foi aplicado até aqui
+            last = applied + len(values) == self.applied
+            self._transport.send(from_port, "ctl", applied, values, self.applied, self.next_apply,
+                                 self._dump_sessions() if last else None)
+
+    def _temp_snapshot_path(self) -> str:
+        '''
+        Um único arquivo por learner no diretório temporário: cada snapshot recebido substitui o
+        anterior (install), e close() o remove
+        '''
+        if self._temp_snapshot is None:
+            self._temp_snapshot = os.path.join(tempfile.gettempdir(),
+                                               f"pyxos-learner-{os.getpid()}-{id(self):x}.snapshot")
+        return self._temp_snapshot
+
+    def recv_snapshot_chunk(self, snapshot_id:int, offset:int, data:bytes, size:int):
+        c = self._catchup
+        if c is None:
+            return
+        if snapshot_id != c["snapshot"] or c["file"] is None:
+            if offset != 0:
+                return
+            if c["file"] is not None:
+                c["file"].close()
+            target = self.snapshot_path or self._temp_snapshot_path()
+            c["snapshot"], c["target"] = snapshot_id, target
+            c["file"] = open(target + ".part", "wb")
+        if offset != c["file"].tell():
+            return
+        c["file"].write(data)
+        if c["file"].tell() < size:
+            self._request_catch_up(c["file"].tell())
+            return
+
+        c["file"].close()
+        c["file"] = None
+        part = c["target"] + ".part"
+        received = Snapshot(part)  # também valida o cabeçalho do arquivo recebido
+        count = len(received)
+        received.close()
+        if count > self.applied:
+            # O snapshot recebido substitui tudo o que este learner já tinha aplicado
+            if self.snapshot is not None:
+                self.snapshot.close()
+            self.snapshot   = install(part, c["target"])
+            self.log        = []
+            self.next_apply = max(self.next_apply, self.snapshot.next_slot)
+            self._load_sessions(self.snapshot.sessions())
+            self._discard_decided()
+            log.info("Learner installed snapshot with %s values up to slot %s", count, self.snapshot.next_slot)
+        else:
+            os.remove(part)
+        self._request_catch_up(0)
+
+    def recv_log_chunk(self, start:int, values:list, total:int, next_apply:int, sessions:list|None):
+        c = self._catchup
+        if c is None:
+            return
+        if start != self.applied:
+            # Valores aplicados por decisões recebidas durante a transferência: continua de onde parou
+            self._request_catch_up(0)
+            return
+        if not values and total < start + 1 and c["snapshot"] is None:
+            # Esse learner não está à frente deste: tenta outro
+            self._start_catch_up()
+            return
+        self.log.extend(values)
+        if start + len(values) < total:
+            self._request_catch_up(0)
+            return
+
+        if start + len(values) == total and next_apply >= self.next_apply:
+            # Este learner aplicou exatamente o que o outro tinha aplicado: as sessões também são as dele
+            if sessions is not None:
+                self._load_sessions(sessions)
+            if next_apply > self.next_apply:
+                self.next_apply = next_apply
+                self._discard_decided()
+        self._catchup = None
+        log.info("Learner caught up: %s values applied, next slot %s", self.applied, self.next_apply)
+        self.apply_decided()
+
+    def _discard_decided(self):
+        '''
+        Descarta decisões e votos de slots que já estão no estado copiado de outro learner
+        '''
+        self.decisions = {slot: value for slot, value in self.decisions.items() if slot >= self.next_apply}
+        self.tally.advance(self.next_apply)
+        self._applied.notify_all()
+
+    def read(self, query, timeout:float=1.0):
+        '''
+        Leitura linearizável: pede ao líder o índice de leitura, espera aplicar todos os slots
+        abaixo dele e então retorna query(self). Enquanto o líder tem um lease válido isso custa
+        uma ida e volta até ele, sem nenhuma rodada de Paxos. Levanta TimeoutError se nenhum
+        líder responder a tempo
+        '''
+        if not self._proposers:
+            self.request_membership(timeout)
+        deadline = self._transport.now() + timeout
+        with self._lock:
+            read_id = self._next_read
+            self._next_read += 1
+            state = self._reads[read_id] = [Event(), None]
+        # Só o líder responde
+        for port in self._proposers:
+            self._transport.send(port, "rdq", self._addr[1], read_id)
+        try:
+            if not state[0].wait(timeout):
+                raise TimeoutError("No leader answered the read request")
+            with self._lock:
+                if not self._applied.wait_for(lambda: self.next_apply >= state[1], deadline - self._transport.now()):
+                    raise TimeoutError(f"Learner did not apply up to slot {state[1]} in time")
+                return query(self)
+        finally:
+            with self._lock:
+                self._reads.pop(read_id, None)
+
+    def recv_read_index(self, read_id:int, index:int):
+        state = self._reads.get(read_id)
+        if state is not None and not state[0].is_set():
+            state[1] = index
+            state[0].set()
+
+    def apply(self, slot:int, value:str):
+        '''
+        Aplica ao log um valor decidido no slot
+        '''
+        self.log.append(value)
+        self._applied_vals.inc()
+        log.debug("Learner applied slot %s: %s", slot, value)
+
+    def set_quorum(self, value:int):
+        self.quorum_size = value
+        self.tally.set_quorum(value)
+
+    def start(self):
+        '''
+        O mesmo que run(), sem bloquear: começa a escutar e pede o estado que já foi decidido
+        '''
+        self.listen()
+        if self.direct:
+            self.request_membership()
+        with self._lock:
+            self.catch_up()
 
     def run(self):
-        self._listner.start()
+        self.start()
         self._listner.join()
+
+    def close(self):
+        '''
+        Para de receber mensagens, fecha o snapshot e remove o arquivo temporário em que foi
+        instalado o snapshot recebido no catch-up (sem snapshot_path)
+        '''
+        self._transport.close()
+        with self._lock:
+            c = self._catchup
+            if c is not None and c["file"] is not None:
+                c["file"].close()
+                c["file"] = None
+            if self.snapshot is not None:
+                self.snapshot.close()
+            if self._temp_snapshot is not None:
+                for path in (self._temp_snapshot, self._temp_snapshot + ".part"):
+                    if os.path.exists(path):
+                        os.remove(path)
@@ -0,0 +1,217 @@
+'''
+Métricas dos nós: contadores, gauges e histogramas de latência.
+
+Cada nó (e cada bridge) tem o seu Registry, com rótulos fixos identificando o papel e a porta.
+Atualizar uma métrica é só uma soma em um atributo; a formatação acontece apenas quando as
+métricas são lidas, pelo endpoint HTTP (serve) ou pelo arquivo gravado periodicamente (dump).
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from bisect import bisect_left
+import json
+import time
+import os
+
+PREFIX = "pyxos_"
+
+# Limites dos buckets dos histogramas, em segundos: de 50us a ~13s, dobrando a cada bucket
+LATENCY_BUCKETS = tuple(0.00005 * 2 ** i for i in range(19))
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount:int=1):
+        self.value += amount
+
+
+class Gauge:
+    '''
+    Valor lido no momento da coleta, por exemplo o tamanho de uma fila
+    '''
+    __slots__ = ("read",)
+
+    def __init__(self, read):
+        self.read = read
+
+    @property
+    def value(self):
+        return self.read()
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds:tuple[float, ...]=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # o último bucket é +Inf
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, value:float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+    def quantile(self, q:float) -> float|None:
+        '''
+        Limite superior do bucket que contém o quantil q
+        '''
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return None
+
+
+class _Counters(dict):
+    __slots__ = ("_registry", "_name", "_label", "_values")
+
+    def __init__(self, registry:"Registry", name:str, label:str, values):
+        self._registry = registry
+        self._name     = name
+        self._label    = label
+        self._values   = frozenset(values)
+
+    def __missing__(self, value) -> Counter:
+        if value not in self._values:
+            raise KeyError(value)
+        counter = self[value] = self._registry.counter(self._name, **{self._label: value})
+        return counter
+
+
+class Registry:
+    def __init__(self, **labels):
+        self.labels = {k: str(v) for k, v in labels.items()}
+        self._metrics:dict[tuple, tuple[str, dict, object]] = {}  # (nome, rótulos) => (tipo, rótulos, métrica)
+
+    def _get(self, kind:str, name:str, labels:dict, factory):
+        key = (name, tuple(sorted(labels.items())))
+        entry = self._metrics.get(key)
+        if entry is None:
+            entry = self._metrics[key] = (kind, {k: str(v) for k, v in labels.items()}, factory())
+        return entry[2]
+
+    def counter(self, name:str, **labels) -> Counter:
+        return self._get("counter", name, labels, Counter)
+
+    def counters(self, name:str, label:str, values) -> dict[str, Counter]:
+        '''
+        Um contador para cada valor do rótulo, para uso direto no caminho quente:
+        counters[tipo].inc() em vez de uma busca pelos rótulos a cada mensagem. Cada contador só é
+        criado (e exportado) no primeiro uso: a maioria dos nós recebe poucos dos tipos possíveis
+        '''
+        return _Counters(self, name, label, values)
+
+    def gauge(self, name:str, read, **labels) -> Gauge:
+        return self._get("gauge", name, labels, lambda: Gauge(read))
+
+    def histogram(self, name:str, bounds:tuple[float, ...]=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, labels, lambda: Histogram(bounds))
+
+    def collect(self) -> list[dict]:
+        samples = []
+        for (name, _), (kind, labels, metric) in list(self._metrics.items()):
+            sample = {"name": name, "type": kind, "labels": {**self.labels, **labels}}
+            if kind == "histogram":
+                sample.update(count=metric.count, sum=metric.sum, buckets=dict(zip(map(str, metric.bounds), metric.counts)),
+                              p50=metric.quantile(.5), p99=metric.quantile(.99))
+                sample["buckets"]["+Inf"] = metric.counts[-1]
+            else:
+                sample["value"] = metric.value
+            samples.append(sample)
+        return samples
+
+    def render(self) -> str:
+        '''
+        Métricas no formato de texto do Prometheus
+        '''
+        return render([self])
+
+
+def render(registries:list[Registry]) -> str:
+    '''
+    Métricas de vários registries no formato de texto do Prometheus. As amostras de uma mesma
+    métrica precisam ficar juntas, depois de uma única linha de TYPE
+    '''
+    entries = [(name, registry, entry) for registry in registries for (name, _), entry in list(registry._metrics.items())]
+    entries.sort(key=lambda item: item[0])
+    lines = []
+    typed = set()
+    for name, registry, (kind, labels, metric) in entries:
+        full = PREFIX + name + ("_total" if kind == "counter" else "")
+        if full not in typed:
+            typed.add(full)
+            lines.append(f"# TYPE {full} {kind}")
+        all_labels = {**registry.labels, **labels}
+        if kind != "histogram":
+            lines.append(f"{full}{_labels(all_labels)} {metric.value}")
+            continue
+        cumulative = 0
+        for bound, count in zip(metric.bounds + (float("inf"),), metric.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{full}_bucket{_labels({**all_labels, 'le': le})} {cumulative}")
+        lines.append(f"{full}_sum{_labels(all_labels)} {metric.sum}")
+        lines.append(f"{full}_count{_labels(all_labels)} {metric.count}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels:dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def serve(registries:list[Registry], port:int=0, host:str="localhost") -> ThreadingHTTPServer:
+    '''
+    Endpoint HTTP local com as métricas: /metrics no formato do Prometheus e /metrics.json.
+    Roda em uma thread própria; server.server_address traz a porta escolhida quando port=0
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, kind = render(registries).encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, kind = json.dumps([s for r in registries for s in r.collect()]).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump(registries:list[Registry], path:str, interval:float=5.0) -> Thread:
+    '''
+    Grava as métricas em JSON em `path` a cada `interval` segundos, substituindo o arquivo
+    atomicamente para que um leitor nunca veja um arquivo pela metade
+    '''
+    def run():
+        while True:
+            time.sleep(interval)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"time": time.time(), "metrics": [s for r in registries for s in r.collect()]}, f)
+            os.replace(tmp, path)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    return thread
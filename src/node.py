@@ -0,0 +1,121 @@
+from threading import Event
+from .transport import TcpTransport
+from .sharding import ShardMap
+from .metrics import Registry
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Node:
+    '''
+    Base dos papéis (Acceptor, Proposer e Learner): o transporte, o bridge deste nó, a
+    configuração enviada pelo bridge e o registro. Cada papel define ROLE, trata as mensagens em
+    handle_message() e ajusta o próprio estado a uma nova configuração em _reconfigure()
+    '''
+    ROLE  = ""    # nome do papel no registro ("spp")
+    flush = None  # chamado quando não há mais mensagens esperando em uma conexão, se o papel definir
+
+    def __init__(self, bridge_port:int|ShardMap, direct:bool=False, transport=None):
+        # Transporte das mensagens: TCP com conexões persistentes ou a rede em memória do simulador
+        self._transport = transport if transport is not None else TcpTransport()
+        self._addr:tuple[str, int] = self._transport.addr
+
+        self.metrics = Registry(role=self.ROLE.lower(), port=self._addr[1])
+        self._transport.instrument(self.metrics)
+
+        # bridge_port pode ser um ShardMap de um cluster de bridges; self.bridge é o bridge deste nó
+        self.shards = bridge_port if isinstance(bridge_port, ShardMap) else ShardMap([bridge_port])
+        self.bridge = self.shards.home(self._addr[1])
+
+        # Modo direto: o bridge só fornece a lista de participantes e as mensagens do protocolo
+        # vão direto de um nó para o outro
+        self.direct = direct
+        self._acceptors:list[int] = []
+        self._proposers:list[int] = []
+        self._learners:list[int]  = []
+        self._members:set[int]    = set()  # acceptors da configuração atual, para filtrar votos
+        self.epoch = 0  # versão da configuração em cache, enviada pelo bridge a cada mudança
+        self._requested = 0  # maior versão já pedida ao bridge depois de vê-la em uma mensagem
+        self._membership = Event()
+        self._registered = Event()  # o bridge confirmou o registro deste nó ("rga")
+        self._listner    = None
+
+    def send_message_to_bridge(self, reqtype:str, *args, bridge:int|None=None):
+        '''
+        Envia mensagens para o bridge pela conexão persistente do pool. Com um cluster de bridges,
+        `bridge` escolhe qual deles roteia a mensagem
+        '''
+        log.debug("%s sending message to bridge: %s %s", type(self).__name__, reqtype, args)
+        self._transport.send(self.bridge if bridge is None else bridge, reqtype, *args)
+
+    def request_membership(self, timeout:float=5.0):
+        '''
+        Pede ao bridge as listas de participantes e espera a resposta
+        '''
+        self._membership.clear()
+        self.send_message_to_bridge("mbq")
+        if not self._membership.wait(timeout):
+            log.warning("%s did not receive the membership from the bridge", type(self).__name__)
+
+    def set_membership(self, epoch:int, acceptors:list[int], proposers:list[int], learners:list[int],
+                       prepare_quorum:int, accept_quorum:int, distinguished:int|None=None):
+        '''
+        Nova configuração enviada pelo bridge; uma versão mais antiga que a que está em cache (que
+        chegou fora de ordem) é ignorada
+        '''
+        if epoch >= self.epoch:
+            departed = self._members - set(acceptors)
+            self.epoch      = epoch
+            self._acceptors = acceptors
+            self._proposers = proposers
+            self._learners  = learners
+            self._members   = set(acceptors)
+            self._reconfigure(departed, prepare_quorum, accept_quorum, distinguished)
+        self._membership.set()
+
+    def _reconfigure(self, departed:set[int], prepare_quorum:int, accept_quorum:int, distinguished:int|None):
+        '''
+        Ajusta o estado do papel à configuração que acabou de ser adotada; `departed` são os
+        acceptors que saíram
+        '''
+
+    def check_epoch(self, epoch:int):
+        '''
+        As mensagens do protocolo levam a versão da configuração de quem enviou. Se ela é mais nova
+        que a deste nó, a configuração enviada pelo bridge ainda não chegou (ou se perdeu): pede de novo
+        '''
+        if epoch > self.epoch and epoch > self._requested:
+            self._requested = epoch
+            self.send_message_to_bridge("mbq")
+
+    def register(self):
+        '''
+        Envia (ou reenvia) o registro deste nó ao bridge, que responde com "rga"
+        '''
+        self.send_message_to_bridge("spp", self.ROLE, self._addr[1])
+
+    def set_registered(self):
+        self._registered.set()
+
+    def wait_registered(self, timeout:float|None=None) -> bool:
+        '''
+        Espera o bridge confirmar o registro deste nó; a confirmação só é recebida depois de listen()
+        '''
+        return self._registered.wait(timeout)
+
+    def listen(self):
+        '''
+        Começa a receber mensagens, se ainda não começou
+        '''
+        if self._listner is None:
+            self._listner = self.listner_requests()
+
+    def listner_requests(self):
+        '''
+        Escuta todas as requisições que chegam
+        '''
+        return self._transport.listen(self.handle_message, self.flush)
+
+    def handle_message(self, port:int, data:list):
+        raise NotImplementedError
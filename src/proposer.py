@@ -1,115 +1,757 @@
 from .id_proposta import IdProposta
-from threading import Thread
-import socket
-
-
-class Proposer:
-    def __init__(self, bridge_port:int, value_to_propose:str):
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind(("localhost", 0))  # Bind the acceptor socket
-        self._addr:tuple[str, int] = self._sock.getsockname()
-
-        self.bridge_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self.bridge_socket.connect(("localhost", bridge_port))  # Connect to the bridge
-            print(f"Proposer connected to bridge on port {bridge_port}")
-        except Exception as e:
-            print(f"Error connecting to bridge: {e}")
-        
-        self._listner = Thread(target=self.listner_requests, daemon=True)
-        self.bridge = bridge_port
+from .sharding import ShardMap
+from .node import Node
+from .codec import MESSAGE_TYPES, value_size
+from .shm import Segments, share_large
+from collections import deque
+from threading import Lock
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Proposer(Node):
+    ROLE         = "PROPOSER"
+    BACKOFF_MAX  = 2.0  # segundos; limite da espera entre tentativas de se tornar o líder
+    CLIENT_BATCH = 256  # comandos de clientes por slot
+    CLIENT_BYTES = 1024 * 1024  # e bytes, aproximados, dos comandos de um slot
+
+    def __init__(self, bridge_port:int|ShardMap, value_to_propose:str|None=None, window:int=32, direct:bool=False,
+                 lease_drift:float=0.01, lease_margin:float=0.05, thrifty:bool=False, thrifty_timeout:float=0.05,
+                 heartbeat_interval:float=0.05, election_timeout:float=0.25, retransmit_timeout:float=0.2,
+                 share_threshold:int|None=None, transport=None):
+        super().__init__(bridge_port, direct, transport)
 
         self.proposer_uid         = None
-        self.quorum_size          = None
+        self.prepare_quorum       = None  # Q1: promessas para concluir a fase 1 ou confirmar a liderança
+        self.accept_quorum        = None  # Q2: aceites para um slot ser escolhido
+        self._lease_quorum        = None  # leases que impedem qualquer outro proposer de reunir Q1
 
-        self.proposed_value       = value_to_propose
         self.proposal_id          = None 
-        self.last_accepted_id     = None
         self.next_proposal_number = 1
         self.promises_rcvd        = None
+        self.leader               = False  # True quando a fase 1 foi concluída para todos os slots a partir de first_slot
+
+        # Log replicado (Multi-Paxos)
+        self.first_slot = 0   # menor slot que ainda pode não ter sido escolhido
+        self.next_slot  = 0   # próximo slot livre para um valor novo
+        self.window     = window  # máximo de slots na fase 2 ao mesmo tempo
+        self.pending:deque[str|list[str]] = deque()  # valores (ou lotes do Batcher) esperando um slot livre na janela
+        self.in_flight:dict[int, list] = {}  # slot => [proposal_id, valor, acceptors que aceitaram, envio, destinos, último envio]
+        self.decided:set[int]                   = set()    # slots escolhidos acima de first_slot
+        self.recovered:dict[int, tuple[IdProposta, str|None]] = {}  # slot => maior (id, valor) informado nas promessas
+        self._lock = Lock()
+
+        # Modo thrifty: cada accept vai só para Q2 acceptors, os primeiros de _order; se um slot não
+        # é escolhido em thrifty_timeout segundos, o accept vai para os outros, e os acceptors que
+        # não responderam passam para o fim da ordem
+        self.thrifty         = thrifty
+        self.thrifty_timeout = thrifty_timeout
+        self._order:list[int] = []
+        self._fallbacks   = self.metrics.counter("thrifty_fallbacks")
+        self._retransmits = self.metrics.counter("accepts_resent")
+        self.retransmit_timeout = retransmit_timeout  # segundos até reenviar um accept sem quórum
+
+        # Eleição: o líder envia heartbeats aos outros proposers (e aos learners, com o índice de
+        # commit). Um proposer só tenta a liderança se não ouve um líder há election_timeout
+        # segundos; uma recusa ("nck") traz o maior id prometido, e a próxima tentativa usa um id
+        # acima dele, depois de uma espera aleatória que dobra a cada tentativa sem sucesso
+        self.heartbeat_interval = heartbeat_interval
+        self.election_timeout   = election_timeout
+        self._leader_seen = None  # now() do último heartbeat de outro líder
+        self._leader_hint:int|None = None  # porta do último líder ouvido, indicada aos clientes
+        self._retry_at    = 0.0   # now() a partir do qual uma nova tentativa pode começar
+        self._attempts    = 0     # tentativas seguidas sem se tornar o líder
+        self._nacks       = self.metrics.counter("nacks_received")
+
+        # Clientes (ver client.Client): os comandos recebidos juntos vão para um único slot, como um
+        # lote de [id do cliente, sequência, confirmados, valor]. Cada sessão guarda, por sequência,
+        # o slot em que o comando foi escolhido (None enquanto não foi), para que um reenvio do
+        # cliente receba a resposta de novo em vez de ser proposto outra vez
+        self._submitted:list[list] = []
+        self._sessions:dict[int, dict[int, int|None]] = {}
+        self._client_ports:dict[int, int] = {}
+        self._duplicates = self.metrics.counter("client_duplicates")
+
+        # Com outros proposers na configuração, os valores de propose() viram comandos de uma
+        # sessão, a do próprio proposer, e ficam em _own até serem escolhidos: um proposer que não é
+        # o líder (ou deixou de ser, com valores na janela) os encaminha ao líder conhecido e os
+        # reenvia até ele responder ("sbr"), e os learners aplicam uma vez só um comando escolhido
+        # em dois slots. Sozinho, o proposer sempre volta a ser o líder e envia os valores como são
+        self._client_id = self._transport.random.getrandbits(62)
+        self._own:dict[int, list] = {}  # sequência => [valor, último encaminhamento ao líder]
+        self._own_seq  = 0
+        self._forwards = self.metrics.counter("values_forwarded")
+
+        # Leases: as promessas dos acceptors trazem um lease; enquanto um quórum de leases vale,
+        # nenhum outro proposer consegue promessas e o líder responde leituras sem uma rodada.
+        # Cada rodada de confirmação é um prepare com o mesmo id, que também renova o lease. As
+        # rodadas são numeradas, e as respostas de outra rodada não contam para a atual
+        self.lease_drift  = lease_drift   # diferença máxima de velocidade entre os relógios (fração)
+        self.lease_margin = lease_margin  # segundos descontados do fim do lease
+        self.lease_expiry = 0.0           # now() do transporte até quando o lease vale
+        self._lease       = 0.0           # duração do último lease concedido, em segundos
+        self._round:dict|None = None      # rodada de confirmação em andamento
+        self._rounds      = 0             # número da última rodada
+        self._lease_retry = True          # a última rodada teve algum lease: tenta até ter o quórum
+        self._read_floor  = 0             # next_slot quando este proposer se tornou o líder
+        self._reads:list[tuple[int, int, int]] = []  # (porta, id, índice) esperando a próxima rodada
+
+        # Valores com pelo menos share_threshold bytes vão para a memória compartilhada e as
+        # mensagens levam só o handle (ver shm); só serve com todos os nós no mesmo host
+        # (nomes em `shared`, limitados aos segmentos vivos e removidos por Cluster.close() com shm.unlink)
+        self.share_threshold = share_threshold
+        self.shared = Segments()
+
+        if value_to_propose is not None:
+            self.pending.append(share_large(value_to_propose, share_threshold, self.shared))
 
         self._paths = {
             "prm": self.recv_promise,
-            "qrm": self.set_quorum
+            "acd": self.recv_accepted,
+            "qrm": self.set_quorum,
+            "mbr": self.set_membership,
+            "rdq": self.recv_read,
+            "rga": self.set_registered,
+            "nck": self.recv_nack,
+            "hbt": self.recv_heartbeat,
+            "sbm": self.recv_submit,
+            "cpd": self.recv_compacted,
+            "sbr": self.recv_forwarded,
+            "rdr": self.recv_redirect
         }
 
-        self.send_message_to_bridge("spp", "PROPOSER", str(self._addr[1]))
+        # Latências medidas do envio até o quórum: prepare => promessas, accept => escolhido
+        self._received       = self.metrics.counters("messages_received", "type", MESSAGE_TYPES)
+        self._promise_quorum = self.metrics.histogram("promise_quorum_seconds")
+        self._accept_chosen  = self.metrics.histogram("accept_chosen_seconds")
+        self._chosen         = self.metrics.counter("slots_chosen")
+        self._elected        = self.metrics.counter("leader_elections")
+        self.metrics.gauge("pending_values", self.pending.__len__)
+        self.metrics.gauge("in_flight_slots", lambda: len(self.in_flight))
 
-    def send_message_to_bridge(self, reqtype:str, *args:str):
+        self.register()
+
+    def send_message_to_acceptors(self, reqtype:str, *args, slot:int|None=None, ports:list[int]|None=None):
         '''
-        Envia mensagens para o bridge
+        Envia uma mensagem a todos os acceptors, ou só a `ports`: pelo bridge responsável (pela porta
+        deste proposer ou pelo slot) ou, no modo direto, a cada um deles
         '''
-        msg = (";".join((reqtype,)+args)+"!").encode()
-        print(f"Proposer sending message to bridge: {msg}")
+        if not self.direct:
+            if ports is not None:
+                args += (ports,)  # o bridge entrega só a esses acceptors
+            self.send_message_to_bridge(reqtype, *args, bridge=self.shards.select(self._addr[1], slot))
+            return
+        if reqtype == "prp":
+            args = (self._addr[1],) + args  # o acceptor responde a promessa para esta porta
+        for port in (self._acceptors if ports is None else ports):
+            self._transport.send(port, reqtype, *args)
 
-        def send():
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect(("localhost", self.bridge))
-                    s.sendall(msg)
-                    print(f"Proposer message sent to bridge: {msg}")
-            except (BrokenPipeError, OSError) as e:
-                print(f"Failed to send message to bridge at port {self.bridge}: {e}")
-        
-        Thread(target=send, daemon=True).start()
-    
-    def listner_requests(self):
+    def set_membership(self, epoch:int, acceptors:list[int], proposers:list[int], learners:list[int],
+                       prepare_quorum:int, accept_quorum:int, distinguished:int|None=None):
+        with self._lock:
+            super().set_membership(epoch, acceptors, proposers, learners, prepare_quorum, accept_quorum, distinguished)
+
+    def _reconfigure(self, departed:set[int], prepare_quorum:int, accept_quorum:int, distinguished:int|None):
         '''
-        Escuta todas as requisições que chegam
+        Votos de acceptors que saíram deixam de contar, e a fase 1 ou os slots que já têm o quórum
+        da nova configuração são concluídos
         '''
-        self._sock.listen()
-        while True:
-            skt, addr = self._sock.accept()
-            msg = b''
-            for b in iter(lambda: skt.recv(1), b'!'):
-                msg += b
-            data = msg.decode().split(';')
-            print(f"Proposer received: {data} from {addr}")
-            self._paths[data[0]](*data[1:])
+        self._order = [a for a in self._order if a in self._members] + [a for a in self._acceptors if a not in self._order]
+        self.set_quorums(prepare_quorum, accept_quorum)
+        if self.promises_rcvd:
+            self.promises_rcvd &= self._members
+            if not self.leader and len(self.promises_rcvd) >= prepare_quorum:
+                self._become_leader()
+        for slot, state in list(self.in_flight.items()):
+            state[2] &= self._members
+            if len(state[2]) >= accept_quorum and self.in_flight.get(slot) is state:
+                self._chosen_slot(slot, state)
+
+    def handle_message(self, port:int, data:list[str]):
+        log.debug("Proposer received: %s from port %s", data, port)
+        self._received[data[0]].inc()
+        self._paths[data[0]](*data[1:])
 
     def prepare(self):
         '''
         Sends a prepare request to all Acceptors as the first step in attempting to
-        acquire leadership of the Paxos instance. 
+        acquire leadership of the Paxos instance. No Multi-Paxos o prepare vale para todos
+        os slots a partir de first_slot, então só é repetido quando a liderança é perdida.
         '''
-        #self.send_message_to_bridge("qrm")
+        with self._lock:
+            self._prepare()
+
+    def _prepare(self):
+        self.leader        = False
         self.promises_rcvd = set()
+        self.recovered     = {}
         self.proposal_id   = IdProposta(self.next_proposal_number, self._addr[1])
         self.next_proposal_number += 1
-        print(f"Proposer sending prepare request with proposal ID: {self.proposal_id}")
-        self.send_message_to_bridge("prp", str(self.proposal_id))
+        self.lease_expiry  = 0.0
+        self._reads        = []
+        self._lease_retry  = True
+        # Se esta tentativa não chegar ao quórum (mensagens perdidas, por exemplo), outra começa depois da espera
+        self._retry_at     = self._transport.now() + self._backoff()
+        log.info("Proposer sending prepare request with proposal ID: %s", self.proposal_id)
+        self._start_round()
+
+    def _backoff(self) -> float:
+        '''
+        Espera aleatória antes da próxima tentativa, dobrando a cada tentativa sem sucesso; a
+        aleatoriedade evita que dois proposers recusados tentem de novo ao mesmo tempo
+        '''
+        delay = min(self.heartbeat_interval * 2 ** self._attempts, self.BACKOFF_MAX)
+        self._attempts += 1
+        return delay * self._transport.random.uniform(0.5, 1.0)
+
+    def recv_nack(self, from_port:int, proposal_id:IdProposta, promised_id:IdProposta):
+        '''
+        Um acceptor recusou um prepare ou um accept deste proposer: ele já prometeu `promised_id`
+        (ou outro proposer tem o lease). Deixa de ser o líder e espera antes de tentar com um id maior
+        '''
+        with self._lock:
+            if proposal_id != self.proposal_id:
+                return  # recusa de uma tentativa antiga
+            self._nacks.inc()
+            self.next_proposal_number = max(self.next_proposal_number, promised_id.id + 1)
+            if self.leader or self.promises_rcvd is not None:
+                log.info("Proposer %s was refused by Acceptor at port %s, which promised %s",
+                         proposal_id, from_port, promised_id)
+                self._step_down()
+
+    def _step_down(self):
+        self.leader        = False
+        self.promises_rcvd = None
+        self.lease_expiry  = 0.0
+        self._round        = None
+        self._retry_at     = self._transport.now() + self._backoff()
+
+    def recv_heartbeat(self, proposal_id:IdProposta, commit_index:int, epoch:int):
+        '''
+        Heartbeat de outro líder. Enquanto eles chegam, este proposer não tenta a liderança. Um
+        proposer que foi recusado aceita o líder mesmo com um id menor que o da sua tentativa: os
+        acceptors com o lease do líder recusam ids maiores
+        '''
+        with self._lock:
+            self.check_epoch(epoch)
+            if self.proposal_id is not None and proposal_id < self.proposal_id and (self.leader or self.promises_rcvd is not None):
+                return  # líder antigo; as suas mensagens serão recusadas pelos acceptors
+            self._leader_seen = self._transport.now()
+            self._leader_hint = proposal_id.porta
+            self.next_proposal_number = max(self.next_proposal_number, proposal_id.id + 1)
+            if self.leader or self.promises_rcvd is not None:
+                log.info("Proposer %s stepping down for leader %s", self.proposal_id, proposal_id)
+                self._step_down()
+
+    def propose(self, value:str|list[str]):
+        '''
+        Adiciona um valor ao log. Se este proposer já é o líder, o valor vai direto para a fase 2;
+        senão, é encaminhado ao líder conhecido (ou fica na fila até haver um). Uma lista é proposta
+        como um único valor e ocupa um único slot
+        '''
+        value = share_large(value, self.share_threshold, self.shared)
+        with self._lock:
+            self.pending.append(value)
+            if self.leader:
+                self._drain_pending()
+            elif self._known_leader() is not None:
+                self._forward()
+
+    def _known_leader(self) -> int|None:
+        '''
+        Porta do líder de quem este proposer ouviu um heartbeat há menos de election_timeout segundos
+        '''
+        if self._leader_hint is None or self._leader_hint == self._addr[1] or self._leader_seen is None:
+            return None
+        if self._transport.now() - self._leader_seen > self.election_timeout:
+            return None
+        return self._leader_hint
+
+    def _commands(self, value) -> list[list]:
+        '''
+        Os comandos da sessão deste proposer para um valor; um lote do Batcher vira um comando por
+        valor, no mesmo slot e na ordem do lote
+        '''
+        items = value if isinstance(value, list) else [value]
+        first = self._own_seq
+        self._own_seq += len(items)
+        for seq, item in enumerate(items, first):
+            self._own[seq] = [item, None]
+        acked = next(iter(self._own))
+        return [[self._client_id, seq, acked, item] for seq, item in enumerate(items, first)]
+
+    def _is_own(self, value) -> bool:
+        return isinstance(value, list) and bool(value) and isinstance(value[0], list) and value[0][0] == self._client_id
+
+    def _forward(self):
+        '''
+        Encaminha ao líder conhecido os valores deste proposer ainda não escolhidos, reenviando os
+        que estão sem resposta há retransmit_timeout segundos. Os lotes de comandos de clientes na
+        fila são descartados: os clientes os reenviam ao novo líder
+        '''
+        leader = self._known_leader()
+        if leader is None:
+            return
+        # Os valores da fila passam para _own; os lotes de comandos deste proposer já estão lá
+        while self.pending:
+            value = self.pending.popleft()
+            if not (isinstance(value, list) and value and isinstance(value[0], list)):
+                self._commands(value)
+        now  = self._transport.now()
+        late = [seq for seq, state in self._own.items() if state[1] is None or now - state[1] >= self.retransmit_timeout]
+        if not late:
+            return
+        acked = next(iter(self._own))
+        batch, size = [], 0
+        for seq in late:
+            state = self._own[seq]
+            if batch and (len(batch) == self.CLIENT_BATCH or size + value_size(state[0]) > self.CLIENT_BYTES):
+                self._transport.send(leader, "sbm", self._addr[1], self._client_id, acked, batch)
+                batch, size = [], 0
+            if state[1] is None:
+                self._forwards.inc()
+            state[1] = now
+            batch.append([seq, state[0]])
+            size += value_size(state[0])
+        self._transport.send(leader, "sbm", self._addr[1], self._client_id, acked, batch)
+
+    def recv_forwarded(self, seqs:list[int], slot:int):
+        '''
+        O líder escolheu, no slot, valores encaminhados por este proposer
+        '''
+        with self._lock:
+            for seq in seqs:
+                self._own.pop(seq, None)
+
+    def recv_redirect(self, from_port:int, leader:int|None):
+        '''
+        O proposer para o qual os valores foram encaminhados não é mais o líder. Eles são
+        reenviados ao líder indicado, ou no próximo heartbeat de um líder
+        '''
+        with self._lock:
+            if leader is None or leader == self._addr[1] or from_port != self._leader_hint:
+                return
+            self._leader_hint = leader
+            for state in self._own.values():
+                state[1] = None
+            self._forward()
+
+    def recv_submit(self, client_port:int, client_id:int, acked:int, requests:list[list]):
+        '''
+        Comandos de um cliente, [sequência, valor] cada. `acked` é a menor sequência que o cliente
+        ainda espera; as anteriores podem ser esquecidas. Se este proposer não é o líder, o cliente
+        é redirecionado
+        '''
+        with self._lock:
+            if not self.leader:
+                self._transport.send(client_port, "rdr", self._addr[1], self._leader_hint)
+                return
+            self._client_ports[client_id] = client_port
+            session = self._sessions.setdefault(client_id, {})
+            while session:
+                seq = next(iter(session))
+                if seq >= acked:
+                    break
+                del session[seq]
+            done = {}
+            for seq, value in requests:
+                if seq < acked:
+                    continue
+                if seq in session:
+                    self._duplicates.inc()
+                    slot = session[seq]
+                    if slot is not None:  # escolhido, mas a resposta se perdeu
+                        done.setdefault(slot, []).append(seq)
+                    continue
+                session[seq] = None
+                self._submitted.append([client_id, seq, acked, value])
+            for slot, seqs in done.items():
+                self._transport.send(client_port, "sbr", seqs, slot)
+
+    def flush(self):
+        '''
+        Chamado quando não há mais mensagens recebidas esperando em uma conexão: os comandos de
+        clientes que chegaram juntos são propostos como lotes
+        '''
+        with self._lock:
+            if not self._submitted:
+                return
+            batch, size = [], 0
+            for command in self._submitted:
+                if batch and (len(batch) == self.CLIENT_BATCH or size + value_size(command[3]) > self.CLIENT_BYTES):
+                    self.pending.append(batch)
+                    batch, size = [], 0
+                batch.append(command)
+                size += value_size(command[3])
+            self.pending.append(batch)
+            self._submitted = []
+            if self.leader:
+                self._drain_pending()
+
+    def _track(self, slot:int, value, chosen:bool):
+        '''
+        Registra nas sessões os comandos de clientes de um slot e, se ele foi escolhido, responde
+        aos clientes. Os comandos deste proposer escolhidos saem de _own
+        '''
+        if not isinstance(value, list) or not value or not isinstance(value[0], list):
+            return
+        replies:dict[int, list[int]] = {}
+        for client_id, seq, _, _ in value:
+            if client_id == self._client_id:
+                if chosen:
+                    self._own.pop(seq, None)
+                continue
+            session = self._sessions.setdefault(client_id, {})
+            if chosen:
+                session[seq] = slot
+                replies.setdefault(client_id, []).append(seq)
+            else:
+                session.setdefault(seq, None)
+        for client_id, seqs in replies.items():
+            port = self._client_ports.get(client_id)
+            if port is not None:
+                self._transport.send(port, "sbr", seqs, slot)
 
-    def recv_promise(self, from_port:str, proposal_id:str, prev_accepted_id:str, prev_accepted_value:str):
+    def recv_promise(self, from_port:int, proposal_id:IdProposta, accepted:list, compacted:int, lease_ms:int, epoch:int,
+                     round:int):
         '''
-        Chamado quando uma promessa chega de um acceptor
+        Chamado quando uma promessa chega de um acceptor. `accepted` traz os (slot, id, valor)
+        que o acceptor já aceitou a partir de first_slot; slots abaixo de `compacted` já foram
+        decididos e descartados pelo acceptor. `round` é o número da rodada do prepare
         '''
-        
-        # Ignora mensagens antigas ou já recebidas do mesmo acceptor
-        proposal_id = IdProposta(*map(int, proposal_id.split(':')))
-        prev_accepted_id = IdProposta(*map(int, prev_accepted_id.split(':')))
-        
-        print(f"Proposer received promise from Acceptor at port {from_port} for proposal {proposal_id}")
+        log.debug("Proposer received promise from Acceptor at port %s for proposal %s", from_port, proposal_id)
 
-        if proposal_id != self.proposal_id or from_port in self.promises_rcvd:
+        with self._lock:
+            self.check_epoch(epoch)
+            if proposal_id != self.proposal_id or (self._members and from_port not in self._members):
+                return # Old message, ou de um acceptor que não está na configuração
+            if self.promises_rcvd is None:
+                return # este proposer já desistiu desta tentativa
+            self._confirm(from_port, lease_ms, round)
+
+            # Ignora promessas já recebidas do mesmo acceptor e as das rodadas de confirmação
+            if from_port in self.promises_rcvd or self.leader:
+                return
+
+            self.promises_rcvd.add(from_port)
+
+            if compacted > self.first_slot:
+                self.decided = {slot for slot in self.decided if slot >= compacted}
+                self.first_slot = compacted
+
+            for slot, accepted_id, value in accepted:
+                if slot < self.first_slot:
+                    continue
+                previous = self.recovered.get(slot)
+                # Se o acceptor já aceitou um valor no slot, o propositor deve propor o tal
+                if previous is None or accepted_id > previous[0]:
+                    self.recovered[slot] = (accepted_id, value)
+
+            # O tamanho do quórum pode chegar depois das promessas; set_quorum() confere de novo
+            if self.prepare_quorum is not None and len(self.promises_rcvd) >= self.prepare_quorum:
+                self._become_leader()
+
+    def _become_leader(self):
+        '''
+        Fase 1 concluída: repropõe com o novo id os valores já aceitos, preenche buracos do log com
+        no-ops (None) e passa a enviar apenas a fase 2 para os valores novos
+        '''
+        self.leader = True
+        self._attempts = 0
+        self._elected.inc()
+        log.info("Proposer is now the leader with proposal %s", self.proposal_id)
+
+        last = max(self.recovered, default=self.first_slot - 1)
+        # Valores nossos que nenhum acceptor do quórum aceitou (o slot ficou vazio ou com o valor de
+        # outro proposer) voltam para a fila
+        lost = [state[1] for slot, state in sorted(self.in_flight.items())
+                if slot >= self.first_slot and state[1] is not None and self.recovered.get(slot, (None, None))[1] != state[1]]
+        self.pending.extendleft(reversed(lost))
+        self.in_flight = {}
+        # Os valores deste proposer que não estão nos slots recuperados voltam para a fila, inclusive
+        # os encaminhados ao líder anterior, que pode ou não tê-los proposto: um comando proposto
+        # duas vezes é aplicado uma vez só pelos learners
+        recovered = {command[1] for _, value in self.recovered.values() if isinstance(value, list)
+                     for command in value if isinstance(command, list) and command[0] == self._client_id}
+        pending, queued = list(self.pending), set()
+        self.pending.clear()  # a mesma fila: o gauge pending_values guarda o seu __len__
+        for value in pending:
+            if self._is_own(value):
+                value = [command for command in value if command[1] in self._own and command[1] not in recovered]
+                queued.update(command[1] for command in value)
+            if value:
+                self.pending.append(value)
+        waiting = [seq for seq in self._own if seq not in recovered and seq not in queued]
+        if waiting:
+            acked = next(iter(self._own))
+            batches = [[[self._client_id, seq, acked, self._own[seq][0]] for seq in waiting[i:i + self.CLIENT_BATCH]]
+                       for i in range(0, len(waiting), self.CLIENT_BATCH)]
+            self.pending.extendleft(reversed(batches))
+
+        for slot in range(self.first_slot, last + 1):
+            if slot not in self.decided:
+                value = self.recovered.get(slot, (None, None))[1]
+                self._track(slot, value, chosen=False)  # comandos de clientes já propostos por outro líder
+                self._send_accept(slot, value)
+
+        # Os slots acima de `last` que não foram decididos estão livres, inclusive os que este
+        # proposer usou antes e nenhum acceptor do quórum aceitou: os seus valores voltaram para a fila
+        self.next_slot = max(last + 1, self.first_slot, max(self.decided, default=-1) + 1)
+        # Os slots recuperados e repropostos podem ter sido escolhidos por outro líder sem que este
+        # saiba: as leituras esperam por todos eles, não só pelos que este líder viu escolhidos
+        self._read_floor = self.next_slot
+        self._drain_pending()
+        if self._round is None:
+            self._start_round()  # os acceptors só concedem o lease quando o mesmo id é confirmado
+
+    def _drain_pending(self):
+        '''
+        Envia valores da fila enquanto houver espaço na janela de slots em andamento
+        '''
+        shared = len(self._proposers) > 1
+        while self.pending and len(self.in_flight) < self.window:
+            slot = self.next_slot
+            self.next_slot += 1
+            value = self.pending.popleft()
+            if shared and not (isinstance(value, list) and value and isinstance(value[0], list)):
+                value = self._commands(value)
+            self._send_accept(slot, value)
+
+    def _send_accept(self, slot:int, value:str|None):
+        targets = None
+        if self.thrifty and self.accept_quorum is not None and len(self._order) > self.accept_quorum:
+            targets = self._order[:self.accept_quorum]
+        now = self._transport.now()
+        self.in_flight[slot] = [self.proposal_id, value, set(), now, targets, now]
+        log.debug("Proposer sending accept request for proposal %s slot %s", self.proposal_id, slot)
+        self.send_message_to_acceptors("act", self.proposal_id, slot, value, self.epoch, slot=slot, ports=targets)
+
+    def _check_accepts(self):
+        '''
+        Reenvia os accepts que não chegaram ao quórum a tempo (mensagens perdidas ou acceptors
+        lentos). No modo thrifty, o primeiro reenvio vai para os acceptors que ainda não receberam o
+        accept. Reagenda a si mesma pelo transporte
+        '''
+        with self._lock:
+            now  = self._transport.now()
+            slow = set()
+            for slot, state in (self.in_flight.items() if self.leader else ()):
+                targets = state[4]
+                if targets is not None and now - state[5] >= self.thrifty_timeout:
+                    others = [a for a in self._acceptors if a not in targets]
+                    self.send_message_to_acceptors("act", state[0], slot, state[1], self.epoch, slot=slot, ports=others)
+                    slow.update(a for a in targets if a not in state[2])
+                    state[4] = None
+                    state[5] = now
+                    self._fallbacks.inc()
+                elif targets is None and now - state[5] >= self.retransmit_timeout:
+                    self.send_message_to_acceptors("act", state[0], slot, state[1], self.epoch, slot=slot)
+                    state[5] = now
+                    self._retransmits.inc()
+            if slow:
+                self._order = [a for a in self._order if a not in slow] + [a for a in self._order if a in slow]
+        self._transport.call_later(self.thrifty_timeout if self.thrifty else self.retransmit_timeout / 2, self._check_accepts)
+
+    def _heartbeat(self):
+        '''
+        O líder avisa os outros proposers e os learners que está ativo; os outros proposers tentam a
+        liderança se o líder ficou em silêncio e a espera da última tentativa acabou. Reagenda a si
+        mesma pelo transporte
+        '''
+        with self._lock:
+            now = self._transport.now()
+            if self.prepare_quorum is None:
+                self.send_message_to_bridge("mbq")  # a configuração enviada pelo bridge não chegou
+            if self.leader:
+                for port in self._proposers + self._learners:
+                    if port != self._addr[1]:
+                        self._transport.send(port, "hbt", self.proposal_id, self.commit_index, self.epoch)
+            elif now >= self._retry_at and (self._leader_seen is None or now - self._leader_seen > self.election_timeout):
+                self._prepare()
+            elif self._own or self.pending:
+                self._forward()
+        self._transport.call_later(self.heartbeat_interval, self._heartbeat)
+
+    def recv_accepted(self, from_port:int, proposal_id:IdProposta, slot:int, value:str|None):
+        '''
+        Chamado quando um acceptor aceita uma proposta deste proposer. Quando o quórum aceita,
+        o slot sai da janela e o próximo valor da fila pode ser enviado
+        '''
+        with self._lock:
+            state = self.in_flight.get(slot)
+            if state is None or proposal_id != state[0] or (self._members and from_port not in self._members):
+                return
+            votes = state[2]
+            votes.add(from_port)
+            if self.accept_quorum is None or len(votes) < self.accept_quorum:
+                return
+            self._chosen_slot(slot, state)
+
+    def recv_compacted(self, from_port:int, compacted:int):
+        '''
+        Um acceptor recusou um accept porque os slots abaixo de `compacted` já estão no snapshot de
+        um learner. Esses slots foram decididos, mas não se sabe com qual valor: saem da janela sem
+        resposta aos clientes, e as sessões esquecem os seus comandos para que um reenvio seja
+        proposto de novo (os learners descartam o comando se ele já tinha sido aplicado). Os
+        comandos deste proposer voltam para a fila
+        '''
+        with self._lock:
+            if (self._members and from_port not in self._members) or compacted <= self.first_slot:
+                return
+            retry = []
+            for slot in [slot for slot in self.in_flight if slot < compacted]:
+                value = self.in_flight.pop(slot)[1]
+                if self._is_own(value):
+                    retry += [command for command in value if command[1] in self._own]
+                elif isinstance(value, list) and value and isinstance(value[0], list):
+                    for client_id, seq, _, _ in value:
+                        session = self._sessions.get(client_id)
+                        if session is not None and session.get(seq, 0) is None:
+                            del session[seq]
+            log.info("Proposer retiring slots below %s, compacted by Acceptor at port %s", compacted, from_port)
+            self.decided    = {slot for slot in self.decided if slot >= compacted}
+            self.first_slot = compacted
+            self.next_slot  = max(self.next_slot, compacted)
+            while self.first_slot in self.decided:
+                self.decided.remove(self.first_slot)
+                self.first_slot += 1
+            if retry:
+                self.pending.appendleft(retry)
+            if self.leader:
+                self._drain_pending()
+
+    def _chosen_slot(self, slot:int, state:list):
+        '''
+        O slot teve o quórum: sai da janela, e o próximo valor da fila pode ser enviado
+        '''
+        del self.in_flight[slot]
+        self._accept_chosen.observe(self._transport.now() - state[3])
+        self._chosen.inc()
+        self.decided.add(slot)
+        while self.first_slot in self.decided:
+            self.decided.remove(self.first_slot)
+            self.first_slot += 1
+        log.debug("Proposer saw slot %s chosen with value %s", slot, state[1])
+        self._track(slot, state[1], chosen=True)
+        if self.leader:
+            self._drain_pending()
+
+    @property
+    def commit_index(self) -> int:
+        '''
+        Slot seguinte ao maior slot que este líder viu ser escolhido
+        '''
+        return max(self.decided) + 1 if self.decided else self.first_slot
+
+    @property
+    def read_index(self) -> int:
+        '''
+        Slot até o qual um learner precisa aplicar antes de responder uma leitura: o commit_index,
+        e pelo menos todos os slots recuperados na eleição deste líder
+        '''
+        return max(self.commit_index, self._read_floor)
+
+    def has_lease(self) -> bool:
+        return self.leader and self._transport.now() < self.lease_expiry
+
+    def recv_read(self, learner_port:int, read_id:int):
+        '''
+        Um learner quer fazer uma leitura linearizável: recebe o índice de leitura, o slot até o qual
+        precisa aplicar antes de responder. Com o lease válido a resposta é imediata; sem ele, só
+        depois de um quórum confirmar que este proposer ainda é o líder
+        '''
+        with self._lock:
+            if not self.leader:
+                return
+            if self.has_lease():
+                self._transport.send(learner_port, "rdi", read_id, self.read_index)
+                return
+            self._reads.append((learner_port, read_id, self.read_index))
+            if self._round is None:
+                self._start_round()
+
+    def _start_round(self):
+        '''
+        Envia um prepare com o id atual. Na primeira vez é a fase 1; depois, confirma a liderança e
+        renova o lease. As leituras pendentes são respondidas quando a rodada chegar ao quórum
+        '''
+        self._rounds += 1
+        self._round = {"id": self._rounds, "start": self._transport.now(), "ports": set(), "leases": [], "reads": self._reads}
+        self._reads = []
+        self.send_message_to_acceptors("prp", self.proposal_id, self.first_slot, self.epoch, self._rounds)
+
+    def _confirm(self, from_port:int, lease_ms:int, round:int):
+        r = self._round
+        if r is None or round != r["id"] or from_port in r["ports"]:
+            return  # resposta atrasada de outra rodada: o seu lease conta de outro envio
+        r["ports"].add(from_port)
+        if lease_ms > 0:
+            r["leases"].append(lease_ms / 1000)
+        if self.prepare_quorum is None or len(r["ports"]) < self.prepare_quorum:
             return
 
-        self.promises_rcvd.add(from_port)
-        
-        if prev_accepted_id > self.last_accepted_id:
-            self.last_accepted_id = prev_accepted_id
-            # Se o acceptor já aceitou um valor, o propositor deve mudar seu valor para o tal
-            if prev_accepted_value:
-                self.proposed_value = prev_accepted_value
-
-        if len(self.promises_rcvd) >= self.quorum_size:
-            if self.proposed_value is not None:
-                print(f"Proposer sending accept request for proposal {self.proposal_id}")
-                self.send_message_to_bridge("act", str(self.proposal_id), self.proposed_value)
-
-    def set_quorum(self, value:str):
-        self.quorum_size = int(value)
+        self._round = None
+        self._promise_quorum.observe(self._transport.now() - r["start"])
+        if len(r["leases"]) >= self._lease_quorum:
+            # O lease conta a partir do envio do prepare, antes de qualquer acceptor o conceder
+            self._lease = min(r["leases"])
+            self.lease_expiry = r["start"] + self._lease * (1 - self.lease_drift) - self.lease_margin
+        # Sem nenhum lease na rodada, os acceptors não concedem leases e não adianta tentar de novo
+        self._lease_retry = bool(r["leases"])
+        for port, read_id, index in r["reads"]:
+            self._transport.send(port, "rdi", read_id, index)
+
+    def _renew_lease(self):
+        '''
+        Renova o lease antes que ele expire, tenta de novo enquanto não tem um, e refaz rodadas de
+        confirmação perdidas. Reagenda a si mesma pelo transporte
+        '''
+        with self._lock:
+            if self.leader:
+                now = self._transport.now()
+                if self._round is not None and now - self._round["start"] > max(self._lease, 1.0):
+                    # Nenhum quórum respondeu: as leituras voltam para a próxima rodada
+                    self._reads = self._round["reads"] + self._reads
+                    self._round = None
+                if self._round is None and (self._reads or self._lease or self._lease_retry):
+                    self._start_round()
+        self._transport.call_later(self._lease / 3 if self._lease else 0.1, self._renew_lease)
+
+    def set_quorum(self, value:int):
+        '''
+        Resposta a "qrm": o mesmo tamanho nas duas fases
+        '''
+        with self._lock:
+            self.set_quorums(value, value)
+            if not self.leader and self.promises_rcvd and len(self.promises_rcvd) >= value:
+                self._become_leader()
+
+    def set_quorums(self, prepare_quorum:int, accept_quorum:int):
+        self.prepare_quorum = prepare_quorum
+        self.accept_quorum  = accept_quorum
+        # Um lease só é seguro se os acceptors que o concederam estão em todo Q1 possível: com N
+        # acceptors, são N - Q1 + 1. Se for mais que Q1, a rodada termina antes e o lease não é usado
+        self._lease_quorum  = max(len(self._acceptors) - prepare_quorum + 1, prepare_quorum)
     
-    def run(self):
-        self._listner.start()
+    def start(self):
+        '''
+        O mesmo que run(), sem bloquear: começa a escutar e tenta se tornar o líder
+        '''
+        self.listen()
+        if self.direct:
+            self.request_membership()
         self.prepare()
+        self.start_timers()
+
+    def start_timers(self):
+        '''
+        Agenda as tarefas periódicas: renovação do lease, reenvio dos accepts e heartbeats/eleição
+        '''
+        self._transport.call_later(0.1, self._renew_lease)
+        self._transport.call_later(self.thrifty_timeout if self.thrifty else self.retransmit_timeout / 2, self._check_accepts)
+        self._transport.call_later(self.heartbeat_interval, self._heartbeat)
+
+    def run(self):
+        self.start()
         self._listner.join()
@@ -0,0 +1,65 @@
+from bisect import bisect
+import hashlib
+
+
+class HashRing:
+    '''
+    Hash consistente: cada nó ocupa `replicas` pontos do anel e uma chave pertence ao primeiro
+    ponto depois do seu hash. Adicionar ou remover um nó só move as chaves vizinhas dele.
+    '''
+    def __init__(self, nodes:list[int], replicas:int=64):
+        self._points:list[int] = []
+        self._owners:list[int] = []
+        ring = sorted((self._hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        for point, node in ring:
+            self._points.append(point)
+            self._owners.append(node)
+
+    @staticmethod
+    def _hash(key) -> int:
+        return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+    def lookup(self, key) -> int:
+        if not self._points:
+            raise LookupError("empty hash ring")
+        i = bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+class ShardMap:
+    '''
+    Escolhe por qual bridge de um cluster de bridges cada mensagem é roteada.
+
+    - shard_by="proposer": todas as mensagens de um proposer (prepare, promessas, accepts e
+      aceites) passam pelo mesmo bridge, escolhido pela porta do proposer
+    - shard_by="slot": a fase 1 segue o proposer, e a fase 2 é distribuída por faixas de
+      `slot_range` slots, de modo que um único líder também usa todos os bridges
+    '''
+    SHARD_BY = ("proposer", "slot")
+
+    def __init__(self, ports:list[int], shard_by:str="proposer", slot_range:int=64):
+        if shard_by not in self.SHARD_BY:
+            raise ValueError(f"Unknown sharding {shard_by!r}, expected one of {self.SHARD_BY}")
+        self.ports      = list(ports)
+        self.shard_by   = shard_by
+        self.slot_range = slot_range
+        # Com um único bridge não há o que escolher, e o anel nem é montado
+        self._ring      = HashRing(self.ports) if len(self.ports) > 1 else None
+
+    def home(self, port:int) -> int:
+        '''
+        Bridge usado por um nó para registro e consultas
+        '''
+        if len(self.ports) == 1:
+            return self.ports[0]
+        return self._ring.lookup(port)
+
+    def select(self, proposer_port:int, slot:int|None=None) -> int:
+        '''
+        Bridge que roteia uma mensagem do protocolo da proposta de `proposer_port`
+        '''
+        if len(self.ports) == 1:
+            return self.ports[0]
+        if self.shard_by == "slot" and slot is not None:
+            return self._ring.lookup(f"slot:{slot // self.slot_range}")
+        return self._ring.lookup(proposer_port)
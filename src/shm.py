@@ -0,0 +1,197 @@
+'''
+Valores grandes em memória compartilhada, para nós que rodam no mesmo host.
+
+share() copia o valor uma única vez para um segmento de multiprocessing.shared_memory e retorna um
+SharedValue: um handle de poucos bytes (nome do segmento, tamanho e tipo) que o codec envia no
+lugar do valor. Proposers, bridges e acceptors só repassam e guardam o handle, então o custo de
+cada mensagem não cresce com o tamanho do valor. O conteúdo só é lido pelos learners, uma vez, ao
+aplicar o valor (SharedValue.load()).
+
+    proposer = Proposer(bridge_port, share_threshold=THRESHOLD)
+
+Os segmentos são removidos (release()) pelos learners um snapshot depois do que cobre o slot, o
+que dá aos learners atrasados um intervalo entre snapshots para aplicá-los. Quem cria os segmentos
+(Client e Proposer) guarda os nomes em um Segments (`owner` em share()), que esquece os segmentos
+já removidos, e Client.close() e Cluster.close() removem os que sobraram com unlink(); os que ainda
+restam quando o processo termina são removidos no atexit. Cluster com `share_threshold` sempre dá
+um diretório de snapshots aos learners, senão os segmentos só seriam removidos no fim. O WAL dos acceptors guarda só o handle, que não sobrevive a um
+reboot do host.
+'''
+
+from multiprocessing import shared_memory, resource_tracker
+from threading import Lock
+import atexit
+import sys
+import os
+
+if os.name == "posix":
+    import _posixshmem  # fora do POSIX o segmento some quando o último handle é fechado
+
+THRESHOLD = 64 * 1024  # bytes (ou caracteres) a partir dos quais um valor vai para a memória compartilhada
+
+
+class SharedValue:
+    '''
+    Handle de um valor em um segmento de memória compartilhada. Dois handles são iguais se
+    apontam para o mesmo segmento
+    '''
+    __slots__ = ("name", "size", "is_str")
+
+    def __init__(self, name:str, size:int, is_str:bool):
+        self.name   = name
+        self.size   = size
+        self.is_str = is_str
+
+    def load(self) -> str|bytes:
+        '''
+        Copia o valor do segmento. Levanta FileNotFoundError se o segmento já foi removido
+        '''
+        if os.name == "posix":
+            # Leitura direta do descritor, fora do resource_tracker, que não aceita dois learners do
+            # mesmo processo abrindo o mesmo segmento ao mesmo tempo
+            fd = _posixshmem.shm_open("/" + self.name, os.O_RDONLY)
+            try:
+                data = os.pread(fd, self.size, 0)
+            finally:
+                os.close(fd)
+        else:
+            segment = _segment(self.name)
+            try:
+                data = bytes(segment.buf[:self.size])
+            finally:
+                segment.close()
+        return data.decode() if self.is_str else data
+
+    def release(self):
+        '''
+        Remove o segmento. Os processos que já o mapearam continuam lendo até fechá-lo
+        '''
+        if os.name == "posix":
+            # Só o nome é removido, sem abrir o segmento nem passar pelo resource_tracker: dois
+            # learners do mesmo processo podem remover o mesmo segmento ao mesmo tempo
+            try:
+                _posixshmem.shm_unlink("/" + self.name)
+            except FileNotFoundError:
+                pass  # já removido por outro learner
+        _created.discard(self.name)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SharedValue) and other.name == self.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+    def __repr__(self) -> str:
+        return f"SharedValue({self.name!r}, {self.size})"
+
+
+class Segments:
+    '''
+    Nomes dos segmentos criados por um dono (Client, Proposer), para que ele os remova com
+    unlink(). Os learners removem os segmentos dos valores que já estão em um snapshot, então,
+    sempre que o conjunto dobra de tamanho, os nomes dos segmentos que já não existem são
+    esquecidos: o conjunto fica limitado pelos segmentos vivos
+    '''
+    PRUNE = 1024  # nomes a partir dos quais o conjunto é podado
+
+    def __init__(self):
+        self._names:set[str] = set()
+        self._limit = self.PRUNE
+        self._lock  = Lock()  # Proposer.propose() cria segmentos fora do lock do proposer
+
+    def add(self, name:str):
+        with self._lock:
+            self._names.add(name)
+            if len(self._names) >= self._limit:
+                self._names = {name for name in self._names if _exists(name)}
+                self._limit = max(self.PRUNE, 2 * len(self._names))
+
+    def discard(self, name:str):
+        with self._lock:
+            self._names.discard(name)
+
+    def pop(self) -> str|None:
+        with self._lock:
+            return self._names.pop() if self._names else None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name:str) -> bool:
+        return name in self._names
+
+
+def share(value:str|bytes, owner:Segments|None=None) -> SharedValue:
+    '''
+    Copia o valor para um novo segmento de memória compartilhada. O nome do segmento é guardado
+    em `owner`, para que o dono o remova com unlink()
+    '''
+    raw = value.encode() if isinstance(value, str) else value
+    segment = _segment(size=max(len(raw), 1))
+    try:
+        segment.buf[:len(raw)] = raw
+    finally:
+        segment.close()
+    _created.add(segment.name)
+    if owner is not None:
+        owner.add(segment.name)
+    return SharedValue(segment.name, len(raw), isinstance(value, str))
+
+
+def share_large(value, threshold:int|None, owner:Segments|None=None):
+    '''
+    Substitui por um SharedValue o valor (ou cada valor de um lote) com pelo menos `threshold`
+    bytes; os outros continuam sendo enviados dentro das mensagens
+    '''
+    if threshold is None:
+        return value
+    if isinstance(value, list):
+        return [share_large(item, threshold, owner) for item in value]
+    if isinstance(value, (str, bytes)) and len(value) >= threshold:
+        return share(value, owner)
+    return value
+
+
+def unlink(segments:Segments):
+    '''
+    Remove os segmentos de `segments` que ainda existem e esvazia o conjunto
+    '''
+    name = segments.pop()
+    while name is not None:
+        SharedValue(name, 0, False).release()
+        name = segments.pop()
+
+
+_created = Segments()  # segmentos criados por este processo e ainda não removidos
+atexit.register(unlink, _created)  # o que o dono não removeu; release() já tira o nome do conjunto
+
+# track=False só existe a partir do Python 3.13
+_TRACK_ARGUMENT = sys.version_info >= (3, 13)
+
+
+def _segment(name:str|None=None, size:int=0) -> shared_memory.SharedMemory:
+    '''
+    Abre o segmento `name`, ou cria um novo sem nome, fora do resource_tracker. O tracker remove
+    os segmentos registrados quando o processo termina, e os segmentos precisam sobreviver a quem
+    os leu, e a quem os criou enquanto o processo dele existir. Antes do 3.13 o segmento é
+    registrado ao abrir e só ele é tirado do registro logo em seguida
+    '''
+    if _TRACK_ARGUMENT:
+        return shared_memory.SharedMemory(name, create=name is None, size=size, track=False)
+    segment = shared_memory.SharedMemory(name, create=name is None, size=size)
+    if os.name == "posix":
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+_SHM_DIR = "/dev/shm"  # onde o Linux expõe os segmentos
+
+
+def _exists(name:str) -> bool:
+    if os.path.isdir(_SHM_DIR):
+        return os.path.exists(os.path.join(_SHM_DIR, name.lstrip("/")))
+    try:
+        _segment(name).close()
+    except FileNotFoundError:
+        return False
+    return True
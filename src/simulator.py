@@ -0,0 +1,220 @@
+'''
+Rede simulada em memória, para testes e modelagem de desempenho sem sockets, processos ou sleeps.
+
+Todos os nós rodam em uma única thread, com tempo virtual: as mensagens e os timers são eventos em
+uma fila ordenada pelo instante em que acontecem, e cada evento é processado até o fim antes do
+próximo. Com a mesma semente, a mesma execução se repete exatamente.
+
+    sim = Simulator(seed=1, drop=0.01)
+    bridge = Bridge(transport=sim.transport())
+    nodes = [Acceptor(bridge.port, transport=sim.transport()) for _ in range(3)]
+    ...
+    sim.start(*nodes)
+    sim.run_until(lambda: len(learner.log) == 100, timeout=10.0)
+'''
+
+from .codec import HEADER_SIZE, decode, encode
+from .proposer import Proposer
+from .learner import Learner
+import heapq
+import random
+
+
+class SimTransport:
+    '''
+    Transporte de um nó na rede simulada; mesma interface de transport.TcpTransport
+    '''
+    def __init__(self, sim:"Simulator", port:int):
+        self.sim    = sim
+        self.addr   = ("sim", port)
+        self.random = sim.random
+        self.handler = None
+        self.on_idle = None
+        self._backlog:list[tuple[int, bytes]] = []  # mensagens que chegaram antes de listen()
+
+    def instrument(self, metrics):
+        pass
+
+    def now(self) -> float:
+        return self.sim.time
+
+    def send(self, port:int, reqtype:str, *args) -> bool:
+        if self.sim.serialize:
+            self.sim.send(self.addr[1], port, encode(reqtype, *args))
+        else:
+            self.sim.send(self.addr[1], port, [reqtype, *args])
+        return True
+
+    def listen(self, handler, on_idle=None):
+        self.handler = handler
+        self.on_idle = on_idle
+        for peer, frame in self._backlog:
+            self.sim._push(self.sim.time, self.addr[1], False, self.deliver, (peer, frame))
+        self._backlog = []
+
+    def call_later(self, delay:float, fn):
+        self.sim.schedule(delay, fn, port=self.addr[1])
+
+    def deliver(self, peer:int, frame:bytes|list):
+        if self.handler is None:
+            self._backlog.append((peer, frame))
+            return
+        self.handler(peer, decode(memoryview(frame)[HEADER_SIZE:]) if self.sim.serialize else frame)
+
+    def close(self):
+        self.sim.crash(self.addr[1])
+
+
+class Simulator:
+    '''
+    Cada mensagem passa pelo codec, como na rede real, e leva um atraso sorteado em `latency`
+    (segundos virtuais); com probabilidade `drop` ela é perdida. Por padrão cada ligação entrega
+    em ordem, como uma conexão TCP; com reorder=True as mensagens de uma ligação podem se
+    ultrapassar. Com serialize=False as mensagens são entregues sem passar pelo codec, o que é mais
+    rápido, mas os nós passam a compartilhar os objetos enviados e `bytes` não é contado.
+
+    Um nó derrubado com crash() não envia nem recebe mensagens, e os seus timers ficam parados até
+    recover(). O estado em memória é mantido, como em um acceptor com WAL sync="always". Exceções
+    dos handlers não são tratadas: sobem para quem chamou step()/run(), o que interessa para fuzzing.
+
+    O WAL com sync="group" ou "interval" e Learner.read() usam threads e não funcionam na simulação.
+    '''
+    def __init__(self, seed:int=0, latency:tuple[float, float]=(0.0005, 0.002), drop:float=0.0, reorder:bool=False,
+                 serialize:bool=True):
+        self.random    = random.Random(seed)
+        self.latency   = latency
+        self.drop      = drop
+        self.reorder   = reorder
+        self.serialize = serialize
+        self.time      = 0.0
+
+        self.sent      = 0  # mensagens enviadas
+        self.bytes     = 0  # bytes enviados
+        self.dropped   = 0  # mensagens perdidas (sorteio, nó derrubado ou destino inexistente)
+        self.delivered = 0
+
+        self.crashed:set[int] = set()
+        self._nodes:dict[int, SimTransport] = {}
+        self._events:list[tuple] = []  # heap de (instante, sequência, porta, timer, função, args)
+        self._seq = 0
+        self._links:dict[tuple[int, int], float] = {}  # (origem, destino) => última entrega agendada
+        self._frozen:dict[int, list] = {}              # porta => timers parados de um nó derrubado
+
+    def transport(self) -> SimTransport:
+        port = len(self._nodes) + 1
+        transport = self._nodes[port] = SimTransport(self, port)
+        return transport
+
+    def schedule(self, delay:float, fn, *args, port:int|None=None):
+        '''
+        Chama fn(*args) daqui a `delay` segundos virtuais. Com `port`, é um timer desse nó e fica
+        parado enquanto ele estiver derrubado
+        '''
+        self._push(self.time + delay, port, True, fn, args)
+
+    def _push(self, at:float, port:int|None, timer:bool, fn, args:tuple):
+        self._seq += 1
+        heapq.heappush(self._events, (at, self._seq, port, timer, fn, args))
+
+    def send(self, src:int, dst:int, frame:bytes|list):
+        self.sent += 1
+        if self.serialize:
+            self.bytes += len(frame)
+        if src in self.crashed or dst not in self._nodes or (self.drop and self.random.random() < self.drop):
+            self.dropped += 1
+            return
+        at = self.time + self.random.uniform(*self.latency)
+        if not self.reorder:
+            link = (src, dst)
+            at = self._links[link] = max(at, self._links.get(link, 0.0))
+        self._push(at, dst, False, self._nodes[dst].deliver, (src, frame))
+
+    def crash(self, port:int):
+        self.crashed.add(port)
+
+    def recover(self, port:int):
+        self.crashed.discard(port)
+        for fn in self._frozen.pop(port, []):
+            self.schedule(0.0, fn, port=port)
+
+    def step(self) -> bool:
+        '''
+        Processa o próximo evento. Retorna False se não há mais eventos
+        '''
+        if not self._events:
+            return False
+        at, _, port, timer, fn, args = heapq.heappop(self._events)
+        self.time = max(self.time, at)
+        if port in self.crashed:
+            if timer:
+                self._frozen.setdefault(port, []).append(fn)
+            else:
+                self.dropped += 1
+            return True
+        fn(*args)
+        if timer:
+            return True
+        self.delivered += 1
+        # Como o FrameReader, chama on_idle quando acabam as mensagens que chegaram juntas ao nó
+        node = self._nodes[port]
+        if node.on_idle is not None and not (self._events and self._events[0][2] == port
+                                             and not self._events[0][3] and self._events[0][0] <= self.time):
+            node.on_idle()
+        return True
+
+    def run(self, duration:float|None=None, max_events:int|None=None) -> int:
+        '''
+        Processa eventos por `duration` segundos virtuais (ou até acabarem) e retorna quantos foram
+        processados. Os timers dos proposers nunca acabam, então com eles é preciso um limite
+        '''
+        end = None if duration is None else self.time + duration
+        count = 0
+        while self._events and (end is None or self._events[0][0] <= end):
+            if max_events is not None and count >= max_events:
+                break
+            self.step()
+            count += 1
+        if end is not None and (max_events is None or count < max_events):
+            self.time = max(self.time, end)
+        return count
+
+    def run_until(self, predicate, timeout:float|None=None) -> bool:
+        '''
+        Processa eventos até predicate() ser verdadeiro ou passarem `timeout` segundos virtuais
+        '''
+        end = None if timeout is None else self.time + timeout
+        while not predicate():
+            if not self._events or (end is not None and self._events[0][0] > end):
+                return predicate()
+            self.step()
+        return True
+
+    def start(self, *nodes, timeout:float=1.0):
+        '''
+        Equivalente a node.run() para nós criados com transportes deste simulador: começa a entregar
+        as mensagens e, para proposers e learners, faz os primeiros passos de run() sem bloquear.
+        O bridge não entra aqui, porque já começa a escutar ao ser criado
+        '''
+        for node in nodes:
+            node.listen()
+        # Como o Cluster: nenhum nó começa antes de o bridge confirmar todos os registros enviados
+        # na criação dos nós. Com perda de mensagens, os registros sem confirmação são reenviados
+        deadline = self.time + timeout
+        while True:
+            self.run(2 * self.latency[1])
+            missing = [node for node in nodes if not node._registered.is_set()]
+            if not missing or self.time >= deadline:
+                break
+            for node in missing:
+                node.register()
+        direct = [node for node in nodes if node.direct]
+        for node in direct:
+            node.send_message_to_bridge("mbq")
+        self.run_until(lambda: all(node._membership.is_set() for node in direct), timeout)
+        for node in nodes:
+            if isinstance(node, Proposer):
+                node.prepare()
+                node.start_timers()
+            elif isinstance(node, Learner):
+                with node._lock:
+                    node.catch_up()
@@ -0,0 +1,177 @@
+'''
+Snapshot do estado aplicado por um learner.
+
+Formato do arquivo (little endian):
+    cabeçalho:  magic "PXSN", versão, próximo slot a aplicar, número de valores e tamanho da área
+                de sessões (a versão 1, sem sessões, não tem este último campo)
+    offsets:    (count + 1) inteiros de 8 bytes com o início de cada valor na área de dados
+    dados:      cada valor é 1 byte de tipo (0 = str, 1 = bytes) seguido do conteúdo
+    sessões:    número de clientes e, para cada um, id, menor sequência esperada, quantas
+                sequências a partir dela já foram aplicadas e essas sequências
+
+O arquivo é aberto com mmap e os valores só são lidos quando acessados, então o tempo de
+abertura e a memória residente não crescem com o tamanho do log.
+'''
+
+from array import array
+import struct
+import mmap
+import sys
+import os
+
+MAGIC   = b"PXSN"
+VERSION = 2
+
+_HEADER  = struct.Struct("<4sBQQ")
+_OFFSET  = struct.Struct("<Q")
+_SESSION = struct.Struct("<QQI")  # id do cliente, menor sequência esperada, sequências aplicadas
+
+_STR, _BYTES = b'\x00', b'\x01'
+
+
+class Snapshot:
+    def __init__(self, path:str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.next_slot, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a snapshot file")
+        self._offsets  = _HEADER.size
+        self._sessions = 0  # tamanho da área de sessões, no fim do arquivo
+        if version > 1:
+            (self._sessions,) = _OFFSET.unpack_from(self._map, self._offsets)
+            self._offsets += _OFFSET.size
+        self._data = self._offsets + _OFFSET.size * (self.count + 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index:int) -> str|bytes:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("snapshot index out of range")
+        start, end = struct.unpack_from("<QQ", self._map, self._offsets + _OFFSET.size * index)
+        raw = self._map[self._data + start:self._data + end]
+        return raw[1:].decode() if raw[:1] == _STR else raw[1:]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    @property
+    def data_size(self) -> int:
+        return len(self._map) - self._data - self._sessions
+
+    def sessions(self) -> list[list]:
+        '''
+        Sessões dos clientes no momento do snapshot: [id, menor sequência esperada, sequências já
+        aplicadas a partir dela] para cada cliente
+        '''
+        sessions = []
+        if not self._sessions:
+            return sessions
+        position = len(self._map) - self._sessions
+        (count,) = _OFFSET.unpack_from(self._map, position)
+        position += _OFFSET.size
+        for _ in range(count):
+            client_id, low, size = _SESSION.unpack_from(self._map, position)
+            position += _SESSION.size
+            seqs = array("Q", self._map[position:position + _OFFSET.size * size])
+            if sys.byteorder != "little":
+                seqs.byteswap()
+            position += _OFFSET.size * size
+            sessions.append([client_id, low, seqs.tolist()])
+        return sessions
+
+    @property
+    def size(self) -> int:
+        '''
+        Tamanho do arquivo, para transferência a outro learner
+        '''
+        return len(self._map)
+
+    def read(self, offset:int, size:int) -> bytes:
+        '''
+        Bytes brutos do arquivo a partir de `offset`
+        '''
+        return self._map[offset:offset + size]
+
+    def close(self):
+        self._map.close()
+
+    @staticmethod
+    def write(path:str, next_slot:int, values:list, previous:"Snapshot|None"=None,
+              sessions:list[list]|None=None) -> "Snapshot":
+        '''
+        Grava um snapshot com os valores de `previous` seguidos de `values` e as sessões dos
+        clientes (no formato de sessions()). O conteúdo anterior é copiado em bloco do mmap, sem
+        decodificar os valores. O arquivo novo substitui o antigo atomicamente (rename) e é
+        devolvido já aberto
+        '''
+        chunks = [value.encode() if isinstance(value, str) else value for value in values]
+        kinds  = [_STR if isinstance(value, str) else _BYTES for value in values]
+
+        base  = previous.data_size if previous is not None else 0
+        count = (previous.count if previous is not None else 0) + len(values)
+        offsets = array("Q")
+        position = base
+        for chunk in chunks:
+            position += 1 + len(chunk)
+            offsets.append(position)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+
+        table = [_OFFSET.pack(len(sessions or ()))]
+        for client_id, low, seqs in sessions or ():
+            table.append(_SESSION.pack(client_id, low, len(seqs)))
+            seqs = array("Q", seqs)
+            if sys.byteorder != "little":
+                seqs.byteswap()
+            table.append(seqs.tobytes())
+        table = b''.join(table)
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, next_slot, count))
+            f.write(_OFFSET.pack(len(table)))
+            if previous is not None:
+                with memoryview(previous._map) as old:
+                    f.write(old[previous._offsets:previous._data])
+                    f.write(offsets.tobytes())
+                    f.write(old[previous._data:previous._data + previous.data_size])
+            else:
+                f.write(_OFFSET.pack(0))
+                f.write(offsets.tobytes())
+            for kind, chunk in zip(kinds, chunks):
+                f.write(kind)
+                f.write(chunk)
+            f.write(table)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        fsync_dir(path)
+        return Snapshot(path)
+
+
+def install(tmp:str, path:str) -> Snapshot:
+    '''
+    Torna durável um snapshot recebido de outro learner em `tmp` e o coloca no lugar de `path`
+    '''
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+    return Snapshot(path)
+
+
+def fsync_dir(path:str):
+    '''
+    Garante que o rename de um arquivo no diretório seja durável
+    '''
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,125 @@
+_MIXED = -1  # a linha tem votos com ballots diferentes
+_DONE  = -2  # a linha já foi decidida e espera advance()
+
+
+class QuorumTally:
+    '''
+    Contagem de votos (aceites) dos slots ainda não decididos.
+
+    Cada slot ativo tem uma linha em um dict, criada no primeiro voto e removida por advance()
+    quando o learner aplica o slot, então a memória é limitada pela janela de slots ativos. Quase
+    sempre todos os votos de um slot têm o mesmo ballot, o do líder: a linha guarda esse ballot, o
+    valor e a lista dos acceptors que votaram nele, e add() decide o slot com um teste de
+    pertinência e um append, sem nenhum dict por slot. Só quando chegam ballots diferentes a linha
+    passa a guardar o último ballot de cada acceptor e o valor e os votos de cada ballot. Um slot
+    decidido fica marcado até advance(), e os votos atrasados que chegam para ele são descartados.
+    '''
+
+    def __init__(self, quorum:int=1, base:int=0):
+        self.quorum = max(quorum, 1)
+        self.base   = base  # o próximo slot a ser aplicado pelo learner
+        # slot => [ballot, valor, portas] com um único ballot, ou
+        #         [_MIXED, {ballot: [valor, votos]}, {porta: último ballot}], ou [_DONE, None, None]
+        self._rows:dict[int, list] = {}
+        self._decided:list[tuple[int, object]] = []  # (slot, valor) decididos desde o último collect()
+
+    def set_quorum(self, quorum:int):
+        previous, self.quorum = self.quorum, max(quorum, 1)
+        if self.quorum >= previous:
+            return  # nenhuma linha ainda aberta alcança um quórum igual ou maior
+        for slot, row in self._rows.items():
+            if row[0] == _DONE:
+                continue
+            if row[0] != _MIXED:
+                if len(row[2]) >= self.quorum:
+                    self._decide(slot, row, row[1])
+                continue
+            for value, votes in row[1].values():
+                if votes >= self.quorum:
+                    self._decide(slot, row, value)
+                    break
+
+    def add(self, slot:int, port:int, ballot:int, value) -> bool:
+        '''
+        Registra o voto de um acceptor. Retorna False se a mensagem for antiga (o slot já foi
+        decidido, ou o acceptor já informou um ballot maior ou igual para o slot)
+        '''
+        row = self._rows.get(slot)
+        if row is None:
+            if slot < self.base:
+                return False
+            row = self._rows[slot] = [ballot, value, [port]]
+            if self.quorum == 1:
+                self._decide(slot, row, value)
+            return True
+        if row[0] == ballot:
+            ports = row[2]
+            if port in ports:
+                return False
+            ports.append(port)
+            if len(ports) >= self.quorum:
+                self._decide(slot, row, value)
+            return True
+        if row[0] == _DONE:
+            return False
+        return self._add_mixed(slot, row, port, ballot, value)
+
+    def _add_mixed(self, slot:int, row:list, port:int, ballot:int, value) -> bool:
+        if row[0] != _MIXED:
+            row[:] = [_MIXED, {row[0]: [row[1], len(row[2])]}, dict.fromkeys(row[2], row[0])]
+        if ballot <= row[2].get(port, 0):
+            return False
+        row[2][port] = ballot
+        # Como os ballots de cada acceptor só crescem, os votos de um ballot não diminuem quando um
+        # acceptor passa a outro: o valor foi aceito por um quórum naquele ballot
+        entry = row[1].setdefault(ballot, [value, 0])
+        entry[1] += 1
+        if entry[1] >= self.quorum:
+            self._decide(slot, row, value)
+        return True
+
+    def _decide(self, slot:int, row:list, value):
+        self._decided.append((slot, value))
+        row[:] = [_DONE, None, None]  # a linha é removida por advance()
+
+    def collect(self) -> list[tuple[int, object]]:
+        '''
+        Retorna (slot, valor) de cada slot decidido desde a última chamada
+        '''
+        decided, self._decided = self._decided, []
+        return decided
+
+    def discard(self, slot:int):
+        '''
+        Libera a linha de um slot
+        '''
+        self._rows.pop(slot, None)
+
+    def advance(self, base:int):
+        '''
+        Move o início da janela; os slots abaixo de `base` já foram aplicados
+        '''
+        if base <= self.base:
+            return
+        rows = self._rows
+        if base - self.base > len(rows):
+            # Salto grande (snapshot instalado): mais barato filtrar as linhas que percorrer os slots
+            self._rows = {slot: row for slot, row in rows.items() if slot >= base}
+        else:
+            for slot in range(self.base, base):
+                rows.pop(slot, None)
+        self.base = base
+
+    def remove(self, port:int):
+        '''
+        Descarta os votos de um acceptor que saiu da configuração
+        '''
+        for slot, row in list(self._rows.items()):
+            if row[0] == _MIXED:
+                ballot = row[2].pop(port, None)
+                if ballot is not None:
+                    row[1][ballot][1] -= 1
+            elif row[0] != _DONE and port in row[2]:
+                row[2].remove(port)
+                if not row[2]:
+                    del self._rows[slot]
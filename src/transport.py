@@ -0,0 +1,125 @@
+from .connection import ConnectionPool, serve, tcp_address
+from .id_proposta import PORT_MAX
+from threading import Thread, Timer
+import tempfile
+import random
+import socket
+import errno
+import time
+import os
+
+# Diretório padrão dos sockets AF_UNIX, o mesmo para todos os processos do host
+SOCKET_DIR = os.path.join(tempfile.gettempdir(), "pyxos")
+
+
+class TcpTransport:
+    '''
+    Transporte padrão dos nós e do bridge: um socket TCP de escuta em localhost e conexões
+    persistentes (ConnectionPool) para os destinos.
+
+    Os nós só usam a interface abaixo, então qualquer objeto que a implemente pode substituir este
+    transporte (ver simulator.SimTransport):
+      addr                         endereço de escuta; addr[1] é a porta que identifica o nó
+      send(port, reqtype, *args)   enfileira uma mensagem, sem esperar a entrega
+      listen(handler, on_idle)     começa a entregar as mensagens recebidas a handler(porta, data)
+      call_later(delay, fn)        chama fn() depois de `delay` segundos
+      now()                        relógio monotônico usado em leases e timeouts
+      random                       fonte de aleatoriedade do nó
+      instrument(metrics)          registra as métricas de envio no Registry do nó
+      close()
+    '''
+    def __init__(self, queue_size:int=1024, retries:int=3):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("localhost", 0))
+        self.sock.listen()
+        self.addr:tuple[str, int] = self.sock.getsockname()
+        self.random = random.Random()
+        self._pool  = ConnectionPool(self.addr[1], queue_size, retries)
+
+    now = staticmethod(time.monotonic)
+    address = staticmethod(tcp_address)  # endereço de conexão de uma porta
+
+    def instrument(self, metrics):
+        self._pool.metrics = metrics
+
+    def send(self, port:int, reqtype:str, *args) -> bool:
+        return self._pool.send(port, reqtype, *args)
+
+    def listen(self, handler, on_idle=None) -> Thread:
+        '''
+        Atende as conexões recebidas em uma thread própria, que é retornada
+        '''
+        thread = Thread(target=serve, args=(self.sock, handler, on_idle), daemon=True)
+        thread.start()
+        return thread
+
+    def call_later(self, delay:float, fn) -> Timer:
+        timer = Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def close(self):
+        self.sock.close()
+        self._pool.close()
+
+
+class UnixTransport(TcpTransport):
+    '''
+    Transporte para nós no mesmo host: sockets AF_UNIX em vez de TCP em localhost, sem a pilha TCP
+    (checksums, controle de congestionamento, loopback) em cada mensagem.
+
+    Os nós continuam identificados por um número de 16 bits, que vai nos ids de proposta: cada nó
+    escuta em <directory>/<porta>.sock, com um número livre sorteado. Os nós de um cluster e o
+    bridge precisam usar todos o mesmo transporte e o mesmo diretório.
+    '''
+    def __init__(self, queue_size:int=1024, retries:int=3, directory:str=SOCKET_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.random = random.Random()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        while True:
+            port = self.random.randint(1024, PORT_MAX)
+            try:
+                self.sock.bind(self.address(port))
+                break
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    raise
+                self._remove_stale(self.address(port))
+        self.sock.listen()
+        self.addr:tuple[str, int] = (self.address(port), port)
+        self._pool = ConnectionPool(port, queue_size, retries, address=self.address)
+
+    def address(self, port:int) -> str:
+        return os.path.join(self.directory, f"{port}.sock")
+
+    @staticmethod
+    def _remove_stale(path:str):
+        '''
+        Remove o arquivo de um socket que ninguém mais escuta, deixado por um processo que terminou
+        sem fechar o transporte
+        '''
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        except OSError:
+            pass
+        finally:
+            probe.close()
+
+    def close(self):
+        super().close()
+        try:
+            os.unlink(self.addr[0])
+        except FileNotFoundError:
+            pass
+
+
+# Transportes que podem ser escolhidos pelo nome (ver launcher.Cluster)
+TRANSPORTS = {"tcp": TcpTransport, "unix": UnixTransport}
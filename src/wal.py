@@ -0,0 +1,164 @@
+from .codec import HEADER_SIZE, decode, encode, frame_size
+from .snapshot import fsync_dir
+from threading import Thread, Condition, Lock
+import logging
+import struct
+import time
+import zlib
+import os
+
+_CRC = struct.Struct(">I")
+
+log = logging.getLogger(__name__)
+
+
+class WriteAheadLog:
+    '''
+    Log append-only usado pelo acceptor para tornar promessas e aceites duráveis.
+
+    Cada registro é um frame do codec precedido do seu CRC32; na recuperação a leitura para no
+    primeiro registro incompleto ou corrompido (escrita interrompida por uma queda), e o arquivo é
+    truncado nesse ponto.
+
+    Políticas de sync:
+      - "always":   write + fsync a cada registro, antes de liberar a resposta
+      - "group":    uma thread grava e faz um único fsync para todos os registros que chegaram
+                    enquanto o fsync anterior rodava (group commit); as respostas só são liberadas
+                    depois do fsync
+      - "interval": as respostas são liberadas logo após o write e o fsync roda a cada `interval`
+                    segundos; uma queda pode perder os registros do último intervalo
+    '''
+    SYNC_POLICIES = ("always", "group", "interval")
+
+    def __init__(self, path:str, sync:str="group", interval:float=0.01):
+        if sync not in self.SYNC_POLICIES:
+            raise ValueError(f"Unknown sync policy {sync!r}, expected one of {self.SYNC_POLICIES}")
+        self.path     = path
+        self.sync     = sync
+        self.interval = interval
+
+        self._file = open(path, "ab")
+        self._io   = Lock()       # protege o arquivo, que pode ser trocado por rewrite()
+        self._cond = Condition()
+        self._pending:list[tuple[bytes|None, object]] = []  # (registro, callback) esperando o fsync
+        self._dirty  = False
+        self._thread = None
+        self._pid    = None
+
+    def replay(self):
+        '''
+        Lê os registros válidos do arquivo, na ordem em que foram gravados, como [tipo, *campos].
+        Deve ser chamado antes de qualquer append
+        '''
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos = 0
+        prefix = _CRC.size + HEADER_SIZE
+        while pos + prefix <= len(data):
+            (crc,) = _CRC.unpack_from(data, pos)
+            try:
+                size = frame_size(data[pos + _CRC.size:pos + prefix])
+            except ValueError:
+                break
+            end = pos + prefix + size
+            if end > len(data) or zlib.crc32(data[pos + _CRC.size:end]) != crc:
+                break
+            yield decode(memoryview(data)[pos + prefix:end])
+            pos = end
+        if pos < len(data):
+            log.warning("Truncating %s bytes of incomplete records from %s", len(data) - pos, self.path)
+            self._file.truncate(pos)
+
+    def append(self, record:tuple|None, callback=None):
+        '''
+        Grava um registro (tipo, *campos) e chama `callback` quando ele for durável segundo a
+        política de sync. Com record=None apenas ordena o callback após os registros anteriores
+        '''
+        frame = None
+        if record is not None:
+            frame = encode(*record)
+            frame = _CRC.pack(zlib.crc32(frame)) + frame
+
+        if self.sync == "always":
+            with self._io:
+                if frame is not None:
+                    self._file.write(frame)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            if callback is not None:
+                callback()
+            return
+
+        with self._cond:
+            self._ensure_thread()
+            if self.sync == "interval":
+                if frame is not None:
+                    with self._io:
+                        self._file.write(frame)
+                    self._dirty = True
+            else:
+                self._pending.append((frame, callback))
+                self._cond.notify()
+                return
+        if callback is not None:
+            callback()
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            # Iniciada sob demanda, no processo em que o acceptor está rodando
+            self._pid    = os.getpid()
+            self._thread = Thread(target=self._group_commit if self.sync == "group" else self._periodic_sync, daemon=True)
+            self._thread.start()
+
+    def _group_commit(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+            # Novos registros continuam chegando em self._pending enquanto este lote é sincronizado
+            frames = [frame for frame, _ in batch if frame is not None]
+            if frames:
+                with self._io:
+                    self._file.write(b''.join(frames))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            for _, callback in batch:
+                if callback is not None:
+                    callback()
+
+    def _periodic_sync(self):
+        while True:
+            time.sleep(self.interval)
+            with self._cond:
+                if not self._dirty:
+                    continue
+                self._dirty = False
+            with self._io:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def rewrite(self, records:list[tuple]):
+        '''
+        Substitui o conteúdo do log por `records`, que devem representar todo o estado atual
+        (compactação). Registros que ainda estejam na fila do group commit são gravados depois,
+        no arquivo novo, e são redundantes com o estado reescrito
+        '''
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for record in records:
+                frame = encode(*record)
+                f.write(_CRC.pack(zlib.crc32(frame)) + frame)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._io:
+            self._file.close()
+            os.replace(tmp, self.path)
+            fsync_dir(self.path)
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        with self._io:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
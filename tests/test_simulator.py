@@ -0,0 +1,123 @@
+'''
+Execuções completas do protocolo na rede simulada (src.simulator): cada caso monta um cluster,
+propõe valores e verifica que os learners concordam e aplicam cada valor exatamente uma vez,
+também com mensagens perdidas e fora de ordem, nós que caem e snapshots.
+
+Uso: python -m pytest tests
+'''
+import os
+
+import pytest
+
+from src import Acceptor, Bridge, Learner, Proposer, Simulator
+
+
+def cluster(sim:Simulator, directory=None, learners:int=2, snapshot_every:int=5):
+    '''
+    Bridge, 3 acceptors, `learners` learners e um proposer. Com `directory`, os acceptors gravam
+    um WAL e os learners, snapshots a cada `snapshot_every` slots
+    '''
+    bridge = Bridge(transport=sim.transport())
+    if directory is None:
+        acceptors = [Acceptor(bridge.port, transport=sim.transport()) for _ in range(3)]
+        nodes     = [Learner(bridge.port, transport=sim.transport()) for _ in range(learners)]
+    else:
+        acceptors = [Acceptor(bridge.port, wal_path=os.path.join(directory, f"a{i}.wal"), sync="always",
+                              transport=sim.transport()) for i in range(3)]
+        nodes     = [Learner(bridge.port, snapshot_path=os.path.join(directory, f"l{i}.snapshot"),
+                             snapshot_every=snapshot_every, catchup_timeout=0.5, transport=sim.transport())
+                     for i in range(learners)]
+    proposer = Proposer(bridge.port, transport=sim.transport())
+    return bridge, acceptors, nodes, proposer
+
+
+def contents(learner:Learner) -> list:
+    return (list(learner.snapshot) if learner.snapshot is not None else []) + learner.log
+
+
+def check(learners:list[Learner], values:list):
+    '''
+    Os learners aplicaram a mesma sequência, e cada valor proposto uma única vez
+    '''
+    logs = [contents(l) for l in learners]
+    assert all(log == logs[0] for log in logs)
+    assert sorted(logs[0]) == sorted(values)
+
+
+def run(sim:Simulator, learners:list[Learner], count:int, timeout:float=10.0):
+    assert sim.run_until(lambda: all(l.applied >= count for l in learners), timeout=timeout)
+
+
+@pytest.mark.parametrize("serialize", [True, False])
+def test_same_seed_same_execution(serialize):
+    executions = []
+    for _ in range(2):
+        sim = Simulator(7, drop=0.02, reorder=True, serialize=serialize)
+        _, acceptors, learners, proposer = cluster(sim)
+        values = [f"v{i}" for i in range(20)]
+        for value in values:
+            proposer.propose(value)
+        sim.start(*acceptors, *learners, proposer)
+        run(sim, learners, len(values))
+        executions.append((sim.time, sim.sent, learners[0].log))
+    assert executions[0] == executions[1]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_agreement(seed):
+    sim = Simulator(seed)
+    _, acceptors, learners, proposer = cluster(sim)
+    values = [f"v{i}" for i in range(20)]
+    for value in values:
+        proposer.propose(value)
+    sim.start(*acceptors, *learners, proposer)
+    run(sim, learners, len(values))
+    check(learners, values)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_agreement_with_drops_crashes_and_snapshots(seed, tmp_path):
+    # Mensagens perdidas e fora de ordem, um acceptor que cai e volta e learners com snapshots:
+    # os acceptors compactam o log e quem perde aceites só se recupera pelo catch-up
+    sim = Simulator(seed, drop=0.02, reorder=True)
+    _, acceptors, learners, proposer = cluster(sim, tmp_path, learners=3)
+    values = [f"v{i}" for i in range(30)]
+    for value in values:
+        proposer.propose(value)
+    sim.start(*acceptors, *learners, proposer)
+    victim = sim.random.choice(acceptors)._addr[1]
+    sim.schedule(sim.random.uniform(0, 0.01), sim.crash, victim)
+    sim.schedule(sim.random.uniform(0.01, 0.05), sim.recover, victim)
+    run(sim, learners, len(values))
+    check(learners, values)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_learner_catches_up_after_compaction(seed, tmp_path):
+    # Um learner parado desde o início volta depois que os acceptors já compactaram o log: só
+    # recebe os valores pelo catch-up, mesmo com um dos outros learners fora do ar
+    sim = Simulator(seed, drop=0.02, reorder=True)
+    _, acceptors, learners, proposer = cluster(sim, tmp_path, learners=3)
+    values = [f"v{i}" for i in range(30)]
+    for value in values:
+        proposer.propose(value)
+    sim.start(*acceptors, *learners, proposer)
+    late, other = learners[0]._addr[1], learners[1]._addr[1]
+    sim.crash(late)
+    run(sim, learners[1:], len(values))
+    sim.crash(other)
+    sim.recover(late)
+    run(sim, [learners[0]], len(values))
+    check(learners, values)
+
+
+def test_registration_burst_pushes_membership_once():
+    sim = Simulator(1)
+    bridge = Bridge(transport=sim.transport())
+    pushes = []
+    bridge.push_membership = lambda: pushes.append(bridge.epoch)
+    nodes = [Learner(bridge.port, transport=sim.transport()) for _ in range(50)]
+    sim.start(*nodes)
+    sim.run(1.0)
+    assert bridge.epoch == len(nodes)
+    assert len(pushes) < 5 and pushes[-1] == len(nodes)